@@ -0,0 +1,65 @@
+import statistics
+import time
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIRequestFactory
+from rest_framework_simplejwt.tokens import RefreshToken
+from accounts.views import CustomTokenObtainPairView
+
+class Command(BaseCommand):
+    help = 'Benchmark the login endpoint against the password-hash + token-creation floor'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=20)
+        parser.add_argument('--username', default='login_benchmark')
+        parser.add_argument('--ip', default='203.0.113.10', help='Client address for the login requests')
+        parser.add_argument('--budget-ms', type=float, default=15.0,
+                            help='Fail if the median overhead above the floor exceeds this')
+
+    def handle(self, *args, **options):
+        password = 'benchmark-password'
+        user, created = User.objects.get_or_create(username=options['username'])
+        if created or not user.check_password(password):
+            user.set_password(password)
+            user.save()
+
+        # Floor: what a login can't avoid (verify the password, mint the tokens)
+        floor = []
+        for _ in range(options['runs']):
+            start = time.perf_counter()
+            user.check_password(password)
+            refresh = RefreshToken.for_user(user)
+            str(refresh.access_token)
+            floor.append((time.perf_counter() - start) * 1000)
+
+        factory = APIRequestFactory()
+        view = CustomTokenObtainPairView.as_view()
+        timings, query_counts = [], []
+        for _ in range(options['runs']):
+            request = factory.post(
+                '/api/auth/login/', {'username': user.username, 'password': password},
+                format='json', REMOTE_ADDR=options['ip']
+            )
+            with CaptureQueriesContext(connection) as ctx:
+                start = time.perf_counter()
+                response = view(request)
+                response.render()
+                timings.append((time.perf_counter() - start) * 1000)
+            if response.status_code != 200:
+                raise CommandError(f'Login returned {response.status_code}: {response.content[:200]}')
+            query_counts.append(len(ctx.captured_queries))
+
+        floor_median = statistics.median(floor)
+        median = statistics.median(timings)
+        timings.sort()
+        p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+        overhead = median - floor_median
+        self.stdout.write(
+            f"Floor median {floor_median:.2f} ms; login median {median:.2f} ms, p95 {p95:.2f} ms, "
+            f"queries {statistics.mean(query_counts):.1f}; overhead {overhead:.2f} ms"
+        )
+        if overhead > options['budget_ms']:
+            raise CommandError(f"Overhead {overhead:.2f} ms exceeds the {options['budget_ms']} ms budget")
+        self.stdout.write(self.style.SUCCESS(f"Within the {options['budget_ms']} ms budget"))
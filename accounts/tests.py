@@ -1,7 +1,12 @@
+from unittest import mock
 from django.urls import reverse
 from rest_framework import status
 from rest_framework.test import APITestCase
 from django.contrib.auth.models import User
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from users.models import Profile
+from users.tasks import record_login
 
 class AccountTests(APITestCase):
     def test_registration(self):
@@ -67,3 +72,34 @@ class AccountTests(APITestCase):
         self.client.credentials()
         response = self.client.get(status_url)
         self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_login_defers_ip_enrichment(self):
+        user = User.objects.create_user(username='testuser', password='testpassword', email='test@example.com')
+        url = reverse('token_obtain_pair')
+        data = {'username': 'testuser', 'password': 'testpassword'}
+        with mock.patch('users.signals.async_task') as queue:
+            with self.captureOnCommitCallbacks(execute=True) as callbacks, CaptureQueriesContext(connection) as ctx:
+                response = self.client.post(url, data, format='json', REMOTE_ADDR='203.0.113.5')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse([q for q in ctx.captured_queries if 'users_profile' in q['sql'] or 'geo_ipasn' in q['sql']])
+        self.assertEqual(len(callbacks), 1)
+        queue.assert_called_once_with('users.tasks.record_login', user.id, '203.0.113.5')
+
+        # A repeat login from the same address doesn't queue another task
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.client.post(url, data, format='json', REMOTE_ADDR='203.0.113.5')
+        self.assertEqual(len(callbacks), 0)
+
+        record_login(user.id, '203.0.113.5')
+        self.assertEqual(Profile.objects.get(user=user).ip_address, '203.0.113.5')
+
+    def test_uncommitted_login_does_not_suppress_enrichment(self):
+        User.objects.create_user(username='testuser', password='testpassword', email='test@example.com')
+        url = reverse('token_obtain_pair')
+        data = {'username': 'testuser', 'password': 'testpassword'}
+        # The first login's commit callbacks never run, as if it rolled back
+        for _ in range(2):
+            with self.captureOnCommitCallbacks() as callbacks:
+                self.client.post(url, data, format='json', REMOTE_ADDR='203.0.113.9')
+            self.assertEqual(len(callbacks), 1)
+
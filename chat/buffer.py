@@ -0,0 +1,113 @@
+"""
+Write-behind persistence for chat messages.
+
+ChatConsumer broadcasts a message as soon as it arrives, tagged with a
+temporary ID, and hands it to this process's MessageBuffer. The buffer
+writes everything queued with one bulk_create every CHAT_FLUSH_INTERVAL_MS
+(or as soon as CHAT_FLUSH_MAX_MESSAGES are waiting), moves the rooms'
+last_message pointers (chat.inbox), updates the recipients' coalesced
+notifications (chat.notifications) and then sends each
+room a `chat_ack` event pairing temporary IDs with the saved Message IDs.
+
+Flushes run one at a time in arrival order, so messages from a room are
+stored in the order this process broadcast them.
+"""
+import asyncio
+import logging
+from dataclasses import dataclass
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import transaction
+from . import presence
+from .inbox import advance_rooms
+from .models import Message
+from .notifications import notify_room_messages
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class PendingMessage:
+    room_id: int
+    sender_id: int
+    sender_name: str
+    content: str
+    temp_id: str
+    recipient_ids: tuple  # participants to notify
+    id: int = None  # set once saved
+
+class MessageBuffer:
+    def __init__(self, interval=None, max_messages=None):
+        self.interval = (interval if interval is not None else getattr(settings, 'CHAT_FLUSH_INTERVAL_MS', 20)) / 1000
+        self.max_messages = max_messages or getattr(settings, 'CHAT_FLUSH_MAX_MESSAGES', 200)
+        self.pending = []
+        self.lock = asyncio.Lock()
+        self.timer = None
+
+    def add(self, pending):
+        self.pending.append(pending)
+        if len(self.pending) >= self.max_messages:
+            self.schedule(0)
+        elif self.timer is None:
+            self.schedule(self.interval)
+
+    def schedule(self, delay):
+        if self.timer is not None:
+            self.timer.cancel()
+        self.timer = asyncio.get_running_loop().call_later(delay, lambda: asyncio.ensure_future(self.flush()))
+
+    async def flush(self):
+        """Persist everything queued so far and acknowledge it to the rooms."""
+        async with self.lock:
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+            batch, self.pending = self.pending, []
+            if not batch:
+                return
+            connected = presence.connected_users({p.room_id for p in batch})
+            try:
+                await persist(batch, connected)
+            except Exception:
+                logger.exception(f"Failed to persist {len(batch)} chat messages")
+                await send_to_rooms(batch, 'chat_failed', lambda items: {
+                    'messages': [{'temp_id': p.temp_id, 'sender_id': p.sender_id} for p in items]
+                })
+                return
+            await send_to_rooms(batch, 'chat_ack', lambda items: {
+                'messages': [{'temp_id': p.temp_id, 'sender_id': p.sender_id, 'id': p.id} for p in items]
+            })
+
+@database_sync_to_async
+def persist(batch, connected):
+    """
+    Insert the batch in order, advance the rooms' last_message and update
+    the recipients' unread summaries (skipping users in `connected`). Sets
+    each PendingMessage's id.
+    """
+    with transaction.atomic():
+        messages = Message.objects.bulk_create([
+            Message(room_id=p.room_id, sender_id=p.sender_id, content=p.content) for p in batch
+        ])
+        for p, message in zip(batch, messages):
+            p.id = message.id
+        advance_rooms(messages)
+        notify_room_messages(batch, connected)
+
+async def send_to_rooms(batch, event_type, payload):
+    rooms = {}
+    for p in batch:
+        rooms.setdefault(p.room_id, []).append(p)
+    channel_layer = get_channel_layer()
+    for room_id, items in rooms.items():
+        await channel_layer.group_send(f'chat_{room_id}', {'type': event_type, **payload(items)})
+
+_buffers = {}
+
+def get_buffer():
+    """The buffer for the running event loop (one per Daphne process)."""
+    loop = asyncio.get_running_loop()
+    if loop not in _buffers:
+        _buffers.clear()  # drop buffers of loops that have gone away
+        _buffers[loop] = MessageBuffer()
+    return _buffers[loop]
@@ -1,23 +1,90 @@
-import json
+import asyncio
+import logging
+import time
+import uuid
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
-from .models import ChatRoom, Message
-from django.contrib.auth.models import User
+from django.conf import settings
+from . import presence, protocol
+from .buffer import PendingMessage, get_buffer
+from .models import ChatRoom
+
+logger = logging.getLogger(__name__)
 
 class ChatConsumer(AsyncWebsocketConsumer):
+    """
+    The room, its participants and the connecting user are loaded once in
+    connect() and kept for the life of the connection (refreshed when the
+    membership changes), so handling a message needs no lookups. Messages
+    are broadcast immediately and saved in batches by chat.buffer.
+
+    Only signed-in participants may connect; they are shown as online (chat.presence) while
+    connected. Clients that send {"type": "presence"} get the room's online
+    list and then presence and typing events; {"type": "typing"} frames are
+    debounced and capped per room (CHAT_ROOM_EVENT_RATE a second) because
+    they are cheap to drop. Online/offline events are never dropped, or a
+    client could go on showing someone online after they left.
+
+    The wire format is negotiated with the websocket subprotocol
+    (chat.protocol); every outgoing frame goes through send_payload().
+    """
+
     async def connect(self):
-        self.room_id = self.scope['url_route']['kwargs']['room_id']
+        try:
+            self.room_id = int(self.scope['url_route']['kwargs']['room_id'])
+        except ValueError:
+            await self.close()
+            return
+        self.user = self.scope.get('user')
+        if self.user is None or not self.user.is_authenticated:
+            await self.close(code=4001)
+            return
         self.room_group_name = f'chat_{self.room_id}'
 
+        self.participants = await self.load_participants()
+        if self.participants is None:
+            await self.close()
+            return
+        if self.user.id not in self.participants:
+            await self.close(code=4003)
+            return
+
         # Join room group
         await self.channel_layer.group_add(
             self.room_group_name,
             self.channel_name
         )
 
-        await self.accept()
+        self.codec = protocol.negotiate(self.scope.get('subprotocols'))
+        self.outbox = []
+        self.batch_timer = None
+        await self.accept(subprotocol=self.codec.subprotocol)
+        presence.joined(self.room_id, self.user.id)
+        self.present = True
+        self.presence_group_name = f'chat_{self.room_id}_presence'
+        self.presence_store = presence.get_store(self.channel_layer)
+        self.member = presence.member_key(self.user.id, self.channel_name)
+        self.subscribed = False
+        self.typing_sent_at = 0
+        await self.presence_store.touch(self.room_id, self.member)
+        self.presence_refresher = asyncio.ensure_future(self.keep_present())
+        await self.send_presence('online')
 
     async def disconnect(self, close_code):
+        if not hasattr(self, 'room_group_name'):
+            return  # rejected in connect()
+        if getattr(self, 'batch_timer', None) is not None:
+            self.batch_timer.cancel()
+        # Don't leave this connection's messages waiting for the next timer
+        await get_buffer().flush()
+        if getattr(self, 'present', False):
+            presence.left(self.room_id, self.user.id)
+            self.presence_refresher.cancel()
+            await self.presence_store.remove(self.room_id, self.member)
+            if self.subscribed:
+                await self.channel_layer.group_discard(self.presence_group_name, self.channel_name)
+            if self.user.id not in await self.presence_store.online(self.room_id):
+                await self.send_presence('offline')
         # Leave room group
         await self.channel_layer.group_discard(
             self.room_group_name,
@@ -25,27 +92,38 @@ class ChatConsumer(AsyncWebsocketConsumer):
         )
 
     # Receive message from WebSocket
-    async def receive(self, text_data):
-        print(f"WebSocket Received: {text_data}")
+    async def receive(self, text_data=None, bytes_data=None):
         try:
-            text_data_json = json.loads(text_data)
-            message = text_data_json['message']
-            sender_id = text_data_json.get('sender_id') # Or get from scope if authenticated
-        except json.JSONDecodeError as e:
-            print(f"JSON Decode Error: {e}")
-            return
-        except KeyError as e:
-            print(f"Key Error: {e}")
+            data = self.codec.decode(text_data, bytes_data)
+            kind = data.get('type', 'message')
+            if kind == 'presence':
+                await self.subscribe_presence()
+                return
+            if kind == 'typing':
+                await self.typing(bool(data.get('typing', True)))
+                return
+            message = data['message']
+            if not isinstance(message, str):
+                raise TypeError('message must be a string')
+        except (ValueError, AttributeError, KeyError, TypeError) as e:
+            logger.debug(f"Ignoring malformed chat payload in room {self.room_id}: {e}")
             return
 
-        # Save message to database
-        try:
-            username = await self.save_message(self.room_id, sender_id, message)
-        except Exception as e:
-            print(f"Error saving message: {e}")
-            return
+        # Any sender_id in the payload is ignored: messages are from the socket's user
+        sender_id = self.user.id
+        self.typing_sent_at = 0  # clients clear the sender's indicator on their message
+
+        # Broadcast now; the buffer persists it and acks the real ID shortly after
+        temp_id = str(data.get('temp_id') or uuid.uuid4().hex)
+        get_buffer().add(PendingMessage(
+            room_id=self.room_id,
+            sender_id=sender_id,
+            sender_name=self.participants[sender_id],
+            content=message,
+            temp_id=temp_id,
+            recipient_ids=tuple(pid for pid in self.participants if pid != sender_id),
+        ))
 
-        print(f"Broadcasting message from {username}: {message}")
         # Send message to room group
         await self.channel_layer.group_send(
             self.room_group_name,
@@ -53,43 +131,146 @@ class ChatConsumer(AsyncWebsocketConsumer):
                 'type': 'chat_message',
                 'message': message,
                 'sender_id': sender_id,
-                'username': username
+                'username': self.participants[sender_id],
+                'temp_id': temp_id
             }
         )
 
     # Receive message from room group
     async def chat_message(self, event):
-        print(f"Group Received: {event}")
         message = event['message']
         sender_id = event['sender_id']
         username = event.get('username', 'Unknown')
 
         # Send message to WebSocket
-        await self.send(text_data=json.dumps({
+        await self.send_payload({
             'message': message,
             'sender_id': sender_id,
-            'username': username
-        }))
+            'username': username,
+            'temp_id': event.get('temp_id')
+        })
 
-    @database_sync_to_async
-    def save_message(self, room_id, sender_id, message):
+    # Buffered messages were saved: [{temp_id, sender_id, id}, ...]
+    async def chat_ack(self, event):
+        await self.send_payload({'type': 'ack', 'messages': event['messages']})
+
+    async def chat_failed(self, event):
+        await self.send_payload({'type': 'failed', 'messages': event['messages']})
+
+    async def presence_event(self, event):
+        if event['user_id'] != self.user.id:
+            await self.send_payload({
+                'type': 'presence', 'user_id': event['user_id'], 'username': event['username'], 'status': event['status']
+            })
+
+    async def typing_event(self, event):
+        if event['user_id'] != self.user.id:
+            await self.send_payload({
+                'type': 'typing', 'user_id': event['user_id'], 'username': event['username'],
+                'typing': event['typing'], 'expires_in': event['expires_in']
+            })
+
+    async def subscribe_presence(self):
+        """Start sending presence/typing events to this client, after the current online list."""
+        if not self.subscribed:
+            await self.channel_layer.group_add(self.presence_group_name, self.channel_name)
+            self.subscribed = True
+        online = await self.presence_store.online(self.room_id)
+        await self.send_payload({'type': 'presence', 'online': [
+            {'user_id': user_id, 'username': self.participants[user_id]}
+            for user_id in sorted(online) if user_id in self.participants
+        ]})
+
+    async def typing(self, active):
+        # Repeated "typing" frames are forwarded at most once per debounce
+        # interval; clients drop the indicator after `expires_in` seconds
+        debounce = getattr(settings, 'CHAT_TYPING_DEBOUNCE', 3)
+        now = time.monotonic()
+        if active:
+            if self.typing_sent_at and now - self.typing_sent_at < debounce:
+                return
+            self.typing_sent_at = now
+        else:
+            if not self.typing_sent_at:
+                return
+            self.typing_sent_at = 0
+        await self.send_room_event({
+            'type': 'typing_event', 'user_id': self.user.id, 'username': self.participants.get(self.user.id),
+            'typing': active, 'expires_in': debounce * 2,
+        }, capped=True)
+
+    async def send_presence(self, status):
+        await self.send_room_event({
+            'type': 'presence_event', 'user_id': self.user.id, 'username': self.participants.get(self.user.id),
+            'status': status,
+        })
+
+    async def send_room_event(self, event, capped=False):
+        """Send a presence/typing event to the room's subscribers; `capped` events are dropped over the rate cap."""
         try:
-            from users.models import Notification
-            room = ChatRoom.objects.get(id=room_id)
-            sender = User.objects.get(id=sender_id)
-            Message.objects.create(room=room, sender=sender, content=message)
-            
-            # Notify others
-            for participant in room.participants.all():
-                if participant.id != sender.id:
-                    Notification.objects.create(
-                        user=participant,
-                        type='message',
-                        title=f'New message from {sender.username}',
-                        body=message[:50] + ('...' if len(message) > 50 else ''),
-                        data={'chat_room_id': room.id}
-                    )
-            return sender.username
+            if not capped or await self.presence_store.allow(self.room_id):
+                await self.channel_layer.group_send(self.presence_group_name, event)
         except Exception as e:
-            print(f"Database Error in save_message: {e}")
-            raise e
+            logger.warning(f"Could not send {event['type']} to chat room {self.room_id}: {e}")
+
+    async def keep_present(self):
+        """Refresh this connection's presence entry until it closes."""
+        while True:
+            await asyncio.sleep(presence.presence_ttl() / 2)
+            try:
+                await self.presence_store.touch(self.room_id, self.member)
+            except Exception as e:
+                logger.warning(f"Could not refresh presence in chat room {self.room_id}: {e}")
+
+    async def send_payload(self, payload):
+        """
+        Send one event in the negotiated format. On binary connections an
+        event is sent at once, but events following it within
+        CHAT_BATCH_WINDOW_MS are collected and sent together as one batch
+        frame, so bursts cost one frame instead of one per message.
+        """
+        if not self.codec.batches:
+            await self.send(**self.codec.encode(payload))
+            return
+        if self.batch_timer is None:
+            await self.send(**self.codec.encode(payload))
+            self.open_batch_window()
+            return
+        self.outbox.append(payload)
+        if len(self.outbox) >= getattr(settings, 'CHAT_BATCH_MAX_MESSAGES', 50):
+            await self.flush_outbox()
+
+    def open_batch_window(self):
+        window = getattr(settings, 'CHAT_BATCH_WINDOW_MS', 10) / 1000
+        self.batch_timer = asyncio.get_running_loop().call_later(window, self.batch_window_closed)
+
+    def batch_window_closed(self):
+        self.batch_timer = None
+        if self.outbox:
+            # Keep batching while the burst lasts
+            self.open_batch_window()
+            asyncio.ensure_future(self.flush_outbox())
+
+    async def flush_outbox(self):
+        items, self.outbox = self.outbox, []
+        if not items:
+            return
+        payload = items[0] if len(items) == 1 else {'type': 'batch', 'items': items}
+        await self.send(**self.codec.encode(payload))
+
+    # Participants were added or removed (see chat.signals)
+    async def membership_changed(self, event):
+        self.participants = await self.load_participants()
+        if self.participants is None or self.user.id not in self.participants:
+            await self.close(code=4003)
+
+    @database_sync_to_async
+    def load_participants(self):
+        """{user_id: username} for the room, or None if it doesn't exist."""
+        participants = dict(
+            ChatRoom.participants.through.objects.filter(chatroom_id=self.room_id)
+            .values_list('user_id', 'user__username')
+        )
+        if not participants and not ChatRoom.objects.filter(id=self.room_id).exists():
+            return None
+        return participants
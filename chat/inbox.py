@@ -0,0 +1,67 @@
+"""
+Room list ordered by activity, with per-user unread counts.
+
+Each RoomMembership holds a read cursor (the id of the last message the
+user has read) and each ChatRoom points at its latest message. Unread
+counts are then a range count over the (room, id) index of the messages
+after the cursor, so the whole inbox is one query.
+"""
+from django.db import connection
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+from users import notifications
+from .models import ChatRoom, Message, RoomMembership
+from .notifications import room_group_key
+
+ADVANCE_SQL = """
+    UPDATE {table} AS r SET last_message_id = v.id, last_activity_at = v.ts
+    FROM (VALUES {values}) AS v(room_id, id, ts)
+    WHERE r.id = v.room_id AND (r.last_message_id IS NULL OR r.last_message_id < v.id)
+"""
+
+def advance_rooms(messages):
+    """Point each room at the newest of the saved `messages` (never backwards)."""
+    latest = {}
+    for message in messages:
+        if message.room_id not in latest or latest[message.room_id].id < message.id:
+            latest[message.room_id] = message
+    if not latest:
+        return
+    values = ', '.join(['(%s::bigint, %s::bigint, %s::timestamptz)'] * len(latest))
+    params = [v for m in latest.values() for v in (m.room_id, m.id, m.timestamp)]
+    sql = ADVANCE_SQL.format(table=connection.ops.quote_name(ChatRoom._meta.db_table), values=values)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+
+def inbox(user):
+    """`user`'s rooms, most recently active first, annotated with their read cursor and unread_count."""
+    unread = (
+        Message.objects.filter(room=OuterRef('pk'), id__gt=OuterRef('last_read_message_id'))
+        .exclude(sender=user)
+        .order_by()
+        .values('room')
+        .annotate(n=Count('*'))
+        .values('n')
+    )
+    return (
+        ChatRoom.objects.filter(memberships__user=user)
+        .annotate(last_read_message_id=F('memberships__last_read_message_id'))
+        .annotate(unread_count=Coalesce(Subquery(unread), 0))
+        .select_related('creator', 'last_message__sender')
+        .prefetch_related('participants')
+        .order_by('-last_activity_at', '-id')
+    )
+
+def mark_read(user, room, message_id=None):
+    """
+    Move `user`'s cursor in `room` up to `message_id` (default: the latest
+    message). The cursor never moves backwards. Returns the new cursor.
+    """
+    latest = room.last_message_id or 0
+    target = latest if message_id is None else min(message_id, latest)
+    memberships = RoomMembership.objects.filter(chatroom=room, user=user)
+    memberships.update(last_read_message_id=Greatest('last_read_message_id', Value(target)))
+    cursor = memberships.values_list('last_read_message_id', flat=True).first() or 0
+    if cursor >= latest:
+        notifications.mark_read(user.id, group_key=room_group_key(room.id))
+    return cursor
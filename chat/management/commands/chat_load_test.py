@@ -0,0 +1,280 @@
+import asyncio
+import gc
+import json
+import random
+import resource
+import statistics
+import time
+from datetime import datetime
+from channels.db import database_sync_to_async
+from channels.layers import channel_layers
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+from rest_framework_simplejwt.tokens import AccessToken
+from chat import protocol
+from chat.buffer import get_buffer
+from chat.models import ChatRoom, RoomMembership
+from chat.notifications import room_group_key
+from users.models import Notification
+
+
+class QueryCounter:
+    """execute_wrapper that counts statements by their first keyword."""
+
+    def __init__(self):
+        self.counts = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        kind = sql.lstrip().split(None, 1)[0].upper() if sql.strip() else '?'
+        self.counts[kind] = self.counts.get(kind, 0) + 1
+        return execute(sql, params, many, context)
+
+    def total(self):
+        return sum(self.counts.values())
+
+    def reset(self):
+        counts, self.counts = self.counts, {}
+        return counts
+
+
+# Consumers run their queries in channels' database thread, whose connection
+# is not the one handle() uses, so the counter is installed from that thread.
+@database_sync_to_async
+def install_counter(counter):
+    connection.execute_wrappers.append(counter)
+
+
+@database_sync_to_async
+def remove_counter(counter):
+    connection.execute_wrappers.remove(counter)
+
+
+def rss_bytes():
+    """Current resident set size (Linux), falling back to the peak from getrusage."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * resource.getpagesize()
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def percentiles(values):
+    if not values:
+        return {}
+    values = sorted(values)
+    pick = lambda p: values[min(len(values) - 1, int(p / 100 * len(values)))]
+    return {
+        'p50_ms': round(pick(50) * 1000, 2),
+        'p90_ms': round(pick(90) * 1000, 2),
+        'p99_ms': round(pick(99) * 1000, 2),
+        'max_ms': round(values[-1] * 1000, 2),
+        'mean_ms': round(statistics.fmean(values) * 1000, 2),
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        'Load-test ChatConsumer through the ASGI application in this process: connect rate, '
+        'fan-out latency percentiles, DB queries per message and memory per connection'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=1000, help='Websocket clients in total')
+        parser.add_argument('--rooms', type=int, default=10, help='Rooms the clients are spread across')
+        parser.add_argument('--messages', type=int, default=500, help='Messages sent in total')
+        parser.add_argument('--rate', type=float, default=200, help='Messages/sec to send (0 = as fast as possible)')
+        parser.add_argument('--connect-concurrency', type=int, default=50, help='Handshakes in flight at once')
+        parser.add_argument('--layer', choices=['memory', 'redis'], default='memory')
+        parser.add_argument(
+            '--protocol', choices=['json', 'msgpack', 'msgpack+deflate'], default='json',
+            help='Websocket subprotocol the clients negotiate (chat.protocol)'
+        )
+        parser.add_argument('--redis', default='localhost:6379', help='host:port for --layer redis')
+        parser.add_argument('--timeout', type=float, default=30, help='Seconds to wait for deliveries')
+        parser.add_argument('--prefix', default='chatload')
+        parser.add_argument('--output', help='Also write the report to this JSON file')
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        if options['clients'] < 1 or options['rooms'] < 1 or options['rooms'] > options['clients']:
+            raise CommandError('Need at least one client per room')
+        rng = random.Random(options['seed'])
+
+        users = self.create_users(options['prefix'], options['clients'])
+        rooms = self.create_rooms(options['prefix'], users, options['rooms'])
+        tokens = {user.id: str(AccessToken.for_user(user)) for user in users}
+        try:
+            with override_settings(CHANNEL_LAYERS={'default': self.layer_config(options)}):
+                channel_layers.backends.clear()
+                from klikdat_django.asgi import application
+                report = asyncio.run(self.run(application, rooms, tokens, options, rng))
+            channel_layers.backends.clear()
+        finally:
+            Notification.objects.filter(group_key__in=[room_group_key(r.id) for r, _ in rooms]).delete()
+            ChatRoom.objects.filter(id__in=[r.id for r, _ in rooms]).delete()
+
+        report = {
+            'generated_at': datetime.now().isoformat(),
+            'layer': options['layer'],
+            'protocol': options['protocol'],
+            'clients': len(users),
+            'rooms': len(rooms),
+            **report,
+        }
+        self.print_report(report)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(f"Report written to {options['output']}")
+
+    def layer_config(self, options):
+        if options['layer'] == 'memory':
+            # Large capacity so slow receivers queue instead of dropping
+            return {'BACKEND': 'channels.layers.InMemoryChannelLayer', 'CONFIG': {'capacity': 100000}}
+        host, _, port = options['redis'].partition(':')
+        return {
+            'BACKEND': 'channels_redis.core.RedisChannelLayer',
+            'CONFIG': {'hosts': [(host, int(port or 6379))], 'capacity': 100000},
+        }
+
+    def create_users(self, prefix, count):
+        names = [f'{prefix}_{i}' for i in range(count)]
+        existing = set(User.objects.filter(username__in=names).values_list('username', flat=True))
+        User.objects.bulk_create([User(username=name, password='!') for name in names if name not in existing])
+        by_name = {u.username: u for u in User.objects.filter(username__in=names)}
+        return [by_name[name] for name in names]
+
+    def create_rooms(self, prefix, users, count):
+        """[(room, members)] with users dealt round-robin across `count` rooms."""
+        rooms = ChatRoom.objects.bulk_create([
+            ChatRoom(name=f'{prefix} room {i}', creator=users[i]) for i in range(count)
+        ])
+        members = [users[i::count] for i in range(count)]
+        RoomMembership.objects.bulk_create([
+            RoomMembership(chatroom=room, user=user) for room, room_users in zip(rooms, members) for user in room_users
+        ])
+        return list(zip(rooms, members))
+
+    async def run(self, application, rooms, tokens, options, rng):
+        counter = QueryCounter()
+        await install_counter(counter)
+        try:
+            clients, connect = await self.connect_all(application, rooms, tokens, options)
+            connect['queries_per_connection'] = round(counter.total() / max(len(clients), 1), 2)
+            counter.reset()
+            fanout = await self.send_messages(clients, rooms, options, rng)
+            fanout['queries'] = counter.reset()
+            fanout['queries_per_message'] = round(sum(fanout['queries'].values()) / max(options['messages'], 1), 3)
+            for communicator, _ in clients:
+                await communicator.disconnect()
+        finally:
+            await remove_counter(counter)
+        return {'connect': connect, 'fanout': fanout}
+
+    async def connect_all(self, application, rooms, tokens, options):
+        gc.collect()
+        rss_before = rss_bytes()
+        semaphore = asyncio.Semaphore(options['connect_concurrency'])
+        subprotocols = None if options['protocol'] == 'json' else [f"klikdat.chat.{options['protocol']}"]
+        timings = []
+
+        async def connect(room, user):
+            async with semaphore:
+                communicator = WebsocketCommunicator(
+                    application, f'/ws/chat/{room.id}/?token={tokens[user.id]}', subprotocols=subprotocols
+                )
+                start = time.perf_counter()
+                connected, _ = await communicator.connect(timeout=options['timeout'])
+                timings.append(time.perf_counter() - start)
+                if not connected:
+                    raise CommandError(f'Could not connect {user.username} to room {room.id}')
+                return communicator, room.id
+
+        start = time.perf_counter()
+        clients = await asyncio.gather(*[connect(room, user) for room, members in rooms for user in members])
+        elapsed = time.perf_counter() - start
+        gc.collect()
+        rss_after = rss_bytes()
+        return list(clients), {
+            'seconds': round(elapsed, 3),
+            'connections_per_sec': round(len(clients) / elapsed, 1),
+            'handshake': percentiles(timings),
+            # Includes the in-process test clients, so an upper bound for the server side
+            'rss_per_connection_kb': round((rss_after - rss_before) / len(clients) / 1024, 1),
+            'rss_mb': round(rss_after / 1024 / 1024, 1),
+        }
+
+    async def send_messages(self, clients, rooms, options, rng):
+        total = options['messages']
+        by_room = {}
+        for communicator, room_id in clients:
+            by_room.setdefault(room_id, []).append(communicator)
+        senders = [rng.choice(clients) for _ in range(total)]
+        expected = {}  # room_id -> messages each of its clients will receive
+        for _, room_id in senders:
+            expected[room_id] = expected.get(room_id, 0) + 1
+
+        latencies = []
+        codec = protocol.negotiate([f"klikdat.chat.{options['protocol']}"])
+        received_bytes = [0]
+
+        async def drain(communicator, count):
+            received = 0
+            while received < count:
+                output = await communicator.receive_output(timeout=options['timeout'])
+                if output['type'] != 'websocket.send':
+                    raise CommandError(f'Unexpected {output}')
+                frame = output.get('bytes') or output.get('text').encode()
+                received_bytes[0] += len(frame)
+                event = codec.decode(text_data=output.get('text'), bytes_data=output.get('bytes'))
+                for item in event.get('items', [event]):
+                    if 'type' in item:  # acks, presence
+                        continue
+                    sent_at = float(item['message'].split(' ', 1)[0])
+                    latencies.append(time.perf_counter() - sent_at)
+                    received += 1
+
+        receivers = [
+            asyncio.ensure_future(drain(communicator, expected.get(room_id, 0)))
+            for communicator, room_id in clients
+        ]
+        interval = 1 / options['rate'] if options['rate'] > 0 else 0
+        start = time.perf_counter()
+        for n, (communicator, _) in enumerate(senders):
+            if interval:
+                delay = start + n * interval - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            await communicator.send_to(text_data=json.dumps({'message': f'{time.perf_counter()!r} load test {n}'}))
+        send_elapsed = time.perf_counter() - start
+        await asyncio.gather(*receivers)
+        elapsed = time.perf_counter() - start
+        # Let the write-behind buffer finish so its queries are counted
+        await get_buffer().flush()
+
+        return {
+            'messages': total,
+            'deliveries': len(latencies),
+            'sent_per_sec': round(total / send_elapsed, 1) if send_elapsed else None,
+            'delivered_per_sec': round(len(latencies) / elapsed, 1),
+            'bytes_per_delivery': round(received_bytes[0] / max(len(latencies), 1), 1),
+            'latency': percentiles(latencies),
+        }
+
+    def print_report(self, report):
+        connect, fanout = report['connect'], report['fanout']
+        self.stdout.write(
+            f"{report['clients']} clients in {report['rooms']} rooms ({report['layer']} layer, {report['protocol']})\n"
+            f"  connect: {connect['connections_per_sec']} conn/s, handshake p50 {connect['handshake'].get('p50_ms')} ms "
+            f"p99 {connect['handshake'].get('p99_ms')} ms, {connect['queries_per_connection']} queries/conn, "
+            f"~{connect['rss_per_connection_kb']} KB/conn\n"
+            f"  fan-out: {fanout['messages']} messages -> {fanout['deliveries']} deliveries, "
+            f"{fanout['delivered_per_sec']} deliveries/s, {fanout['bytes_per_delivery']} bytes/delivery\n"
+            f"  latency: p50 {fanout['latency'].get('p50_ms')} ms, p90 {fanout['latency'].get('p90_ms')} ms, "
+            f"p99 {fanout['latency'].get('p99_ms')} ms, max {fanout['latency'].get('max_ms')} ms\n"
+            f"  db: {fanout['queries_per_message']} queries/message {fanout['queries']}"
+        )
+        self.stdout.write(self.style.SUCCESS('Done'))
@@ -0,0 +1,27 @@
+from urllib.parse import parse_qs
+from channels.db import database_sync_to_async
+from channels.middleware import BaseMiddleware
+from django.contrib.auth.models import User
+
+@database_sync_to_async
+def get_user_for_token(raw_token):
+    from rest_framework_simplejwt.exceptions import TokenError
+    from rest_framework_simplejwt.tokens import AccessToken
+    try:
+        token = AccessToken(raw_token)
+        return User.objects.filter(id=token['user_id'], is_active=True).first()
+    except (TokenError, KeyError):
+        return None
+
+class JWTAuthMiddleware(BaseMiddleware):
+    """
+    Authenticates websocket connections from a `?token=<access token>` query
+    parameter, for clients that use JWT instead of the session cookie.
+    """
+    async def __call__(self, scope, receive, send):
+        token = parse_qs(scope.get('query_string', b'').decode()).get('token')
+        if token:
+            user = await get_user_for_token(token[0])
+            if user is not None:
+                scope = {**scope, 'user': user}
+        return await super().__call__(scope, receive, send)
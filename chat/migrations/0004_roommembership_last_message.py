@@ -0,0 +1,79 @@
+# Generated by Django 5.2.7 on 2026-10-19 12:00
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def backfill(apps, schema_editor):
+    """Point rooms at their latest message and start existing members as caught up."""
+    ChatRoom = apps.get_model('chat', 'ChatRoom')
+    Message = apps.get_model('chat', 'Message')
+    RoomMembership = apps.get_model('chat', 'RoomMembership')
+    latest = Message.objects.filter(room=models.OuterRef('pk')).order_by('-id')
+    ChatRoom.objects.update(
+        last_message_id=models.Subquery(latest.values('id')[:1]),
+        last_activity_at=Coalesce(
+            models.Subquery(latest.values('timestamp')[:1]), models.F('created_at')
+        ),
+    )
+    RoomMembership.objects.filter(chatroom__last_message__isnull=False).update(
+        last_read_message_id=models.Subquery(
+            ChatRoom.objects.filter(pk=models.OuterRef('chatroom_id')).values('last_message_id')[:1]
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0003_chatroom_module'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        # The auto-created participants table becomes RoomMembership as is
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.CreateModel(
+                    name='RoomMembership',
+                    fields=[
+                        ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                        ('chatroom', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='memberships', to='chat.chatroom')),
+                        ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chat_memberships', to=settings.AUTH_USER_MODEL)),
+                    ],
+                    options={
+                        'db_table': 'chat_chatroom_participants',
+                        'unique_together': {('chatroom', 'user')},
+                    },
+                ),
+                migrations.AlterField(
+                    model_name='chatroom',
+                    name='participants',
+                    field=models.ManyToManyField(related_name='chat_rooms', through='chat.RoomMembership', to=settings.AUTH_USER_MODEL),
+                ),
+            ],
+        ),
+        migrations.AddField(
+            model_name='roommembership',
+            name='last_read_message_id',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='chatroom',
+            name='last_message',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='chat.message'),
+        ),
+        migrations.AddField(
+            model_name='chatroom',
+            name='last_activity_at',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['room', 'id'], name='chat_message_room_id_idx'),
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.7 on 2026-10-19 12:31
+
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY can't run in a transaction; it doesn't block
+    # writes to chat_message while the index builds
+    atomic = False
+
+    dependencies = [
+        ('chat', '0005_message_search_vector'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='message',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='chat_message_search_gin'),
+        ),
+    ]
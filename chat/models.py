@@ -1,10 +1,16 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector, SearchVectorField
+from django.utils import timezone
+
+# Messages are in many languages, so words are matched as typed (no stemming)
+SEARCH_CONFIG = 'simple'
 
 class ChatRoom(models.Model):
     name = models.CharField(max_length=255, blank=True, null=True)
     creator = models.ForeignKey(User, on_delete=models.CASCADE, related_name='created_rooms', null=True)
-    participants = models.ManyToManyField(User, related_name='chat_rooms')
+    participants = models.ManyToManyField(User, related_name='chat_rooms', through='RoomMembership')
     
     MODULE_CHOICES = [
         ('matchmake', 'Matchmake'),
@@ -16,6 +22,10 @@ class ChatRoom(models.Model):
     
     created_at = models.DateTimeField(auto_now_add=True)
 
+    # Denormalized by chat.inbox.advance_rooms whenever messages are saved
+    last_message = models.ForeignKey('Message', on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    last_activity_at = models.DateTimeField(default=timezone.now, db_index=True)
+
     def __str__(self):
         if self.name:
             return f"{self.name} ({self.id})"
@@ -26,9 +36,34 @@ class Message(models.Model):
     sender = models.ForeignKey(User, on_delete=models.CASCADE, related_name='sent_messages')
     content = models.TextField()
     timestamp = models.DateTimeField(auto_now_add=True)
+    # Maintained by Postgres on insert/update; see chat.search
+    search_vector = models.GeneratedField(
+        expression=SearchVector('content', config=SEARCH_CONFIG),
+        output_field=SearchVectorField(),
+        db_persist=True,
+    )
 
     class Meta:
         ordering = ['timestamp']
+        indexes = [
+            # Unread counts and history are ranges of ids within one room
+            models.Index(fields=['room', 'id'], name='chat_message_room_id_idx'),
+            GinIndex(fields=['search_vector'], name='chat_message_search_gin'),
+        ]
 
     def __str__(self):
         return f"{self.sender.username}: {self.content[:20]}"
+
+class RoomMembership(models.Model):
+    """A participant of a room (the participants through table) and their read cursor."""
+    chatroom = models.ForeignKey(ChatRoom, on_delete=models.CASCADE, related_name='memberships')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='chat_memberships')
+    # Messages with a greater id are unread; 0 means nothing read yet
+    last_read_message_id = models.BigIntegerField(default=0)
+
+    class Meta:
+        db_table = 'chat_chatroom_participants'
+        unique_together = ('chatroom', 'user')
+
+    def __str__(self):
+        return f"{self.user_id} in {self.chatroom_id}"
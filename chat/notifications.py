@@ -0,0 +1,40 @@
+"""
+Coalesced chat notifications: each recipient has at most one unread
+summary Notification per room (group_key 'chat_room:<id>'). New messages
+bump its count and replace the preview; once read, the next message
+starts the count again from the same row (users.notifications.upsert_grouped).
+"""
+from users import notifications
+
+def room_group_key(room_id):
+    return f'chat_room:{room_id}'
+
+def preview(content):
+    return content[:50] + ('...' if len(content) > 50 else '')
+
+def notify_room_messages(messages, connected=None):
+    """
+    Upsert one summary per (recipient, room) for a batch of saved chat
+    messages (chat.buffer.PendingMessage, oldest first), skipping users in
+    `connected` ({room_id: user ids currently in the room}).
+    """
+    connected = connected or {}
+    summaries = {}  # (user_id, room_id) -> [count, latest message]
+    for message in messages:
+        skip = connected.get(message.room_id, ())
+        for user_id in message.recipient_ids:
+            if user_id in skip:
+                continue
+            summary = summaries.setdefault((user_id, message.room_id), [0, None])
+            summary[0] += 1
+            summary[1] = message
+
+    notifications.upsert_grouped([
+        {
+            'user_id': user_id, 'type': 'message', 'title': f'New message from {latest.sender_name}',
+            'body': preview(latest.content), 'data': {'chat_room_id': room_id, 'message_id': latest.id},
+            'group_key': room_group_key(room_id), 'count': count,
+        }
+        for (user_id, room_id), (count, latest) in summaries.items()
+    ])
+    return len(summaries)
@@ -0,0 +1,74 @@
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class MessageHistoryPagination(BasePagination):
+    """
+    Message-id cursors for a room's history.
+
+    With no cursor the newest `limit` messages are returned; `before=<id>`
+    returns the `limit` messages just older than that message and
+    `after=<id>` the ones just newer. Each page is a range scan of the
+    (room, id) index from the cursor, so its cost doesn't depend on how
+    far back it is, and no COUNT(*) is issued. Results are always oldest
+    first.
+    """
+    page_size = 50
+    max_page_size = 200
+    page_size_query_param = 'limit'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        before = self._cursor(request, 'before')
+        after = self._cursor(request, 'after')
+        if before is not None and after is not None:
+            raise ValidationError({'detail': 'Use either before or after, not both.'})
+
+        if after is not None:
+            rows = list(queryset.filter(id__gt=after).order_by('id')[:self.page_size + 1])
+            self.has_newer = len(rows) > self.page_size
+            self.page = rows[:self.page_size]
+            self.has_older = True
+        else:
+            if before is not None:
+                queryset = queryset.filter(id__lt=before)
+            rows = list(queryset.order_by('-id')[:self.page_size + 1])
+            self.has_older = len(rows) > self.page_size
+            self.page = rows[:self.page_size][::-1]
+            self.has_newer = before is not None
+        return self.page
+
+    def get_paginated_response(self, data):
+        return Response({
+            'previous': self.get_link('before', self.page[0].id if self.page else None, self.has_older),
+            'next': self.get_link('after', self.page[-1].id if self.page else None, self.has_newer),
+            'results': data,
+        })
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if size <= 0:
+            return self.page_size
+        return min(size, self.max_page_size)
+
+    def get_link(self, param, message_id, has_more):
+        if not has_more or message_id is None:
+            return None
+        url = self.request.build_absolute_uri()
+        url = remove_query_param(url, 'after' if param == 'before' else 'before')
+        return replace_query_param(url, param, message_id)
+
+    def _cursor(self, request, param):
+        value = request.query_params.get(param)
+        if value in (None, ''):
+            return None
+        try:
+            return int(value)
+        except ValueError:
+            raise ValidationError({param: 'Must be a message id.'})
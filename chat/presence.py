@@ -0,0 +1,140 @@
+"""
+Who is in which chat room.
+
+`joined`/`left`/`connected_users` count the ChatConsumers open in this
+process; chat.buffer uses them to skip notifications for people who are
+watching the room. A user connected through another Daphne process isn't
+seen there and still gets the (coalesced) notification, which is the safe
+side to err on.
+
+The presence stores below back the online lists and typing indicators
+that ChatConsumer sends to clients.
+"""
+import time
+from collections import Counter, defaultdict
+from django.conf import settings
+
+_connected = defaultdict(Counter)  # room_id -> Counter({user_id: open connections})
+
+def joined(room_id, user_id):
+    _connected[room_id][user_id] += 1
+
+def left(room_id, user_id):
+    users = _connected.get(room_id)
+    if not users:
+        return
+    users[user_id] -= 1
+    if users[user_id] <= 0:
+        del users[user_id]
+    if not users:
+        del _connected[room_id]
+
+def connected_users(room_ids):
+    """{room_id: set of user ids connected to it} for the given rooms."""
+    return {room_id: set(_connected[room_id]) for room_id in room_ids if room_id in _connected}
+
+
+# Room presence and typing indicators (ChatConsumer)
+#
+# Unlike the counter above, this is shared by every Daphne process: each
+# open connection of a signed-in participant holds an entry that expires
+# after CHAT_PRESENCE_TTL seconds unless the connection refreshes it, so a
+# process that dies without running disconnect() is forgotten on its own.
+# Entries live in Redis next to the channel layer (or in memory with the
+# in-memory layer); nothing is written to the database.
+
+def presence_ttl():
+    return getattr(settings, 'CHAT_PRESENCE_TTL', 60)
+
+def member_key(user_id, channel_name):
+    return f'{user_id}:{channel_name}'
+
+def member_user(member):
+    return int(member.split(':', 1)[0])
+
+
+class MemoryPresenceStore:
+    """Presence for the in-memory channel layer (tests, single process)."""
+
+    def __init__(self):
+        self.rooms = defaultdict(dict)  # room_id -> {member: expires_at}
+        self.windows = {}  # room_id -> (second, events sent)
+
+    async def touch(self, room_id, member):
+        self.rooms[room_id][member] = time.time() + presence_ttl()
+
+    async def remove(self, room_id, member):
+        self.rooms[room_id].pop(member, None)
+
+    async def online(self, room_id):
+        now = time.time()
+        members = self.rooms[room_id]
+        for member in [m for m, expires in members.items() if expires <= now]:
+            del members[member]
+        return {member_user(m) for m in members}
+
+    async def allow(self, room_id):
+        second = int(time.time())
+        window, sent = self.windows.get(room_id, (second, 0))
+        if window != second:
+            sent = 0
+        self.windows[room_id] = (second, sent + 1)
+        return sent < getattr(settings, 'CHAT_ROOM_EVENT_RATE', 20)
+
+
+class RedisPresenceStore:
+    """
+    Presence in the channel layer's Redis: a sorted set per room of
+    member -> expiry time, and a per-second counter per room for the rate cap.
+    """
+
+    def __init__(self, layer):
+        self.layer = layer
+
+    def key(self, *parts):
+        return ':'.join([f'{self.layer.prefix}:presence', *map(str, parts)])
+
+    def connection(self, key):
+        return self.layer.connection(self.layer.consistent_hash(key))
+
+    async def touch(self, room_id, member):
+        key = self.key(room_id)
+        ttl = presence_ttl()
+        pipe = self.connection(key).pipeline(transaction=False)
+        pipe.zadd(key, {member: time.time() + ttl})
+        pipe.expire(key, ttl)
+        await pipe.execute()
+
+    async def remove(self, room_id, member):
+        key = self.key(room_id)
+        await self.connection(key).zrem(key, member)
+
+    async def online(self, room_id):
+        key = self.key(room_id)
+        pipe = self.connection(key).pipeline(transaction=False)
+        pipe.zremrangebyscore(key, '-inf', time.time())
+        pipe.zrange(key, 0, -1)
+        _, members = await pipe.execute()
+        return {member_user(m.decode() if isinstance(m, bytes) else m) for m in members}
+
+    async def allow(self, room_id):
+        key = self.key('rate', room_id, int(time.time()))
+        pipe = self.connection(key).pipeline(transaction=False)
+        pipe.incr(key)
+        pipe.expire(key, 2)
+        sent, _ = await pipe.execute()
+        return sent <= getattr(settings, 'CHAT_ROOM_EVENT_RATE', 20)
+
+
+_stores = {}
+
+def get_store(layer):
+    """The presence store for a channel layer: Redis-backed for channels_redis, else in memory."""
+    store = _stores.get(id(layer))
+    if store is None or store[0] is not layer:
+        if hasattr(layer, 'consistent_hash') and hasattr(layer, 'connection'):
+            store = (layer, RedisPresenceStore(layer))
+        else:
+            store = (layer, MemoryPresenceStore())
+        _stores[id(layer)] = store
+    return store[1]
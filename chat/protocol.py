@@ -0,0 +1,127 @@
+"""
+Wire formats for ChatConsumer, chosen with the websocket subprotocol.
+
+- no subprotocol or 'klikdat.chat.json': JSON text frames (the default)
+- 'klikdat.chat.msgpack': MessagePack binary frames with the field names
+  and event types replaced by the small integers below
+- 'klikdat.chat.msgpack+deflate': the same, each frame prefixed with one
+  byte, 1 if the rest is raw-deflated (frames over CHAT_DEFLATE_MIN_BYTES)
+  and 0 if not; client frames that inflate past CHAT_MAX_FRAME_BYTES are
+  rejected
+
+As in JSON, frames without a type are chat messages. Binary connections
+may also receive {type: 'batch', items: [...]} frames carrying several
+events that arrived within CHAT_BATCH_WINDOW_MS of each other (see
+ChatConsumer.send_payload).
+"""
+import json
+import zlib
+from django.conf import settings
+
+JSON = 'klikdat.chat.json'
+MSGPACK = 'klikdat.chat.msgpack'
+MSGPACK_DEFLATE = 'klikdat.chat.msgpack+deflate'
+
+# Append only: clients depend on these numbers
+FIELDS = {
+    'type': 0, 'message': 1, 'sender_id': 2, 'username': 3, 'temp_id': 4, 'id': 5,
+    'messages': 6, 'user_id': 7, 'status': 8, 'typing': 9, 'expires_in': 10, 'online': 11,
+    'items': 12,
+}
+TYPES = {'message': 0, 'ack': 1, 'failed': 2, 'presence': 3, 'typing': 4, 'batch': 5}
+
+FIELD_NAMES = {number: name for name, number in FIELDS.items()}
+TYPE_NAMES = {number: name for name, number in TYPES.items()}
+
+
+def compact(payload):
+    """Replace known field names and event types with their numbers, recursively."""
+    out = {}
+    for key, value in payload.items():
+        if key == 'type':
+            value = TYPES.get(value, value)
+        elif isinstance(value, list):
+            value = [compact(v) if isinstance(v, dict) else v for v in value]
+        out[FIELDS.get(key, key)] = value
+    return out
+
+
+def expand(payload):
+    out = {}
+    for key, value in payload.items():
+        key = FIELD_NAMES.get(key, key)
+        if key == 'type':
+            value = TYPE_NAMES.get(value, value)
+        elif isinstance(value, list):
+            value = [expand(v) if isinstance(v, dict) else v for v in value]
+        out[key] = value
+    return out
+
+
+class JsonCodec:
+    batches = False
+
+    def __init__(self, subprotocol=None):
+        self.subprotocol = subprotocol
+
+    def encode(self, payload):
+        return {'text_data': json.dumps(payload)}
+
+    def decode(self, text_data=None, bytes_data=None):
+        return json.loads(text_data if text_data is not None else bytes_data)
+
+
+def inflate(data):
+    """Raw-inflate a client frame, refusing to produce more than CHAT_MAX_FRAME_BYTES."""
+    decompressor = zlib.decompressobj(wbits=-15)
+    inflated = decompressor.decompress(data, getattr(settings, 'CHAT_MAX_FRAME_BYTES', 65536))
+    if decompressor.unconsumed_tail:
+        raise ValueError('frame too large')
+    return inflated
+
+
+class MsgpackCodec:
+    batches = True
+
+    def __init__(self, subprotocol, deflate=False):
+        self.subprotocol = subprotocol
+        self.deflate = deflate
+
+    def encode(self, payload):
+        import msgpack
+        data = msgpack.packb(compact(payload), use_bin_type=True)
+        if self.deflate:
+            if len(data) >= getattr(settings, 'CHAT_DEFLATE_MIN_BYTES', 512):
+                compressor = zlib.compressobj(wbits=-15)
+                data = b'\x01' + compressor.compress(data) + compressor.flush()
+            else:
+                data = b'\x00' + data
+        return {'bytes_data': data}
+
+    def decode(self, text_data=None, bytes_data=None):
+        import msgpack
+        if bytes_data is None:
+            raise ValueError('expected a binary frame')
+        try:
+            if self.deflate:
+                flag, bytes_data = bytes_data[:1], bytes_data[1:]
+                if flag == b'\x01':
+                    bytes_data = inflate(bytes_data)
+            payload = msgpack.unpackb(bytes_data, raw=False, strict_map_key=False)
+        except Exception as e:
+            raise ValueError(f'undecodable frame: {e}') from e
+        if not isinstance(payload, dict):
+            raise ValueError('expected a map')
+        return expand(payload)
+
+
+def negotiate(offered):
+    """The codec for the first subprotocol the client offered that we speak (JSON if none)."""
+    for subprotocol in offered or ():
+        if subprotocol == MSGPACK:
+            return MsgpackCodec(MSGPACK)
+        if subprotocol == MSGPACK_DEFLATE:
+            return MsgpackCodec(MSGPACK_DEFLATE, deflate=True)
+        if subprotocol == JSON:
+            return JsonCodec(JSON)
+    return JsonCodec()
@@ -0,0 +1,46 @@
+"""
+Full-text search over the messages of the rooms a user belongs to.
+
+Message.search_vector is a generated tsvector column with a GIN index, so
+a search is an index lookup on the query terms intersected with the
+user's rooms; results are ranked with ts_rank and highlighted with
+ts_headline (computed only for the rows of the returned page).
+"""
+from django.contrib.postgres.search import SearchHeadline, SearchQuery, SearchRank
+from django.db.models import F, FloatField
+from django.db.models.functions import Cast
+from django.utils.html import escape
+from .models import SEARCH_CONFIG, Message, RoomMembership
+
+MIN_QUERY_LENGTH = 2
+
+# ts_headline markers, swapped for <mark> tags once the text is escaped
+START_SEL, STOP_SEL = '\x02', '\x03'
+
+def search_messages(user, text, room_id=None):
+    """
+    Messages matching `text` (web search syntax: words, "phrases", -not, or)
+    in `user`'s rooms, best match first, annotated with rank and headline.
+    """
+    query = SearchQuery(text, search_type='websearch', config=SEARCH_CONFIG)
+    rooms = RoomMembership.objects.filter(user=user)
+    if room_id is not None:
+        rooms = rooms.filter(chatroom_id=room_id)
+    return (
+        Message.objects.filter(search_vector=query, room_id__in=rooms.values('chatroom_id'))
+        .annotate(
+            # ts_rank is float4; as float8 the rank survives the keyset
+            # cursor's JSON round trip and compares equal to itself
+            rank=Cast(SearchRank(F('search_vector'), query), FloatField()),
+            headline=SearchHeadline(
+                'content', query, config=SEARCH_CONFIG,
+                start_sel=START_SEL, stop_sel=STOP_SEL, max_fragments=2,
+            ),
+        )
+        .select_related('sender')
+        .order_by('-rank', '-id')
+    )
+
+def highlight(headline):
+    """HTML-escape a headline and wrap the matched words in <mark>."""
+    return escape(headline).replace(START_SEL, '<mark>').replace(STOP_SEL, '</mark>')
@@ -1,6 +1,7 @@
 from rest_framework import serializers
 from django.contrib.auth.models import User
 from .models import ChatRoom, Message
+from .search import highlight
 
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
@@ -15,12 +16,36 @@ class MessageSerializer(serializers.ModelSerializer):
         model = Message
         fields = ['id', 'room', 'sender', 'sender_id', 'content', 'timestamp']
 
+class MessageSearchResultSerializer(MessageSerializer):
+    rank = serializers.FloatField(read_only=True)
+    highlight = serializers.SerializerMethodField()
+
+    class Meta(MessageSerializer.Meta):
+        fields = MessageSerializer.Meta.fields + ['rank', 'highlight']
+
+    def get_highlight(self, obj):
+        return highlight(obj.headline)
+
 class ChatRoomSerializer(serializers.ModelSerializer):
     participants = UserSerializer(many=True, read_only=True)
     participant_ids = serializers.PrimaryKeyRelatedField(queryset=User.objects.all(), source='participants', write_only=True, many=True)
 
     creator = UserSerializer(read_only=True)
+    last_message = MessageSerializer(read_only=True)
+    # Annotated by chat.inbox.inbox()
+    last_read_message_id = serializers.SerializerMethodField()
+    unread_count = serializers.SerializerMethodField()
 
     class Meta:
         model = ChatRoom
-        fields = ['id', 'name', 'creator', 'participants', 'participant_ids', 'created_at']
+        fields = [
+            'id', 'name', 'creator', 'participants', 'participant_ids', 'created_at',
+            'last_message', 'last_activity_at', 'last_read_message_id', 'unread_count',
+        ]
+        read_only_fields = ['last_activity_at']
+
+    def get_last_read_message_id(self, obj):
+        return getattr(obj, 'last_read_message_id', None)
+
+    def get_unread_count(self, obj):
+        return getattr(obj, 'unread_count', 0)
@@ -0,0 +1,47 @@
+import logging
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from .inbox import advance_rooms
+from .models import ChatRoom, Message
+
+logger = logging.getLogger(__name__)
+
+def notify_membership_changed(room_ids):
+    """Tell connected ChatConsumers of these rooms to reload their participants."""
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+    for room_id in room_ids:
+        try:
+            async_to_sync(channel_layer.group_send)(f'chat_{room_id}', {'type': 'membership_changed'})
+        except Exception as e:
+            logger.warning(f"Could not notify chat room {room_id} of a membership change: {e}")
+
+@receiver(m2m_changed, sender=ChatRoom.participants.through)
+def participants_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse and action == 'pre_clear':
+        # The user's rooms are gone by post_clear, so remember them now
+        instance._cleared_chat_room_ids = list(instance.chat_rooms.values_list('id', flat=True))
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if reverse:
+        # user.chat_rooms.add(...): pk_set holds room ids (None on clear)
+        room_ids = list(pk_set) if pk_set else instance.__dict__.pop('_cleared_chat_room_ids', [])
+    else:
+        room_ids = [instance.pk]
+    transaction.on_commit(lambda: notify_membership_changed(room_ids))
+
+@receiver(post_delete, sender=ChatRoom)
+def room_deleted(sender, instance, **kwargs):
+    room_id = instance.pk
+    transaction.on_commit(lambda: notify_membership_changed([room_id]))
+
+# Messages saved one at a time (REST API, admin); chat.buffer handles its own bulk inserts
+@receiver(post_save, sender=Message)
+def message_saved(sender, instance, created, **kwargs):
+    if created:
+        advance_rooms([instance])
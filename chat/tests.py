@@ -1,7 +1,8 @@
 from django.contrib.auth.models import User
 from rest_framework.test import APITestCase
 from rest_framework import status
-from .models import ChatRoom
+from users.models import Notification
+from .models import ChatRoom, Message, RoomMembership
 
 class UserListTest(APITestCase):
     def setUp(self):
@@ -80,3 +81,46 @@ class ChatRoomCRUDTest(APITestCase):
         # Should only see room1
         self.assertEqual(len(response.data['results']), 1)
         self.assertEqual(response.data['results'][0]['id'], room1.id)
+
+class InboxTest(APITestCase):
+    def setUp(self):
+        self.user1 = User.objects.create_user(username='user1', password='password')
+        self.user2 = User.objects.create_user(username='user2', password='password')
+        self.quiet = ChatRoom.objects.create(name='Quiet')
+        self.quiet.participants.add(self.user1, self.user2)
+        self.busy = ChatRoom.objects.create(name='Busy')
+        self.busy.participants.add(self.user1, self.user2)
+        self.client.force_authenticate(user=self.user1)
+
+    def test_rooms_sorted_by_activity_with_unread_counts(self):
+        Message.objects.create(room=self.quiet, sender=self.user2, content='old')
+        Message.objects.create(room=self.busy, sender=self.user1, content='mine')
+        Message.objects.create(room=self.busy, sender=self.user2, content='one')
+        latest = Message.objects.create(room=self.busy, sender=self.user2, content='two')
+
+        with self.assertNumQueries(3):  # page count, rooms, participants
+            response = self.client.get('/api/chat/rooms/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        rooms = response.data['results']
+        self.assertEqual([r['id'] for r in rooms], [self.busy.id, self.quiet.id])
+        self.assertEqual([r['unread_count'] for r in rooms], [2, 1])
+        self.assertEqual(rooms[0]['last_message']['id'], latest.id)
+
+    def test_mark_read(self):
+        first = Message.objects.create(room=self.busy, sender=self.user2, content='one')
+        Message.objects.create(room=self.busy, sender=self.user2, content='two')
+        Notification.objects.create(user=self.user1, type='message', title='t', group_key=f'chat_room:{self.busy.id}')
+
+        response = self.client.post(f'/api/chat/rooms/{self.busy.id}/read/', {'message_id': first.id})
+        self.assertEqual(response.data['last_read_message_id'], first.id)
+        self.assertEqual(self.client.get(f'/api/chat/rooms/{self.busy.id}/').data['unread_count'], 1)
+        self.assertFalse(Notification.objects.get(user=self.user1).is_read)
+
+        self.client.post(f'/api/chat/rooms/{self.busy.id}/read/')
+        self.assertEqual(self.client.get(f'/api/chat/rooms/{self.busy.id}/').data['unread_count'], 0)
+        self.assertTrue(Notification.objects.get(user=self.user1).is_read)
+
+        # The cursor never moves backwards
+        self.client.post(f'/api/chat/rooms/{self.busy.id}/read/', {'message_id': first.id})
+        membership = RoomMembership.objects.get(chatroom=self.busy, user=self.user1)
+        self.assertEqual(membership.last_read_message_id, self.busy.messages.latest('id').id)
@@ -0,0 +1,241 @@
+import json
+from unittest import mock
+from asgiref.sync import async_to_sync
+from channels.db import database_sync_to_async
+from channels.layers import channel_layers
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth.models import AnonymousUser, User
+from django.db import connection
+from django.test import TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from users.models import Notification
+from . import protocol
+from .models import ChatRoom, Message
+from .routing import websocket_urlpatterns
+
+def communicator_for(user, room_id, subprotocols=None):
+    application = URLRouter(websocket_urlpatterns)
+    return WebsocketCommunicator(
+        lambda scope, receive, send: application({**scope, 'user': user}, receive, send),
+        f'/ws/chat/{room_id}/',
+        subprotocols=subprotocols
+    )
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class ChatConsumerTest(TransactionTestCase):
+    def setUp(self):
+        channel_layers.backends.clear()
+        self.user1 = User.objects.create_user(username='user1', password='password')
+        self.user2 = User.objects.create_user(username='user2', password='password')
+        self.outsider = User.objects.create_user(username='outsider', password='password')
+        self.room = ChatRoom.objects.create(name='Room', creator=self.user1)
+        self.room.participants.add(self.user1, self.user2)
+
+    def tearDown(self):
+        channel_layers.backends.clear()
+
+    def test_message_is_broadcast_then_saved_and_acked(self):
+        async def scenario():
+            sender = communicator_for(self.user1, self.room.id)
+            receiver = communicator_for(self.user2, self.room.id)
+            self.assertTrue((await sender.connect())[0])
+            self.assertTrue((await receiver.connect())[0])
+
+            with CaptureQueriesContext(connection) as ctx:
+                # A spoofed sender_id is ignored for authenticated connections
+                await sender.send_to(text_data=json.dumps({'message': 'hi', 'sender_id': self.user2.id, 'temp_id': 't1'}))
+                event = json.loads(await receiver.receive_from())
+                ack = json.loads(await receiver.receive_from(timeout=5))
+            await sender.disconnect()
+            await receiver.disconnect()
+            return event, ack, ctx.captured_queries
+
+        event, ack, queries = async_to_sync(scenario)()
+        self.assertEqual(event, {'message': 'hi', 'sender_id': self.user1.id, 'username': 'user1', 'temp_id': 't1'})
+        self.assertFalse([q for q in queries if q['sql'].startswith('SELECT')])
+        message = Message.objects.get()
+        self.assertEqual(message.sender, self.user1)
+        self.assertEqual(ack, {'type': 'ack', 'messages': [{'temp_id': 't1', 'sender_id': self.user1.id, 'id': message.id}]})
+
+    def test_buffer_keeps_order_within_a_batch(self):
+        async def scenario():
+            sender = communicator_for(self.user1, self.room.id)
+            await sender.connect()
+            for n in range(5):
+                await sender.send_to(text_data=json.dumps({'message': f'm{n}'}))
+            await sender.disconnect()
+
+        async_to_sync(scenario)()
+        self.assertEqual(list(Message.objects.order_by('id').values_list('content', flat=True)), [f'm{n}' for n in range(5)])
+
+    def test_non_participant_is_rejected(self):
+        async def scenario():
+            communicator = communicator_for(self.outsider, self.room.id)
+            connected, _ = await communicator.connect()
+            return connected
+
+        self.assertFalse(async_to_sync(scenario)())
+
+    def test_anonymous_socket_is_rejected(self):
+        async def scenario():
+            communicator = communicator_for(AnonymousUser(), self.room.id)
+            return await communicator.connect()
+
+        self.assertEqual(async_to_sync(scenario)(), (False, 4001))
+
+    def test_removed_participant_is_disconnected(self):
+        async def scenario():
+            communicator = communicator_for(self.user2, self.room.id)
+            await communicator.connect()
+            await database_sync_to_async(self.room.participants.remove)(self.user2)
+            return await communicator.receive_output(timeout=5)
+
+        output = async_to_sync(scenario)()
+        self.assertEqual(output['type'], 'websocket.close')
+
+    def test_clearing_a_users_rooms_disconnects_them(self):
+        async def scenario():
+            communicator = communicator_for(self.user2, self.room.id)
+            await communicator.connect()
+            await database_sync_to_async(self.user2.chat_rooms.clear)()
+            return await communicator.receive_output(timeout=5)
+
+        output = async_to_sync(scenario)()
+        self.assertEqual(output['type'], 'websocket.close')
+
+    def send_messages(self, *contents):
+        async def scenario():
+            sender = communicator_for(self.user1, self.room.id)
+            await sender.connect()
+            for content in contents:
+                await sender.send_to(text_data=json.dumps({'message': content}))
+            await sender.disconnect()
+        async_to_sync(scenario)()
+
+    def test_notifications_are_coalesced_per_room(self):
+        self.send_messages('one', 'two', 'three')
+        notification = Notification.objects.get(user=self.user2)
+        self.assertEqual(notification.count, 3)
+        self.assertEqual(notification.body, 'three')
+        self.assertFalse(Notification.objects.filter(user=self.user1).exists())
+
+        Notification.objects.filter(pk=notification.pk).update(is_read=True)
+        self.send_messages('four')
+        notification.refresh_from_db()
+        self.assertEqual((notification.count, notification.is_read, notification.body), (1, False, 'four'))
+
+    def test_connected_users_are_not_notified(self):
+        async def scenario():
+            receiver = communicator_for(self.user2, self.room.id)
+            await receiver.connect()
+            sender = communicator_for(self.user1, self.room.id)
+            await sender.connect()
+            await sender.send_to(text_data=json.dumps({'message': 'seen'}))
+            await receiver.receive_from()
+            await sender.disconnect()
+            await receiver.disconnect()
+
+        async_to_sync(scenario)()
+        self.assertEqual(Message.objects.count(), 1)
+        self.assertFalse(Notification.objects.exists())
+
+    def test_presence_and_debounced_typing(self):
+        async def scenario():
+            watcher = communicator_for(self.user2, self.room.id)
+            await watcher.connect()
+            await watcher.send_to(text_data=json.dumps({'type': 'presence'}))
+            online = json.loads(await watcher.receive_from())
+
+            typist = communicator_for(self.user1, self.room.id)
+            await typist.connect()
+            joined = json.loads(await watcher.receive_from())
+            for _ in range(3):
+                await typist.send_to(text_data=json.dumps({'type': 'typing'}))
+            await typist.send_to(text_data=json.dumps({'type': 'typing', 'typing': False}))
+            typing = [json.loads(await watcher.receive_from()) for _ in range(2)]
+
+            await typist.disconnect()
+            left = json.loads(await watcher.receive_from())
+            nothing_else = await watcher.receive_nothing()
+            await watcher.disconnect()
+            return online, joined, typing, left, nothing_else
+
+        online, joined, typing, left, nothing_else = async_to_sync(scenario)()
+        self.assertEqual(online, {'type': 'presence', 'online': [{'user_id': self.user2.id, 'username': 'user2'}]})
+        self.assertEqual((joined['user_id'], joined['status']), (self.user1.id, 'online'))
+        self.assertEqual([t['typing'] for t in typing], [True, False])
+        self.assertEqual((left['user_id'], left['status']), (self.user1.id, 'offline'))
+        self.assertTrue(nothing_else)
+        self.assertFalse(Message.objects.exists())
+
+    @override_settings(CHAT_ROOM_EVENT_RATE=1)
+    @mock.patch('chat.presence.time.time', return_value=1_000_000.0)  # one rate window
+    def test_room_event_rate_cap(self, _time):
+        async def scenario():
+            watcher = communicator_for(self.user2, self.room.id)
+            await watcher.connect()
+            await watcher.send_to(text_data=json.dumps({'type': 'presence'}))
+            await watcher.receive_from()
+            typist = communicator_for(self.user1, self.room.id)
+            await typist.connect()
+            joined = json.loads(await watcher.receive_from())
+            await typist.send_to(text_data=json.dumps({'type': 'typing'}))
+            typing = json.loads(await watcher.receive_from())  # this second's only typing event
+            await typist.send_to(text_data=json.dumps({'type': 'typing', 'typing': False}))
+            dropped = await watcher.receive_nothing()
+            await typist.disconnect()
+            left = json.loads(await watcher.receive_from())
+            await watcher.disconnect()
+            return joined, typing, dropped, left
+
+        joined, typing, dropped, left = async_to_sync(scenario)()
+        # Online/offline are not rate limited
+        self.assertEqual((joined['user_id'], joined['status']), (self.user1.id, 'online'))
+        self.assertTrue(typing['typing'])
+        self.assertTrue(dropped)
+        self.assertEqual((left['user_id'], left['status']), (self.user1.id, 'offline'))
+
+    @override_settings(CHAT_BATCH_WINDOW_MS=200)
+    def test_msgpack_subprotocol_batches_bursts(self):
+        codec = protocol.MsgpackCodec(protocol.MSGPACK_DEFLATE, deflate=True)
+
+        async def scenario():
+            receiver = communicator_for(self.user2, self.room.id, subprotocols=[protocol.MSGPACK_DEFLATE])
+            connected, subprotocol = await receiver.connect()
+            sender = communicator_for(self.user1, self.room.id)
+            await sender.connect()
+            for n in range(4):
+                await sender.send_to(text_data=json.dumps({'message': f'burst {n}' * 100, 'temp_id': f't{n}'}))
+            frames = []
+            while True:
+                output = await receiver.receive_output(timeout=5)
+                frames.append(codec.decode(bytes_data=output['bytes']))
+                if any(item.get('type') == 'ack' for item in frames[-1].get('items', [frames[-1]])):
+                    break
+            await sender.disconnect()
+            await receiver.disconnect()
+            return subprotocol, frames
+
+        subprotocol, frames = async_to_sync(scenario)()
+        self.assertEqual(subprotocol, protocol.MSGPACK_DEFLATE)
+        # The first message goes out alone, the rest of the burst is batched
+        self.assertEqual(frames[0], {'message': 'burst 0' * 100, 'sender_id': self.user1.id, 'username': 'user1', 'temp_id': 't0'})
+        events = [item for frame in frames[1:] for item in frame.get('items', [frame])]
+        self.assertEqual([e['temp_id'] for e in events if 'message' in e], ['t1', 't2', 't3'])
+        self.assertTrue(any(frame.get('type') == 'batch' for frame in frames[1:]))
+
+    @override_settings(CHAT_MAX_FRAME_BYTES=1024)
+    def test_deflated_frame_size_limit(self):
+        codec = protocol.MsgpackCodec(protocol.MSGPACK_DEFLATE, deflate=True)
+        small = codec.encode({'message': 'hi ' * 200})['bytes_data']
+        self.assertEqual(codec.decode(bytes_data=small), {'message': 'hi ' * 200})
+        bomb = codec.encode({'message': 'x' * 100000})['bytes_data']
+        self.assertLess(len(bomb), 1024)
+        with self.assertRaises(ValueError):
+            codec.decode(bytes_data=bomb)
+
+    def test_compact_field_ids_round_trip(self):
+        payload = {'type': 'ack', 'messages': [{'temp_id': 't1', 'sender_id': 1, 'id': 2}]}
+        self.assertEqual(protocol.compact(payload), {0: 1, 6: [{4: 't1', 2: 1, 5: 2}]})
+        self.assertEqual(protocol.expand(protocol.compact(payload)), payload)
@@ -36,3 +36,96 @@ class MessageFilteringTest(APITestCase):
         response = self.client.get('/api/chat/messages/')
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(len(response.data['results']), 2)
+
+class MessageHistoryTest(APITestCase):
+    def setUp(self):
+        self.user1 = User.objects.create_user(username='user1', password='password')
+        self.user2 = User.objects.create_user(username='user2', password='password')
+        self.client.force_authenticate(user=self.user1)
+
+        self.room = ChatRoom.objects.create(name='Room', creator=self.user1)
+        self.room.participants.add(self.user1, self.user2)
+        self.messages = [
+            Message.objects.create(room=self.room, sender=self.user2, content=f'm{n}') for n in range(7)
+        ]
+        self.url = f'/api/chat/messages/history/?room_id={self.room.id}&limit=3'
+
+    def contents(self, response):
+        return [m['content'] for m in response.data['results']]
+
+    def test_scroll_back_and_forward(self):
+        with self.assertNumQueries(2):  # membership check + page
+            response = self.client.get(self.url)
+        self.assertEqual(self.contents(response), ['m4', 'm5', 'm6'])
+        self.assertIsNone(response.data['next'])
+
+        response = self.client.get(response.data['previous'])
+        self.assertEqual(self.contents(response), ['m1', 'm2', 'm3'])
+
+        older = self.client.get(response.data['previous'])
+        self.assertEqual(self.contents(older), ['m0'])
+        self.assertIsNone(older.data['previous'])
+
+        newer = self.client.get(response.data['next'])
+        self.assertEqual(self.contents(newer), ['m4', 'm5', 'm6'])
+        self.assertIsNone(newer.data['next'])
+
+    def test_non_member_gets_404(self):
+        other = ChatRoom.objects.create(name='Other', creator=self.user2)
+        other.participants.add(self.user2)
+        response = self.client.get(f'/api/chat/messages/history/?room_id={other.id}')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_invalid_cursor(self):
+        response = self.client.get(self.url + '&before=abc')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+class MessageSearchTest(APITestCase):
+    def setUp(self):
+        self.user1 = User.objects.create_user(username='user1', password='password')
+        self.user2 = User.objects.create_user(username='user2', password='password')
+        self.client.force_authenticate(user=self.user1)
+
+        self.room = ChatRoom.objects.create(name='Room', creator=self.user1)
+        self.room.participants.add(self.user1, self.user2)
+        self.other = ChatRoom.objects.create(name='Other', creator=self.user2)
+        self.other.participants.add(self.user2)
+
+        self.best = Message.objects.create(room=self.room, sender=self.user2, content='pizza pizza pizza tonight')
+        self.weaker = Message.objects.create(room=self.room, sender=self.user1, content='<b>pizza</b> or pasta?')
+        Message.objects.create(room=self.room, sender=self.user2, content='see you tomorrow')
+        Message.objects.create(room=self.other, sender=self.user2, content='pizza elsewhere')
+
+    def test_ranked_results_from_own_rooms(self):
+        response = self.client.get('/api/chat/messages/search/?q=pizza')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([m['id'] for m in response.data['results']], [self.best.id, self.weaker.id])
+
+        highlight = response.data['results'][1]['highlight']
+        self.assertIn('<mark>pizza</mark>', highlight)
+        self.assertNotIn('<b>', highlight)
+
+    def test_cursor_pagination(self):
+        first = self.client.get('/api/chat/messages/search/?q=pizza&page_size=1')
+        self.assertEqual([m['id'] for m in first.data['results']], [self.best.id])
+        second = self.client.get(first.data['next'])
+        self.assertEqual([m['id'] for m in second.data['results']], [self.weaker.id])
+        self.assertIsNone(second.data['next'])
+
+    def test_cursor_pagination_with_equal_ranks(self):
+        tied = [
+            Message.objects.create(room=self.room, sender=self.user2, content='risotto for dinner')
+            for _ in range(3)
+        ]
+        seen = []
+        url = '/api/chat/messages/search/?q=risotto&page_size=1'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            seen += [m['id'] for m in response.data['results']]
+            url = response.data['next']
+        self.assertEqual(seen, sorted((m.id for m in tied), reverse=True))
+
+    def test_query_too_short(self):
+        response = self.client.get('/api/chat/messages/search/?q=p')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
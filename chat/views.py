@@ -1,7 +1,13 @@
-from rest_framework import viewsets, permissions
+from rest_framework import viewsets, permissions, status
+from rest_framework.decorators import action
+from rest_framework.response import Response
 from django.contrib.auth.models import User
-from .models import ChatRoom, Message
-from .serializers import ChatRoomSerializer, MessageSerializer, UserSerializer
+from matchmake.pagination import KeysetPagination
+from .inbox import inbox, mark_read
+from .models import ChatRoom, Message, RoomMembership
+from .pagination import MessageHistoryPagination
+from .search import MIN_QUERY_LENGTH, search_messages
+from .serializers import ChatRoomSerializer, MessageSearchResultSerializer, MessageSerializer, UserSerializer
 
 class IsCreatorOrReadOnly(permissions.BasePermission):
     def has_object_permission(self, request, view, obj):
@@ -15,23 +21,73 @@ class ChatRoomViewSet(viewsets.ModelViewSet):
     permission_classes = [permissions.IsAuthenticated, IsCreatorOrReadOnly]
 
     def get_queryset(self):
-        return self.queryset.filter(participants=self.request.user).order_by('-created_at')
+        # The inbox: most recent activity first, with unread counts
+        return inbox(self.request.user)
 
     def perform_create(self, serializer):
         room = serializer.save(creator=self.request.user)
         room.participants.add(self.request.user)
 
+    @action(detail=True, methods=['post'], permission_classes=[permissions.IsAuthenticated])
+    def read(self, request, pk=None):
+        """Mark the room read up to `message_id` (default: its latest message)."""
+        room = self.get_object()
+        message_id = request.data.get('message_id')
+        if message_id is not None:
+            try:
+                message_id = int(message_id)
+            except (TypeError, ValueError):
+                return Response({'message_id': 'Must be an integer.'}, status=status.HTTP_400_BAD_REQUEST)
+        cursor = mark_read(request.user, room, message_id)
+        return Response({'last_read_message_id': cursor})
+
 class MessageViewSet(viewsets.ModelViewSet):
     queryset = Message.objects.all()
     serializer_class = MessageSerializer
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
-        queryset = self.queryset.filter(room__participants=self.request.user)
         room_id = self.request.query_params.get('room_id')
         if room_id is not None:
-            queryset = queryset.filter(room__id=room_id)
-        return queryset
+            # One lookup on the membership's (room, user) unique index
+            # instead of joining every message to the participants
+            if not self.is_member(room_id):
+                return self.queryset.none()
+            return self.queryset.filter(room_id=room_id)
+        rooms = RoomMembership.objects.filter(user=self.request.user).values('chatroom_id')
+        return self.queryset.filter(room_id__in=rooms)
+
+    def is_member(self, room_id):
+        try:
+            room_id = int(room_id)
+        except (TypeError, ValueError):
+            return False
+        return RoomMembership.objects.filter(chatroom_id=room_id, user=self.request.user).exists()
+
+    @action(detail=False, methods=['get'], pagination_class=MessageHistoryPagination)
+    def history(self, request):
+        """A room's messages by id cursor: ?room_id=<id>[&before=<id>|&after=<id>][&limit=<n>]."""
+        room_id = request.query_params.get('room_id')
+        if room_id is None:
+            return Response({'room_id': 'This parameter is required.'}, status=status.HTTP_400_BAD_REQUEST)
+        if not self.is_member(room_id):
+            return Response(status=status.HTTP_404_NOT_FOUND)
+        queryset = Message.objects.filter(room_id=room_id).select_related('sender')
+        page = self.paginate_queryset(queryset)
+        return self.get_paginated_response(self.get_serializer(page, many=True).data)
+
+    @action(detail=False, methods=['get'], pagination_class=KeysetPagination,
+            serializer_class=MessageSearchResultSerializer)
+    def search(self, request):
+        """Ranked full-text search of the user's rooms: ?q=<text>[&room_id=<id>]."""
+        text = request.query_params.get('q', '').strip()
+        if len(text) < MIN_QUERY_LENGTH:
+            return Response({'q': f'Enter at least {MIN_QUERY_LENGTH} characters.'}, status=status.HTTP_400_BAD_REQUEST)
+        room_id = request.query_params.get('room_id')
+        if room_id is not None and not self.is_member(room_id):
+            return Response(status=status.HTTP_404_NOT_FOUND)
+        page = self.paginate_queryset(search_messages(request.user, text, room_id))
+        return self.get_paginated_response(self.get_serializer(page, many=True).data)
 
     def perform_create(self, serializer):
         serializer.save(sender=self.request.user)
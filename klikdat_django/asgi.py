@@ -17,13 +17,17 @@ django_asgi_app = get_asgi_application()
 
 from channels.routing import ProtocolTypeRouter, URLRouter
 from channels.auth import AuthMiddlewareStack
+from chat.middleware import JWTAuthMiddleware
 import chat.routing
+import users.routing
 
 application = ProtocolTypeRouter({
     "http": django_asgi_app,
     "websocket": AuthMiddlewareStack(
-        URLRouter(
-            chat.routing.websocket_urlpatterns
+        JWTAuthMiddleware(
+            URLRouter(
+                chat.routing.websocket_urlpatterns + users.routing.websocket_urlpatterns
+            )
         )
     ),
 })
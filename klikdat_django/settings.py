@@ -71,6 +71,7 @@ INSTALLED_APPS = [
     'geo',
     'locations',
     'django.contrib.gis',
+    'django.contrib.postgres',
     'import_export',
     'allauth',
     'allauth.account',
@@ -117,6 +118,17 @@ TEMPLATES = [
 WSGI_APPLICATION = 'klikdat_django.wsgi.application'
 ASGI_APPLICATION = 'klikdat_django.asgi.application'
 
+# Shared cache (notification badges, verification flags). Without a Redis URL
+# each process keeps its own local-memory cache.
+CACHE_REDIS_URL = os.getenv('CACHE_REDIS_URL')
+if CACHE_REDIS_URL:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": CACHE_REDIS_URL,
+        },
+    }
+
 CHANNEL_LAYERS = {
     "default": {
         "BACKEND": "channels_redis.core.RedisChannelLayer",
@@ -262,5 +274,49 @@ Q_CLUSTER = {
     'orm': 'default'  # Using Django ORM as broker for dev
 }
 
+# Chat messages are broadcast immediately and saved in batches (chat.buffer)
+CHAT_FLUSH_INTERVAL_MS = 20
+CHAT_FLUSH_MAX_MESSAGES = 200
+
+# Chat presence and typing indicators (chat.presence): entry lifetime without
+# a refresh, typing debounce (seconds) and typing events per room per second
+CHAT_PRESENCE_TTL = 60
+CHAT_TYPING_DEBOUNCE = 3
+CHAT_ROOM_EVENT_RATE = 20
+
+# Binary chat subprotocol (chat.protocol): burst batching window, frames per
+# batch, the smallest frame worth deflating and the most a client frame may
+# inflate to
+CHAT_BATCH_WINDOW_MS = 10
+CHAT_BATCH_MAX_MESSAGES = 50
+CHAT_DEFLATE_MIN_BYTES = 512
+CHAT_MAX_FRAME_BYTES = 65536
+
+# Cached per-user unread notification counters (users.notifications)
+NOTIFICATION_UNREAD_CACHE_TIMEOUT = 300
+
+# Matchmake settings
+# Queue match notifications through django-q instead of writing them in the swipe request
+MATCHMAKE_DEFER_SIDE_EFFECTS = os.getenv('MATCHMAKE_DEFER_SIDE_EFFECTS', 'False') == 'True'
+# Seconds a compatibility ranking is kept for the following discovery pages
+DISCOVERY_RANKING_TIMEOUT = 900
+
+# Seconds between batched last_active writes, and the buffer size that forces an early flush
+HEARTBEAT_FLUSH_INTERVAL = int(os.getenv('HEARTBEAT_FLUSH_INTERVAL', '30'))
+HEARTBEAT_MAX_PENDING = 5000
+
+# Repeat logins from the same IP within this window don't queue another enrichment task
+LOGIN_ENRICHMENT_DEDUP_SECONDS = 300
+
+# Analyze verification videos in the long-running run_verification_worker instead of django-q
+VERIFICATION_ANALYSIS_WORKER = os.getenv('VERIFICATION_ANALYSIS_WORKER', 'False') == 'True'
+VERIFICATION_CLAIM_TIMEOUT = 600  # seconds before an unfinished claim is retried
+VERIFICATION_SAMPLE_KEYFRAMES = 12  # frames sampled per video
+VERIFICATION_SAMPLE_BEST = 4  # of which the best are analyzed
+
 # GeoIP2 settings
-GEOIP_PATH = BASE_DIR / 'geoip'
\ No newline at end of file
+GEOIP_PATH = BASE_DIR / 'geoip'
+GEOIP_CACHE_SIZE = 10000  # IP -> country results kept per process
+# Verification flags are only cached across requests in the shared Redis cache:
+# with per-process caches, invalidation would not reach the other processes
+VERIFICATION_FLAGS_CACHE_TIMEOUT = 300 if CACHE_REDIS_URL else 0
\ No newline at end of file
@@ -0,0 +1,124 @@
+import json
+import random
+import statistics
+import time
+from datetime import datetime
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIRequestFactory, force_authenticate
+from matchmake.models import Interest, MatchmakeProfile
+from matchmake.views import DiscoveryViewSet
+
+# Query-parameter combinations replayed against DiscoveryViewSet.list
+SCENARIOS = [
+    {},
+    {'sort_by': 'recent'},
+    {'sort_by': 'age_asc'},
+    {'sort_by': 'distance'},
+    {'sort_by': 'compatibility'},
+    {'sort_by': 'interests'},
+    {'min_age': 25, 'max_age': 35},
+    {'gender': 'F', 'min_age': 25, 'max_age': 35, 'max_distance': 25},
+    {'interests': '{interest_a}'},
+    {'interests': '{interest_a},{interest_b}', 'sort_by': 'interests'},
+    {'interests_all': '{interest_a},{interest_b}'},
+    {'religion': 'chris', 'education': 'master'},
+    {'languages': 'french', 'pets': 'dog'},
+    {'profession': 'engin', 'politics': 'liberal'},
+    {'active_status': 'day'},
+    {'active_status': 'week', 'verification_level': 3},
+    {'smoking': 'Never', 'drinking': 'Socially', 'exercise': 'Active'},
+    {'height_min': 165, 'height_max': 185, 'intentions': 'Long-term'},
+    {'gender': 'M', 'interests': '{interest_a}', 'active_status': 'month', 'sort_by': 'distance'},
+]
+
+
+class Command(BaseCommand):
+    help = 'Replay discovery query-parameter combinations and report latency, query counts and plans'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--viewers', type=int, default=5, help='Random viewers per scenario')
+        parser.add_argument('--repeat', type=int, default=3, help='Requests per viewer per scenario')
+        parser.add_argument('--page-size', type=int, default=20)
+        parser.add_argument('--output', default='discovery_benchmark.json', help='Report file')
+        parser.add_argument('--no-explain', action='store_true', help='Skip EXPLAIN ANALYZE')
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        viewers = self.pick_viewers(rng, options['viewers'])
+        if not viewers:
+            raise CommandError('No users with a matchmake profile; run generate_matchmake_dataset first')
+        interests = list(Interest.objects.order_by('id').values_list('id', flat=True)[:2]) or [0, 0]
+        interests += interests[-1:] * (2 - len(interests))
+
+        factory = APIRequestFactory()
+        view = DiscoveryViewSet.as_view({'get': 'list'})
+        report = {
+            'generated_at': datetime.now().isoformat(),
+            'profiles': MatchmakeProfile.objects.count(),
+            'viewers': [u.id for u in viewers],
+            'scenarios': [],
+        }
+
+        for scenario in SCENARIOS:
+            params = {
+                key: str(value).format(interest_a=interests[0], interest_b=interests[1])
+                for key, value in scenario.items()
+            }
+            params['page_size'] = options['page_size']
+            timings, query_counts, slowest = [], [], None
+
+            for viewer in viewers:
+                for _ in range(options['repeat']):
+                    request = factory.get('/api/matchmake/discovery/', params)
+                    force_authenticate(request, user=viewer)
+                    with CaptureQueriesContext(connection) as ctx:
+                        start = time.perf_counter()
+                        response = view(request)
+                        response.render()
+                        elapsed = (time.perf_counter() - start) * 1000
+                    if response.status_code != 200:
+                        raise CommandError(f'{params} returned {response.status_code}: {response.content[:200]}')
+                    timings.append(elapsed)
+                    query_counts.append(len(ctx.captured_queries))
+                    for query in ctx.captured_queries:
+                        if query['sql'].lstrip().upper().startswith('SELECT') and \
+                                (slowest is None or float(query['time']) > float(slowest['time'])):
+                            slowest = query
+
+            timings.sort()
+            result = {
+                'params': params,
+                'requests': len(timings),
+                'p50_ms': round(statistics.median(timings), 2),
+                'p95_ms': round(timings[min(len(timings) - 1, int(len(timings) * 0.95))], 2),
+                'max_ms': round(timings[-1], 2),
+                'queries_per_request': round(statistics.mean(query_counts), 2),
+                'slowest_query': slowest['sql'] if slowest else None,
+                'slowest_query_ms': round(float(slowest['time']) * 1000, 2) if slowest else None,
+            }
+            if slowest and not options['no_explain']:
+                result['plan'] = self.explain(slowest['sql'])
+            report['scenarios'].append(result)
+            self.stdout.write(
+                f"{json.dumps(scenario):<90} p50 {result['p50_ms']:>8.2f} ms  "
+                f"p95 {result['p95_ms']:>8.2f} ms  queries {result['queries_per_request']}"
+            )
+
+        with open(options['output'], 'w') as f:
+            json.dump(report, f, indent=2, default=str)
+        self.stdout.write(self.style.SUCCESS(f"Report written to {options['output']}"))
+
+    def pick_viewers(self, rng, count):
+        ids = list(MatchmakeProfile.objects.filter(
+            user__profile__latitude__isnull=False
+        ).order_by('-id').values_list('user_id', flat=True)[:1000])
+        return list(User.objects.filter(id__in=rng.sample(ids, min(count, len(ids)))))
+
+    def explain(self, sql):
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN (ANALYZE, BUFFERS) {sql}')
+            return [row[0] for row in cursor.fetchall()]
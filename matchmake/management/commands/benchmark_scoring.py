@@ -0,0 +1,100 @@
+import time
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import F
+from matchmake.models import MatchmakeProfile
+from matchmake.scoring import (
+    CandidatePool, Viewer, LIFESTYLE_FIELDS, ORDINAL_FIELDS, CATEGORICAL_FIELDS, score_pool, top_k
+)
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark compatibility scoring on a synthetic in-memory candidate pool, and loading '
+        'a pool of the same size from the database (CandidatePool.load) when profiles exist'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--candidates', type=int, default=10000, help='Pool size to score')
+        parser.add_argument('--interests', type=int, default=12, help='Number of viewer interests')
+        parser.add_argument('--top-k', type=int, default=200)
+        parser.add_argument('--runs', type=int, default=20)
+        parser.add_argument('--budget-ms', type=float, default=50.0, help='Fail if the median run exceeds this')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--skip-load', action='store_true', help='Only time scoring, not CandidatePool.load')
+
+    def handle(self, *args, **options):
+        n = options['candidates']
+        rng = np.random.default_rng(options['seed'])
+        viewer = Viewer(
+            min_age=25, max_age=35, max_distance=50, height=175,
+            lifestyle={'smoking': 'Never', 'drinking': 'Socially', 'exercise': 'Active', 'relationship_goal': 'Long-term'},
+            latitude=51.5074, longitude=-0.1278,
+            interest_ids=range(1, options['interests'] + 1),
+        )
+        pool = self.synthetic_pool(n, viewer, rng)
+        now = time.time()
+
+        timings = []
+        for _ in range(options['runs']):
+            start = time.perf_counter()
+            scores = score_pool(pool, viewer, now=now)
+            ranked = top_k(pool, scores, options['top_k'])
+            timings.append((time.perf_counter() - start) * 1000)
+
+        median = self.report(f"Scored {n} candidates, top {len(ranked)}", timings)
+
+        if not options['skip_load']:
+            load_median = self.time_load(viewer, n, options['runs'])
+            if load_median is not None:
+                median += load_median
+                self.stdout.write(f"Load + score: median {median:.2f} ms")
+
+        if median > options['budget_ms']:
+            raise CommandError(f"Median {median:.2f} ms exceeds the {options['budget_ms']} ms budget")
+        self.stdout.write(self.style.SUCCESS(f"Within the {options['budget_ms']} ms budget"))
+
+    def time_load(self, viewer, n, runs):
+        """Time CandidatePool.load (query plus per-row conversion) as discovery runs it, or None without data."""
+        queryset = MatchmakeProfile.objects.order_by(F('user__profile__last_active').desc(nulls_last=True))
+        if not queryset.exists():
+            self.stdout.write('No matchmake profiles; skipping CandidatePool.load (see generate_matchmake_dataset)')
+            return None
+        timings = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            pool = CandidatePool.load(queryset, viewer, size=n)
+            timings.append((time.perf_counter() - start) * 1000)
+        return self.report(f"Loaded {len(pool)} candidates", timings)
+
+    def report(self, label, timings):
+        timings = sorted(timings)
+        median = timings[len(timings) // 2]
+        p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+        self.stdout.write(f"{label}: median {median:.2f} ms, p95 {p95:.2f} ms, best {timings[0]:.2f} ms")
+        return median
+
+    def synthetic_pool(self, n, viewer, rng):
+        lifestyle = np.empty((n, len(LIFESTYLE_FIELDS)), dtype=np.int8)
+        for j, field in enumerate(LIFESTYLE_FIELDS):
+            choices = ORDINAL_FIELDS.get(field) or CATEGORICAL_FIELDS[field]
+            # -1 marks an unanswered field
+            lifestyle[:, j] = rng.integers(-1, len(choices), size=n)
+
+        interests = rng.integers(0, 2 ** 63, size=(n, viewer.interest_words), dtype=np.uint64)
+        if len(viewer.interest_bits) < 64:
+            interests &= np.uint64((1 << len(viewer.interest_bits)) - 1)
+
+        latitude = viewer.latitude + rng.normal(0, 0.5, size=n)
+        longitude = viewer.longitude + rng.normal(0, 0.5, size=n)
+        latitude[rng.random(n) < 0.1] = np.nan
+
+        return CandidatePool(
+            ids=np.arange(1, n + 1, dtype=np.int64),
+            age=rng.uniform(18, 60, size=n),
+            latitude=latitude,
+            longitude=longitude,
+            height=np.where(rng.random(n) < 0.2, np.nan, rng.normal(172, 10, size=n)),
+            last_active=time.time() - rng.exponential(3600 * 48, size=n),
+            lifestyle=lifestyle,
+            interests=interests,
+        )
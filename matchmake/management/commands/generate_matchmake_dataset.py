@@ -0,0 +1,201 @@
+import bisect
+import csv
+import io
+import itertools
+import json
+import random
+from datetime import date, timedelta
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+from users.models import Profile, VerificationProfile
+from matchmake.models import MatchmakeProfile, MatchmakePhoto, Swipe, Interest
+
+DEFAULT_INTERESTS = [
+    'Hiking', 'Music', 'Travel', 'Cooking', 'Reading', 'Movies', 'Gaming', 'Yoga', 'Running', 'Cycling',
+    'Photography', 'Art', 'Dancing', 'Football', 'Tennis', 'Swimming', 'Coffee', 'Wine', 'Camping', 'Fashion',
+    'Theatre', 'Gardening', 'Climbing', 'Board Games', 'Podcasts', 'Volunteering', 'Pets', 'Tech', 'Skiing', 'Surfing',
+]
+
+# Rough city centres so distance filters have realistic density
+CITIES = [
+    (51.5074, -0.1278), (53.4808, -2.2426), (52.4862, -1.8904), (55.9533, -3.1883), (53.8008, -1.5491),
+    (48.8566, 2.3522), (52.5200, 13.4050), (40.4168, -3.7038), (41.9028, 12.4964), (52.3676, 4.9041),
+    (1.3521, 103.8198), (3.1390, 101.6869), (-6.2088, 106.8456), (13.7563, 100.5018), (14.5995, 120.9842),
+]
+ETHNICITIES = ['Asian', 'Black', 'Hispanic', 'Middle Eastern', 'Mixed', 'White', 'Other']
+EDUCATION = ['High School', 'Bachelors', 'Masters', 'PhD', 'Trade School']
+RELIGIONS = ['Agnostic', 'Atheist', 'Buddhist', 'Christian', 'Hindu', 'Jewish', 'Muslim', 'Spiritual']
+POLITICS = ['Liberal', 'Moderate', 'Conservative', 'Apolitical']
+FAMILY_PLANS = ['Want children', "Don't want children", 'Have children', 'Open to children', 'Not sure']
+LANGUAGES = ['English', 'Malay', 'Mandarin', 'Spanish', 'French', 'German', 'Italian', 'Hindi', 'Tamil', 'Arabic']
+PETS = ['Dog', 'Cat', 'Fish', 'Bird', 'None']
+PROFESSIONS = ['Engineer', 'Teacher', 'Nurse', 'Designer', 'Accountant', 'Chef', 'Lawyer', 'Student', 'Developer', 'Doctor']
+ZODIAC = ['Aries', 'Taurus', 'Gemini', 'Cancer', 'Leo', 'Virgo', 'Libra', 'Scorpio', 'Sagittarius', 'Capricorn', 'Aquarius', 'Pisces']
+
+
+class Command(BaseCommand):
+    help = 'Generate a synthetic matchmake dataset (users, profiles, interests, photos, swipes) with COPY'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100000, help='Number of users to generate')
+        parser.add_argument('--batch-size', type=int, default=50000, help='Users per COPY batch')
+        parser.add_argument('--avg-swipes', type=float, default=40, help='Mean swipes made per user')
+        parser.add_argument('--like-rate', type=float, default=0.45, help='Share of swipes that are likes')
+        parser.add_argument('--max-photos', type=int, default=6)
+        parser.add_argument('--zipf', type=float, default=1.1, help='Popularity exponent for swipe targets')
+        parser.add_argument('--prefix', default='bench', help='Username prefix for generated users')
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        total = options['users']
+        batch_size = options['batch_size']
+
+        interest_ids = self.ensure_interests()
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT COALESCE(MAX(id), 0) FROM {User._meta.db_table}')
+            first_user_id = cursor.fetchone()[0] + 1
+            cursor.execute(f'SELECT COALESCE(MAX(id), 0) FROM {MatchmakeProfile._meta.db_table}')
+            first_profile_id = cursor.fetchone()[0] + 1
+
+        # Power-law popularity over the generated users: a few get most swipes
+        weights = [1.0 / (rank ** options['zipf']) for rank in range(1, total + 1)]
+        rng.shuffle(weights)
+        cum_weights = list(itertools.accumulate(weights))
+        interest_cum = list(itertools.accumulate(1.0 / (rank ** 0.8) for rank in range(1, len(interest_ids) + 1)))
+
+        password = make_password('benchmark')
+        now = timezone.now()
+
+        for start in range(0, total, batch_size):
+            count = min(batch_size, total - start)
+            with transaction.atomic():
+                self.copy_users(
+                    rng, start, count, first_user_id, first_profile_id, password, now, interest_ids, interest_cum, options
+                )
+            self.stdout.write(f"Generated users {start + 1}-{start + count} of {total}")
+
+        # Swipes go in a second pass so every target user already exists
+        for start in range(0, total, batch_size):
+            count = min(batch_size, total - start)
+            with transaction.atomic():
+                swiped = self.copy_swipes(rng, start, count, total, first_user_id, now, cum_weights, options)
+            self.stdout.write(f"Generated {swiped} swipes for users {start + 1}-{start + count}")
+
+        self.reset_sequences()
+        with connection.cursor() as cursor:
+            for model in (User, Profile, VerificationProfile, MatchmakeProfile, MatchmakePhoto, Swipe):
+                cursor.execute(f'ANALYZE {model._meta.db_table}')
+        self.stdout.write(self.style.SUCCESS(f"Generated {total} users"))
+
+    def ensure_interests(self):
+        existing = set(Interest.objects.values_list('name', flat=True))
+        Interest.objects.bulk_create([Interest(name=name) for name in DEFAULT_INTERESTS if name not in existing])
+        return list(Interest.objects.order_by('id').values_list('id', flat=True))
+
+    def copy_users(self, rng, start, count, first_user_id, first_profile_id, password, now,
+                   interest_ids, interest_cum, options):
+        users, profiles, verifications, mm_profiles, mm_interests, photos = (io.StringIO() for _ in range(6))
+        w = {name: csv.writer(buf) for name, buf in (
+            ('users', users), ('profiles', profiles), ('verifications', verifications), ('mm_profiles', mm_profiles),
+            ('mm_interests', mm_interests), ('photos', photos),
+        )}
+        today = date.today()
+
+        for offset in range(start, start + count):
+            user_id = first_user_id + offset
+            profile_id = first_profile_id + offset
+            gender = rng.choice('MMFFO')
+            joined = now - timedelta(days=rng.randint(0, 1000))
+            w['users'].writerow([
+                user_id, password, '', False, f"{options['prefix']}_{user_id}", f'First{offset}', f'Last{offset}',
+                f"{options['prefix']}_{user_id}@example.com", False, True, joined.isoformat(),
+            ])
+
+            lat, lng = rng.choice(CITIES)
+            active = now - timedelta(hours=rng.expovariate(1 / 72.0))
+            w['profiles'].writerow([
+                user_id, gender, (today - timedelta(days=rng.randint(18 * 365, 65 * 365))).isoformat(),
+                round(lat + rng.gauss(0, 0.2), 6), round(lng + rng.gauss(0, 0.2), 6), active.isoformat(), json.dumps({}),
+            ])
+            w['verifications'].writerow([
+                user_id, rng.random() < 0.8, rng.random() < 0.5, rng.random() < 0.4,
+                rng.random() < 0.2, rng.random() < 0.2, 'pending',
+            ])
+
+            languages = ', '.join(rng.sample(LANGUAGES, rng.randint(1, 3)))
+            pets = rng.choice(PETS)
+            chosen = sorted({
+                interest_ids[bisect.bisect_left(interest_cum, rng.random() * interest_cum[-1])]
+                for _ in range(rng.randint(0, 8))
+            })
+            w['mm_profiles'].writerow([
+                profile_id, user_id, rng.choice(['Never', 'Socially', 'Regularly']),
+                rng.choice(['Never', 'Socially', 'Regularly']), rng.choice(['Never', 'Sometimes', 'Active', 'Athletic']),
+                rng.choice(EDUCATION), rng.choice(PROFESSIONS),
+                rng.choice(['Long-term', 'Short-term', 'Casual', 'Friendship', 'Not Sure']),
+                rng.randint(150, 200), rng.choice(ETHNICITIES), languages, pets, rng.choice(RELIGIONS),
+                rng.choice(POLITICS), rng.choice(FAMILY_PLANS), rng.choice(ZODIAC),
+                18, 99, rng.choice([10, 25, 50, 100]), rng.choice(['M', 'F', 'Everyone']),
+                self.pg_array(chosen), json.dumps({}),
+            ])
+            for interest_id in chosen:
+                w['mm_interests'].writerow([profile_id, interest_id])
+
+            for n in range(rng.randint(0, options['max_photos'])):
+                w['photos'].writerow([profile_id, f'matchmake_photos/bench_{user_id}_{n}.jpg', n == 0, joined.isoformat(),
+                                       json.dumps({})])
+
+        with connection.cursor() as cursor:
+            self.copy(cursor, users, User, ['id', 'password', 'last_login', 'is_superuser', 'username', 'first_name',
+                                             'last_name', 'email', 'is_staff', 'is_active', 'date_joined'])
+            self.copy(cursor, profiles, Profile, ['user_id', 'gender', 'dob', 'latitude', 'longitude', 'last_active',
+                                                   'avatar_renditions'])
+            self.copy(cursor, verifications, VerificationProfile, ['user_id', 'v1_email', 'v2_phone', 'v3_location',
+                                                                   'v4_gender', 'v5_age', 'ai_analysis_status'])
+            self.copy(cursor, mm_profiles, MatchmakeProfile, [
+                'id', 'user_id', 'smoking', 'drinking', 'exercise', 'education', 'profession', 'relationship_goal',
+                'height', 'ethnicity', 'languages_spoken', 'pets', 'religion', 'politics', 'future_family_plans',
+                'zodiac', 'pref_min_age', 'pref_max_age', 'pref_max_distance', 'pref_looking_for',
+                'interest_ids', 'score_weights',
+            ])
+            self.copy(cursor, mm_interests, MatchmakeProfile.interests.through, ['matchmakeprofile_id', 'interest_id'])
+            self.copy(cursor, photos, MatchmakePhoto, ['profile_id', 'image', 'is_primary', 'created_at', 'renditions'])
+
+    def copy_swipes(self, rng, start, count, total, first_user_id, now, cum_weights, options):
+        swipes = io.StringIO()
+        writer = csv.writer(swipes)
+        rows = 0
+        for offset in range(start, start + count):
+            # Heavy-tailed activity per swiper, targets drawn by popularity
+            made = min(int(rng.paretovariate(2.0) * options['avg_swipes'] / 2), total - 1)
+            targets = set(rng.choices(range(total), cum_weights=cum_weights, k=made))
+            targets.discard(offset)
+            for target in targets:
+                created = now - timedelta(minutes=rng.randint(0, 60 * 24 * 90))
+                writer.writerow([
+                    first_user_id + offset, first_user_id + target, rng.random() < options['like_rate'], created.isoformat(),
+                ])
+            rows += len(targets)
+        with connection.cursor() as cursor:
+            self.copy(cursor, swipes, Swipe, ['swiper_id', 'swiped_id', 'is_like', 'created_at'])
+        return rows
+
+    def copy(self, cursor, buffer, model, columns):
+        buffer.seek(0)
+        table = connection.ops.quote_name(model._meta.db_table)
+        sql = f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv, NULL '')"
+        cursor.cursor.copy_expert(sql, buffer)
+
+    def pg_array(self, values):
+        return '{' + ','.join(f'"{v}"' if isinstance(v, str) else str(v) for v in values) + '}'
+
+    def reset_sequences(self):
+        from django.core.management.color import no_style
+        models = [User, Profile, VerificationProfile, MatchmakeProfile, MatchmakePhoto, Swipe]
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(no_style(), models):
+                cursor.execute(sql)
@@ -0,0 +1,68 @@
+# Generated by Django 5.2.7 on 2026-10-18 10:00
+
+import re
+
+import django.contrib.postgres.fields
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations, models
+
+
+TAG_SEPARATORS = re.compile(r'[,;/|]+')
+
+
+# Copy of matchmake.models.normalize_tags as of this migration
+def normalize_tags(value):
+    if not value:
+        return []
+    tags = []
+    for part in TAG_SEPARATORS.split(value):
+        tag = ' '.join(part.split()).lower()[:50]
+        if tag and tag not in tags:
+            tags.append(tag)
+    return tags
+
+
+def populate_tags(apps, schema_editor):
+    MatchmakeProfile = apps.get_model('matchmake', 'MatchmakeProfile')
+    profiles = MatchmakeProfile.objects.exclude(languages_spoken__isnull=True, pets__isnull=True)
+    batch = []
+    for profile in profiles.only('id', 'languages_spoken', 'pets').iterator(chunk_size=2000):
+        profile.languages_tags = normalize_tags(profile.languages_spoken)
+        profile.pets_tags = normalize_tags(profile.pets)
+        batch.append(profile)
+        if len(batch) >= 2000:
+            MatchmakeProfile.objects.bulk_update(batch, ['languages_tags', 'pets_tags'])
+            batch = []
+    if batch:
+        MatchmakeProfile.objects.bulk_update(batch, ['languages_tags', 'pets_tags'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('matchmake', '0002_matchmakeprofile_ethnicity_and_more'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddField(
+            model_name='matchmakeprofile',
+            name='languages_tags',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.CharField(max_length=50), blank=True, default=list, editable=False, size=None),
+        ),
+        migrations.AddField(
+            model_name='matchmakeprofile',
+            name='pets_tags',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.CharField(max_length=50), blank=True, default=list, editable=False, size=None),
+        ),
+        migrations.RunPython(populate_tags, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='matchmakeprofile',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['languages_tags'], name='mm_profile_languages_gin'),
+        ),
+        migrations.AddIndex(
+            model_name='matchmakeprofile',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['pets_tags'], name='mm_profile_pets_gin'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-18 10:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('matchmake', '0003_matchmakeprofile_tags_and_trigram_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='matchmakeprofile',
+            name='score_weights',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.7 on 2026-10-18 11:00
+
+import django.contrib.postgres.fields
+import django.contrib.postgres.indexes
+from django.contrib.postgres.expressions import ArraySubquery
+from django.db import migrations, models
+from django.db.models import OuterRef
+
+
+def populate_interest_ids(apps, schema_editor):
+    MatchmakeProfile = apps.get_model('matchmake', 'MatchmakeProfile')
+    through = MatchmakeProfile.interests.through
+    MatchmakeProfile.objects.filter(interests__isnull=False).distinct().update(
+        interest_ids=ArraySubquery(
+            through.objects.filter(matchmakeprofile_id=OuterRef('pk'))
+            .order_by('interest_id').values('interest_id')
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('matchmake', '0004_matchmakeprofile_score_weights'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='matchmakeprofile',
+            name='interest_ids',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.BigIntegerField(), blank=True, default=list, editable=False, size=None),
+        ),
+        migrations.RunPython(populate_interest_ids, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='matchmakeprofile',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['interest_ids'], name='mm_profile_interests_gin'),
+        ),
+    ]
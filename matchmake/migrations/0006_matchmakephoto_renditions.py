@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-18 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('matchmake', '0005_matchmakeprofile_interest_ids'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='matchmakephoto',
+            name='renditions',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 5.2.7 on 2026-10-19 10:00
+
+import django.contrib.postgres.indexes
+import django.db.models.functions.text
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY can't run in a transaction; it doesn't block
+    # profile writes while the indexes build
+    atomic = False
+
+    dependencies = [
+        ('matchmake', '0006_matchmakephoto_renditions'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='matchmakeprofile',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('ethnicity'), name='gin_trgm_ops'), name='mm_profile_ethnicity_trgm'),
+        ),
+        AddIndexConcurrently(
+            model_name='matchmakeprofile',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('education'), name='gin_trgm_ops'), name='mm_profile_education_trgm'),
+        ),
+        AddIndexConcurrently(
+            model_name='matchmakeprofile',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('religion'), name='gin_trgm_ops'), name='mm_profile_religion_trgm'),
+        ),
+        AddIndexConcurrently(
+            model_name='matchmakeprofile',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('politics'), name='gin_trgm_ops'), name='mm_profile_politics_trgm'),
+        ),
+        AddIndexConcurrently(
+            model_name='matchmakeprofile',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('future_family_plans'), name='gin_trgm_ops'), name='mm_profile_family_trgm'),
+        ),
+        AddIndexConcurrently(
+            model_name='matchmakeprofile',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('profession'), name='gin_trgm_ops'), name='mm_profile_profession_trgm'),
+        ),
+        AddIndexConcurrently(
+            model_name='matchmakeprofile',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('languages_spoken'), name='gin_trgm_ops'), name='mm_profile_languages_trgm'),
+        ),
+        AddIndexConcurrently(
+            model_name='matchmakeprofile',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('pets'), name='gin_trgm_ops'), name='mm_profile_pets_trgm'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.7 on 2026-10-19 14:00
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('matchmake', '0007_matchmakeprofile_trigram_indexes'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='matchmakeprofile',
+            name='mm_profile_languages_gin',
+        ),
+        migrations.RemoveIndex(
+            model_name='matchmakeprofile',
+            name='mm_profile_pets_gin',
+        ),
+        migrations.RemoveField(
+            model_name='matchmakeprofile',
+            name='languages_tags',
+        ),
+        migrations.RemoveField(
+            model_name='matchmakeprofile',
+            name='pets_tags',
+        ),
+    ]
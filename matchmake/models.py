@@ -1,7 +1,22 @@
 from django.db import models
+from django.db.models import Func
+from django.db.models.functions import Upper
 from django.contrib.auth.models import User
+from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex, OpClass
 from django.core.validators import MinValueValidator, MaxValueValidator
 
+class ArrayOverlapCount(Func):
+    """Number of elements two arrays have in common, e.g. shared interest ids."""
+    output_field = models.IntegerField()
+
+    def as_sql(self, compiler, connection, **extra_context):
+        lhs, lhs_params = compiler.compile(self.source_expressions[0])
+        rhs, rhs_params = compiler.compile(self.source_expressions[1])
+        sql = f'cardinality(ARRAY(SELECT unnest({lhs}) INTERSECT SELECT unnest({rhs})))'
+        return sql, (*lhs_params, *rhs_params)
+
+
 class Interest(models.Model):
     name = models.CharField(max_length=50, unique=True)
     category = models.CharField(max_length=50, blank=True, null=True)
@@ -48,12 +63,40 @@ class MatchmakeProfile(models.Model):
     zodiac = models.CharField(max_length=50, blank=True, null=True)
 
     interests = models.ManyToManyField(Interest, blank=True)
+    # Denormalized copy of interests, kept in sync by matchmake.signals
+    interest_ids = ArrayField(models.BigIntegerField(), default=list, blank=True, editable=False)
     
     # Preferences for Discovery
     pref_min_age = models.IntegerField(default=18, validators=[MinValueValidator(18)])
     pref_max_age = models.IntegerField(default=99)
     pref_max_distance = models.IntegerField(default=50, help_text='In kilometers')
     pref_looking_for = models.CharField(max_length=20, default='Everyone') # 'M', 'F', 'O', 'Everyone'
+    # Per-component weight overrides for compatibility ranking, e.g. {"interests": 2.0}
+    score_weights = models.JSONField(default=dict, blank=True)
+
+    class Meta:
+        indexes = [
+            GinIndex(fields=['interest_ids'], name='mm_profile_interests_gin'),
+            # pg_trgm indexes on UPPER(column), which is what icontains compiles to
+            GinIndex(OpClass(Upper('ethnicity'), name='gin_trgm_ops'), name='mm_profile_ethnicity_trgm'),
+            GinIndex(OpClass(Upper('education'), name='gin_trgm_ops'), name='mm_profile_education_trgm'),
+            GinIndex(OpClass(Upper('religion'), name='gin_trgm_ops'), name='mm_profile_religion_trgm'),
+            GinIndex(OpClass(Upper('politics'), name='gin_trgm_ops'), name='mm_profile_politics_trgm'),
+            GinIndex(OpClass(Upper('future_family_plans'), name='gin_trgm_ops'), name='mm_profile_family_trgm'),
+            GinIndex(OpClass(Upper('profession'), name='gin_trgm_ops'), name='mm_profile_profession_trgm'),
+            GinIndex(OpClass(Upper('languages_spoken'), name='gin_trgm_ops'), name='mm_profile_languages_trgm'),
+            GinIndex(OpClass(Upper('pets'), name='gin_trgm_ops'), name='mm_profile_pets_trgm'),
+        ]
+
+    def save(self, *args, **kwargs):
+        if kwargs.get('update_fields') is None and not self._state.adding and not kwargs.get('force_insert'):
+            # interest_ids is owned by the m2m_changed sync; a full save from a
+            # stale instance must not overwrite it.
+            kwargs['update_fields'] = [
+                f.name for f in self._meta.concrete_fields
+                if not f.primary_key and f.name != 'interest_ids'
+            ]
+        super().save(*args, **kwargs)
     
     @property
     def profile_completeness(self):
@@ -74,6 +117,7 @@ class MatchmakeProfile(models.Model):
 class MatchmakePhoto(models.Model):
     profile = models.ForeignKey(MatchmakeProfile, on_delete=models.CASCADE, related_name='photos')
     image = models.ImageField(upload_to='matchmake_photos/')
+    renditions = models.JSONField(default=dict, blank=True, editable=False) # see users.renditions
     is_primary = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
 
@@ -0,0 +1,132 @@
+import base64
+import json
+from datetime import date, datetime
+from decimal import Decimal
+
+from django.db.models import F, Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination keyed on the queryset's own ordering.
+
+    The ordering already applied to the queryset (e.g. '-user__profile__last_active',
+    'user__profile__dob', 'dist_approx') is extended with the primary key as a
+    tie-breaker, and the next page starts strictly after the last row returned.
+    Rows removed between requests (e.g. by swipes) never shift the following
+    pages, and no COUNT(*) is issued.
+    """
+    page_size = api_settings.PAGE_SIZE or 10
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.keys = self.get_ordering(queryset)
+
+        # Expose every sort key as a plain annotation so related fields and
+        # existing annotations can be read back and compared the same way.
+        queryset = queryset.annotate(**{
+            self._alias(i): F(field) for i, (field, _) in enumerate(self.keys)
+        })
+        queryset = queryset.order_by(*[
+            F(self._alias(i)).desc(nulls_last=True) if descending
+            else F(self._alias(i)).asc(nulls_last=True)
+            for i, (_, descending) in enumerate(self.keys)
+        ])
+
+        cursor = self.decode_cursor(request)
+        if cursor is not None:
+            queryset = queryset.filter(self._after(cursor))
+
+        rows = list(queryset[:self.page_size + 1])
+        self.has_next = len(rows) > self.page_size
+        self.page = rows[:self.page_size]
+        return self.page
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if size <= 0:
+            return self.page_size
+        return min(size, self.max_page_size)
+
+    def get_ordering(self, queryset):
+        ordering = list(queryset.query.order_by or queryset.model._meta.ordering)
+        keys = []
+        for field in ordering:
+            if not isinstance(field, str):
+                continue
+            descending = field.startswith('-')
+            keys.append((field.lstrip('-'), descending))
+        if not any(field in ('pk', 'id') for field, _ in keys):
+            keys.append(('pk', keys[0][1] if keys else False))
+        return keys
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        last = self.page[-1]
+        values = [self._encode_value(getattr(last, self._alias(i))) for i in range(len(self.keys))]
+        token = base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, token)
+
+    def decode_cursor(self, request):
+        token = request.query_params.get(self.cursor_query_param)
+        if not token:
+            return None
+        try:
+            values = json.loads(base64.urlsafe_b64decode(token.encode()).decode())
+        except (TypeError, ValueError, UnicodeDecodeError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(values, list) or len(values) != len(self.keys):
+            raise NotFound(self.invalid_cursor_message)
+        return values
+
+    def _after(self, values):
+        """
+        Build the "strictly after" predicate for a composite key with
+        NULLs sorted last in both directions.
+        """
+        condition = Q(pk__in=[])
+        equal_so_far = Q()
+        for i, ((_, descending), value) in enumerate(zip(self.keys, values)):
+            alias = self._alias(i)
+            if value is None:
+                # Nothing sorts after NULL on this key, only ties remain.
+                equal_so_far &= Q(**{f'{alias}__isnull': True})
+                continue
+            lookup = 'lt' if descending else 'gt'
+            after = Q(**{f'{alias}__{lookup}': value}) | Q(**{f'{alias}__isnull': True})
+            condition |= equal_so_far & after
+            equal_so_far &= Q(**{alias: value})
+        return condition
+
+    def _alias(self, index):
+        return f'keyset_{index}'
+
+    def _encode_value(self, value):
+        # isoformat() keeps full microsecond precision, which equality on the
+        # tie-breaking step depends on.
+        if isinstance(value, (datetime, date)):
+            return value.isoformat()
+        if isinstance(value, Decimal):
+            return str(value)
+        return value
@@ -0,0 +1,252 @@
+"""
+Compatibility scoring for discovery.
+
+A candidate pool is loaded with one flat values_list query into NumPy
+arrays, scored against the viewer with weighted components in [0, 1] and
+reduced to the top-K profile ids. Weights default to DEFAULT_WEIGHTS and can
+be overridden per viewer through MatchmakeProfile.score_weights.
+"""
+import time
+from datetime import date
+
+import numpy as np
+
+from .models import MatchmakeProfile
+from .utils import haversine_km
+
+DEFAULT_WEIGHTS = {
+    'age': 1.0,
+    'distance': 1.0,
+    'height': 0.25,
+    'lifestyle': 1.0,
+    'interests': 1.5,
+    'recency': 1.0,
+}
+
+POOL_SIZE = 5000
+AGE_FALLOFF_YEARS = 5.0
+HEIGHT_SCALE_CM = 15.0
+RECENCY_HALF_LIFE_HOURS = 72.0
+
+# Ordinal enums, in the order of the model choices, so "Socially" sits
+# between "Never" and "Regularly".
+ORDINAL_FIELDS = {
+    'smoking': [c[0] for c in MatchmakeProfile.SMOKING_CHOICES],
+    'drinking': [c[0] for c in MatchmakeProfile.DRINKING_CHOICES],
+    'exercise': [c[0] for c in MatchmakeProfile.EXERCISE_CHOICES],
+}
+CATEGORICAL_FIELDS = {
+    'relationship_goal': [c[0] for c in MatchmakeProfile.RELATIONSHIP_GOAL_CHOICES],
+}
+LIFESTYLE_FIELDS = list(ORDINAL_FIELDS) + list(CATEGORICAL_FIELDS)
+
+POOL_FIELDS = (
+    'id', 'user__profile__dob', 'user__profile__latitude', 'user__profile__longitude',
+    'height', 'user__profile__last_active',
+) + tuple(LIFESTYLE_FIELDS) + ('interest_ids',)
+
+_POPCOUNT_TABLE = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+
+def resolve_weights(profile):
+    """Merge a viewer's stored weight overrides over the defaults."""
+    weights = dict(DEFAULT_WEIGHTS)
+    overrides = getattr(profile, 'score_weights', None) or {}
+    for key, value in overrides.items():
+        if key in weights:
+            try:
+                weights[key] = max(0.0, float(value))
+            except (TypeError, ValueError):
+                pass
+    return weights
+
+
+def _encode(value, choices):
+    try:
+        return choices.index(value)
+    except ValueError:
+        return -1
+
+
+def _popcount(words):
+    """Per-row popcount of a (n, k) uint64 array."""
+    as_bytes = words.view(np.uint8).reshape(words.shape[0], -1)
+    return _POPCOUNT_TABLE[as_bytes].sum(axis=1, dtype=np.int32)
+
+
+class Viewer:
+    """The scoring reference point: the viewer's own attributes and preferences."""
+
+    def __init__(self, min_age=18, max_age=99, max_distance=50, height=None, lifestyle=None,
+                 latitude=None, longitude=None, interest_ids=(), weights=None, today=None):
+        self.today = today or date.today()
+        self.min_age = min_age
+        self.max_age = max_age
+        self.max_distance = float(max_distance or 50)
+        self.height = height
+        lifestyle = lifestyle or {}
+        self.lifestyle = {
+            field: _encode(lifestyle.get(field), choices)
+            for field, choices in {**ORDINAL_FIELDS, **CATEGORICAL_FIELDS}.items()
+        }
+        self.latitude = latitude
+        self.longitude = longitude
+        # Bit positions are assigned over the viewer's own interests only,
+        # since overlap with anything else does not contribute to the score.
+        self.interest_bits = {interest_id: i for i, interest_id in enumerate(sorted(set(interest_ids)))}
+        self.weights = weights or dict(DEFAULT_WEIGHTS)
+
+    @classmethod
+    def from_profile(cls, profile):
+        user_profile = getattr(profile.user, 'profile', None)
+        latitude = longitude = None
+        if user_profile and user_profile.latitude is not None and user_profile.longitude is not None:
+            latitude, longitude = float(user_profile.latitude), float(user_profile.longitude)
+        return cls(
+            min_age=profile.pref_min_age,
+            max_age=profile.pref_max_age,
+            max_distance=profile.pref_max_distance,
+            height=profile.height,
+            lifestyle={field: getattr(profile, field) for field in LIFESTYLE_FIELDS},
+            latitude=latitude,
+            longitude=longitude,
+            interest_ids=profile.interest_ids,
+            weights=resolve_weights(profile),
+        )
+
+    @property
+    def interest_words(self):
+        return max(1, (len(self.interest_bits) + 63) // 64)
+
+
+class CandidatePool:
+    """Columnar NumPy view of candidate profiles."""
+
+    def __init__(self, ids, age, latitude, longitude, height, last_active, lifestyle, interests):
+        self.ids = ids
+        self.age = age
+        self.latitude = latitude
+        self.longitude = longitude
+        self.height = height
+        self.last_active = last_active
+        self.lifestyle = lifestyle
+        self.interests = interests
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    def load(cls, queryset, viewer, size=POOL_SIZE):
+        """Load up to `size` candidates from `queryset` in a single query."""
+        rows = queryset.values_list(*POOL_FIELDS)[:size]
+        return cls.from_rows(list(rows), viewer)
+
+    @classmethod
+    def from_rows(cls, rows, viewer):
+        n = len(rows)
+        ids = np.empty(n, dtype=np.int64)
+        age = np.full(n, np.nan)
+        latitude = np.full(n, np.nan)
+        longitude = np.full(n, np.nan)
+        height = np.full(n, np.nan)
+        last_active = np.full(n, np.nan)
+        lifestyle = np.full((n, len(LIFESTYLE_FIELDS)), -1, dtype=np.int8)
+        interests = np.zeros((n, viewer.interest_words), dtype=np.uint64)
+
+        today = viewer.today.toordinal()
+        choices = [ORDINAL_FIELDS.get(f) or CATEGORICAL_FIELDS[f] for f in LIFESTYLE_FIELDS]
+        bits = viewer.interest_bits
+        for i, row in enumerate(rows):
+            pk, dob, lat, lng, h, active = row[:6]
+            ids[i] = pk
+            if dob is not None:
+                age[i] = (today - dob.toordinal()) / 365.25
+            if lat is not None and lng is not None:
+                latitude[i] = float(lat)
+                longitude[i] = float(lng)
+            if h is not None:
+                height[i] = h
+            if active is not None:
+                last_active[i] = active.timestamp()
+            for j, value in enumerate(row[6:6 + len(LIFESTYLE_FIELDS)]):
+                lifestyle[i, j] = _encode(value, choices[j])
+            for interest_id in row[-1] or ():
+                bit = bits.get(interest_id)
+                if bit is not None:
+                    interests[i, bit // 64] |= np.uint64(1 << (bit % 64))
+
+        return cls(ids, age, latitude, longitude, height, last_active, lifestyle, interests)
+
+
+def score_pool(pool, viewer, now=None):
+    """Return the weighted compatibility score (0..1) of every candidate."""
+    now = now if now is not None else time.time()
+    weights = viewer.weights
+    components = {}
+
+    # Age: 1 inside the preferred range, linear fall-off outside it
+    outside = np.maximum(viewer.min_age - pool.age, 0) + np.maximum(pool.age - viewer.max_age, 0)
+    components['age'] = np.where(np.isnan(pool.age), 0.5, np.clip(1 - outside / AGE_FALLOFF_YEARS, 0, 1))
+
+    # Distance: Haversine, 1 at zero km down to 0 at the preferred maximum
+    if viewer.latitude is not None and viewer.longitude is not None:
+        km = haversine_km(viewer.latitude, viewer.longitude, pool.latitude, pool.longitude)
+        components['distance'] = np.where(np.isnan(km), 0.5, np.clip(1 - km / viewer.max_distance, 0, 1))
+    else:
+        components['distance'] = np.full(len(pool), 0.5)
+
+    # Height: closeness to the viewer's own height
+    if viewer.height:
+        closeness = np.exp(-((pool.height - viewer.height) / HEIGHT_SCALE_CM) ** 2)
+        components['height'] = np.where(np.isnan(pool.height), 0.5, closeness)
+    else:
+        components['height'] = np.full(len(pool), 0.5)
+
+    # Lifestyle: ordinal closeness / categorical equality, unknowns count as 0.5
+    per_field = []
+    for j, field in enumerate(LIFESTYLE_FIELDS):
+        mine = viewer.lifestyle[field]
+        theirs = pool.lifestyle[:, j].astype(np.float64)
+        if field in ORDINAL_FIELDS:
+            span = max(len(ORDINAL_FIELDS[field]) - 1, 1)
+            similarity = 1 - np.abs(theirs - mine) / span
+        else:
+            similarity = (theirs == mine).astype(np.float64)
+        per_field.append(np.where((theirs < 0) | (mine < 0), 0.5, similarity))
+    components['lifestyle'] = np.mean(per_field, axis=0)
+
+    # Interests: share of the viewer's interests the candidate also has
+    if viewer.interest_bits:
+        components['interests'] = _popcount(pool.interests) / len(viewer.interest_bits)
+    else:
+        components['interests'] = np.full(len(pool), 0.5)
+
+    # Recency: exponential decay on hours since last activity
+    hours = (now - pool.last_active) / 3600.0
+    components['recency'] = np.where(
+        np.isnan(hours), 0.0, np.exp2(-np.maximum(hours, 0) / RECENCY_HALF_LIFE_HOURS)
+    )
+
+    total = sum(weights.values()) or 1.0
+    score = np.zeros(len(pool))
+    for key, weight in weights.items():
+        if weight:
+            score += weight * components[key]
+    return score / total
+
+
+def top_k(pool, scores, k):
+    """Return [(profile_id, score), ...] for the k best candidates, best first."""
+    if len(pool) == 0 or k <= 0:
+        return []
+    k = min(k, len(pool))
+    best = np.argpartition(-scores, k - 1)[:k]
+    best = best[np.argsort(-scores[best], kind='stable')]
+    return [(int(pool.ids[i]), float(scores[i])) for i in best]
+
+
+def rank_candidates(queryset, profile, k=200, pool_size=POOL_SIZE):
+    """Score up to pool_size candidates from queryset for profile and return the top k."""
+    viewer = Viewer.from_profile(profile)
+    pool = CandidatePool.load(queryset, viewer, size=pool_size)
+    return top_k(pool, score_pool(pool, viewer), k)
@@ -1,6 +1,11 @@
 from rest_framework import serializers
 from django.contrib.auth.models import User
+from django.core.files.storage import default_storage
+from users import heartbeat
+from users.renditions import rendition_urls
+from users.serializers import RenditionsField
 from .models import MatchmakeProfile, Interest, MatchmakePhoto, Swipe, Match
+from .utils import calculate_age, distances_from
 
 class InterestSerializer(serializers.ModelSerializer):
     class Meta:
@@ -8,9 +13,11 @@ class InterestSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 class MatchmakePhotoSerializer(serializers.ModelSerializer):
+    renditions = RenditionsField()
+
     class Meta:
         model = MatchmakePhoto
-        fields = ('id', 'image', 'is_primary', 'created_at')
+        fields = ('id', 'image', 'renditions', 'is_primary', 'created_at')
 
 class MatchmakeProfileSerializer(serializers.ModelSerializer):
     photos = MatchmakePhotoSerializer(many=True, read_only=True)
@@ -30,10 +37,21 @@ class MatchmakeProfileSerializer(serializers.ModelSerializer):
             'height', 'ethnicity', 'languages_spoken', 'pets',
             'religion', 'politics', 'future_family_plans', 'zodiac',
             'pref_min_age', 'pref_max_age', 'pref_max_distance', 
-            'pref_looking_for', 'photos', 'user_details', 'profile_completeness',
+            'pref_looking_for', 'score_weights', 'photos', 'user_details', 'profile_completeness',
             'relationship_status'
         )
 
+    def validate_score_weights(self, value):
+        from .scoring import DEFAULT_WEIGHTS
+        if not isinstance(value, dict):
+            raise serializers.ValidationError('Expected an object of weights.')
+        for key, weight in value.items():
+            if key not in DEFAULT_WEIGHTS:
+                raise serializers.ValidationError(f'Unknown weight "{key}".')
+            if not isinstance(weight, (int, float)) or weight < 0:
+                raise serializers.ValidationError(f'Weight "{key}" must be a non-negative number.')
+        return value
+
     def get_relationship_status(self, obj):
         request = self.context.get('request')
         if not request or not request.user or not request.user.is_authenticated:
@@ -63,22 +81,7 @@ class MatchmakeProfileSerializer(serializers.ModelSerializer):
         
         distance = None
         if current_user and hasattr(current_user, 'profile') and hasattr(obj.user, 'profile'):
-            if current_user.profile.latitude is not None and current_user.profile.longitude is not None and \
-               obj.user.profile.latitude is not None and obj.user.profile.longitude is not None:
-                try:
-                    lat1, lon1 = float(current_user.profile.latitude), float(current_user.profile.longitude)
-                    lat2, lon2 = float(obj.user.profile.latitude), float(obj.user.profile.longitude)
-                    
-                    # Haversine formula for more accurate distance
-                    import math
-                    R = 6371  # Earth radius in KM
-                    dlat = math.radians(lat2 - lat1)
-                    dlon = math.radians(lon2 - lon1)
-                    a = math.sin(dlat / 2) ** 2 + math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(dlon / 2) ** 2
-                    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-                    distance = R * c
-                except:
-                    pass
+            distance = distances_from(current_user.profile, [obj.user.profile])[0]
 
         return {
             'id': obj.user.id,
@@ -86,60 +89,70 @@ class MatchmakeProfileSerializer(serializers.ModelSerializer):
             'first_name': obj.user.first_name,
             'last_name': obj.user.last_name,
             'gender': obj.user.profile.gender if hasattr(obj.user, 'profile') else None,
-            'age': self._calculate_age(obj.user.profile.dob) if hasattr(obj.user, 'profile') and obj.user.profile.dob else None,
+            'age': calculate_age(obj.user.profile.dob) if hasattr(obj.user, 'profile') else None,
             'dob': obj.user.profile.dob if hasattr(obj.user, 'profile') else None,
             'avatar': obj.user.profile.avatar.url if hasattr(obj.user, 'profile') and obj.user.profile.avatar else None,
+            'avatar_renditions': rendition_urls(obj.user.profile.avatar_renditions, default_storage, request) if hasattr(obj.user, 'profile') else None,
             'verification_level': obj.user.verification_profile.level if hasattr(obj.user, 'verification_profile') else 0,
-            'last_active': obj.user.profile.last_active if hasattr(obj.user, 'profile') else None,
-            'distance': round(distance, 1) if distance is not None else None,
+            'last_active': heartbeat.last_active(obj.user_id, obj.user.profile.last_active) if hasattr(obj.user, 'profile') else None,
+            'distance': distance,
         }
 
-    def _calculate_age(self, dob):
-        from datetime import date
-        today = date.today()
-        return today.year - dob.year - ((today.month, today.day) < (dob.month, dob.day))
-
 class SwipeSerializer(serializers.ModelSerializer):
     class Meta:
         model = Swipe
         fields = ('id', 'swiped', 'is_like', 'created_at')
         read_only_fields = ('swiper',)
 
+class MatchListSerializer(serializers.ListSerializer):
+    """
+    Loads everything the match cards need for the whole list at once: one
+    batched photo query and one vectorized distance computation, instead of
+    a photo query and a Haversine per match.
+    """
+    def to_representation(self, data):
+        matches = list(data.all() if hasattr(data, 'all') else data)
+        request = self.context.get('request')
+        user = request.user
+        others = [m.user2 if m.user1_id == user.id else m.user1 for m in matches]
+
+        profile_ids = [o.matchmake_profile.id for o in others if hasattr(o, 'matchmake_profile')]
+        photos_by_profile = {}
+        for photo in MatchmakePhoto.objects.filter(profile_id__in=profile_ids).order_by('id'):
+            photos_by_profile.setdefault(photo.profile_id, []).append(photo)
+
+        origin = getattr(user, 'profile', None)
+        distances = distances_from(origin, [getattr(o, 'profile', None) for o in others])
+
+        self.child.batch = {
+            m.id: (
+                other,
+                photos_by_profile.get(other.matchmake_profile.id, []) if hasattr(other, 'matchmake_profile') else [],
+                distance,
+            )
+            for m, other, distance in zip(matches, others, distances)
+        }
+        return super().to_representation(matches)
+
 class MatchSerializer(serializers.ModelSerializer):
     other_user = serializers.SerializerMethodField()
 
     class Meta:
         model = Match
         fields = ('id', 'chat_room', 'created_at', 'other_user')
+        list_serializer_class = MatchListSerializer
 
     def get_other_user(self, obj):
         request = self.context.get('request')
         user = request.user
-        other = obj.user2 if obj.user1 == user else obj.user1
-        
-        distance = None
-        if hasattr(user, 'profile') and hasattr(other, 'profile') and \
-           user.profile.latitude is not None and user.profile.longitude is not None and \
-           other.profile.latitude is not None and other.profile.longitude is not None:
-            try:
-                lat1, lon1 = float(user.profile.latitude), float(user.profile.longitude)
-                lat2, lon2 = float(other.profile.latitude), float(other.profile.longitude)
-                
-                import math
-                R = 6371
-                dlat = math.radians(lat2 - lat1)
-                dlon = math.radians(lon2 - lon1)
-                a = math.sin(dlat / 2) ** 2 + math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(dlon / 2) ** 2
-                c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-                distance = R * c
-            except:
-                pass
-
-        # Get photos
-        photos = []
-        if hasattr(other, 'matchmake_profile'):
-             p_objs = MatchmakePhoto.objects.filter(profile=other.matchmake_profile)
-             photos = MatchmakePhotoSerializer(p_objs, many=True).data
+
+        batch = getattr(self, 'batch', None)
+        if batch and obj.id in batch:
+            other, photo_objs, distance = batch[obj.id]
+        else:
+            other = obj.user2 if obj.user1_id == user.id else obj.user1
+            photo_objs = list(other.matchmake_profile.photos.all()) if hasattr(other, 'matchmake_profile') else []
+            distance = distances_from(getattr(user, 'profile', None), [getattr(other, 'profile', None)])[0]
 
         return {
             'id': other.id,
@@ -147,8 +160,9 @@ class MatchSerializer(serializers.ModelSerializer):
             'first_name': other.first_name,
             'last_name': other.last_name,
             'gender': other.profile.gender if hasattr(other, 'profile') else None,
-            'age': MatchmakeProfileSerializer()._calculate_age(other.profile.dob) if hasattr(other, 'profile') and other.profile.dob else None,
+            'age': calculate_age(other.profile.dob) if hasattr(other, 'profile') else None,
             'avatar': other.profile.avatar.url if hasattr(other, 'profile') and other.profile.avatar else None,
-            'distance': round(distance, 1) if distance is not None else None,
-            'photos': photos
+            'avatar_renditions': rendition_urls(other.profile.avatar_renditions, default_storage, request) if hasattr(other, 'profile') else None,
+            'distance': distance,
+            'photos': MatchmakePhotoSerializer(photo_objs, many=True).data
         }
@@ -0,0 +1,102 @@
+from django.conf import settings
+from django.db import connection, transaction
+from django_q.tasks import async_task
+from chat.models import ChatRoom
+from users import notifications
+from users.models import Notification
+from .models import Swipe, Match
+
+SWIPE_SQL = """
+    WITH upsert AS (
+        INSERT INTO {swipe} (swiper_id, swiped_id, is_like, created_at)
+        SELECT %(swiper)s, id, %(is_like)s, NOW() FROM {user} WHERE id = %(swiped)s
+        ON CONFLICT (swiper_id, swiped_id) DO UPDATE SET is_like = EXCLUDED.is_like
+        RETURNING id, created_at, swiped_id
+    )
+    SELECT
+        upsert.id,
+        upsert.created_at,
+        %(is_like)s AND EXISTS (
+            SELECT 1 FROM {swipe}
+            WHERE swiper_id = %(swiped)s AND swiped_id = %(swiper)s AND is_like
+        ),
+        swiped.username
+    FROM upsert
+    JOIN {user} swiped ON swiped.id = upsert.swiped_id
+"""
+
+
+def record_swipe(swiper, swiped_id, is_like):
+    """
+    Upsert a swipe and, on a mutual like, create the match, its chat room and
+    the match notifications in a single transaction.
+
+    The swipe upsert and the reciprocity check run as one statement. A
+    transaction-scoped advisory lock on the user pair serializes concurrent
+    likes between the same two users, so exactly one of them sees the other
+    and creates the match.
+
+    Returns (swipe, match); match is None unless the swipe completed a match.
+    Raises User.DoesNotExist if the swiped user does not exist.
+    """
+    swiped_id = int(swiped_id)
+    user1_id, user2_id = min(swiper.id, swiped_id), max(swiper.id, swiped_id)
+    sql = SWIPE_SQL.format(
+        swipe=connection.ops.quote_name(Swipe._meta.db_table),
+        user=connection.ops.quote_name(swiper._meta.db_table),
+    )
+
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_advisory_xact_lock(%s, %s)', [user1_id, user2_id])
+            cursor.execute(sql, {'swiper': swiper.id, 'swiped': swiped_id, 'is_like': is_like})
+            row = cursor.fetchone()
+        if row is None:
+            raise swiper.DoesNotExist(f'User {swiped_id} does not exist')
+        swipe_id, created_at, is_match, swiped_username = row
+
+        swipe = Swipe(id=swipe_id, swiper=swiper, swiped_id=swiped_id, is_like=is_like, created_at=created_at)
+        if not is_match:
+            return swipe, None
+
+        match = Match.objects.filter(user1_id=user1_id, user2_id=user2_id).first()
+        if match and match.chat_room_id:
+            return swipe, match
+
+        room = ChatRoom.objects.create(
+            name=f'Match: {swiper.username} & {swiped_username}',
+            module='matchmake'
+        )
+        ChatRoom.participants.through.objects.bulk_create([
+            ChatRoom.participants.through(chatroom_id=room.id, user_id=swiper.id),
+            ChatRoom.participants.through(chatroom_id=room.id, user_id=swiped_id),
+        ])
+        if match:
+            match.chat_room = room
+            match.save(update_fields=['chat_room'])
+        else:
+            match = Match.objects.create(user1_id=user1_id, user2_id=user2_id, chat_room=room)
+
+        notify = [(swiper.id, swiped_username), (swiped_id, swiper.username)]
+        if getattr(settings, 'MATCHMAKE_DEFER_SIDE_EFFECTS', False):
+            transaction.on_commit(
+                lambda: async_task('matchmake.tasks.send_match_notifications', room.id, notify)
+            )
+        else:
+            create_match_notifications(room.id, notify)
+
+    return swipe, match
+
+
+def create_match_notifications(room_id, notify):
+    """Bulk insert one 'match' notification per (user_id, other_username) pair."""
+    notifications.send([
+        Notification(
+            user_id=user_id,
+            type='match',
+            title='New Match!',
+            body=f'You matched with {other_username}!',
+            data={'chat_room_id': room_id}
+        )
+        for user_id, other_username in notify
+    ])
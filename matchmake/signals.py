@@ -1,14 +1,66 @@
-from django.db.models.signals import post_save
+from django.db import models, transaction
+from django.db.models import F, Func, OuterRef, Value
+from django.db.models.signals import post_save, post_delete, m2m_changed
 from django.dispatch import receiver
 from django.contrib.auth.models import User
-from .models import MatchmakeProfile
+from django.contrib.postgres.expressions import ArraySubquery
+from django.contrib.postgres.fields import ArrayField
+from django_q.tasks import async_task
+from users.renditions import needs_renditions, delete_renditions
+from .models import MatchmakeProfile, MatchmakePhoto, Interest
 
-@receiver(post_save, sender=User)
-def create_matchmake_profile(sender, instance, created, **kwargs):
-    if created:
-        MatchmakeProfile.objects.create(user=instance)
+# MatchmakeProfile rows for new users are created by users.provisioning
 
 @receiver(post_save, sender=User)
-def save_matchmake_profile(sender, instance, **kwargs):
-    if hasattr(instance, 'matchmake_profile'):
-        instance.matchmake_profile.save()
+def save_matchmake_profile(sender, instance, created, update_fields=None, **kwargs):
+    # Only re-save a profile that was loaded (and so possibly edited) through this user
+    if created or update_fields is not None:
+        return
+    profile = instance._state.fields_cache.get('matchmake_profile')
+    if profile is not None:
+        profile.save()
+
+def sync_interest_ids(profile_ids):
+    """Rebuild MatchmakeProfile.interest_ids from the M2M table in one UPDATE."""
+    through = MatchmakeProfile.interests.through
+    MatchmakeProfile.objects.filter(pk__in=profile_ids).update(
+        interest_ids=ArraySubquery(
+            through.objects.filter(matchmakeprofile_id=OuterRef('pk'))
+            .order_by('interest_id').values('interest_id')
+        )
+    )
+
+def remove_interest_id(interest_id):
+    MatchmakeProfile.objects.filter(interest_ids__contains=[interest_id]).update(
+        interest_ids=Func(
+            F('interest_ids'), Value(interest_id), function='array_remove',
+            output_field=ArrayField(models.BigIntegerField())
+        )
+    )
+
+@receiver(m2m_changed, sender=MatchmakeProfile.interests.through)
+def update_interest_ids(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        sync_interest_ids([instance.pk])
+    elif action == 'post_clear':
+        # interest.matchmakeprofile_set.clear(): the affected profiles are no longer known
+        remove_interest_id(instance.pk)
+    elif pk_set:
+        sync_interest_ids(pk_set)
+
+@receiver(post_delete, sender=Interest)
+def remove_deleted_interest(sender, instance, **kwargs):
+    # Cascade deletes on the M2M table do not send m2m_changed
+    remove_interest_id(instance.pk)
+
+@receiver(post_save, sender=MatchmakePhoto)
+def queue_photo_renditions(sender, instance, **kwargs):
+    if needs_renditions(instance.image, instance.renditions):
+        transaction.on_commit(lambda: async_task('matchmake.tasks.generate_photo_renditions', instance.id))
+
+@receiver(post_delete, sender=MatchmakePhoto)
+def cleanup_photo_renditions(sender, instance, **kwargs):
+    if instance.renditions:
+        delete_renditions(instance.image.storage, instance.renditions)
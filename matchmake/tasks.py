@@ -0,0 +1,23 @@
+from users.renditions import build_renditions, needs_renditions, store_renditions
+from .models import MatchmakePhoto
+from .services import create_match_notifications
+
+def send_match_notifications(room_id, notify):
+    """
+    Task to create match notifications outside the swipe request.
+    """
+    create_match_notifications(room_id, [tuple(pair) for pair in notify])
+
+def generate_photo_renditions(photo_id):
+    """
+    Task to build the thumbnail/card/full WebP and JPEG renditions of a photo.
+    """
+    photo = MatchmakePhoto.objects.filter(id=photo_id).only('id', 'image', 'renditions').first()
+    if not photo or not needs_renditions(photo.image, photo.renditions):
+        return
+    renditions = build_renditions(photo.image)
+    # Only record them if the image wasn't replaced while we were working
+    store_renditions(
+        MatchmakePhoto.objects.filter(id=photo_id, image=photo.image.name), 'renditions',
+        photo.image.storage, renditions, previous=photo.renditions,
+    )
@@ -1,3 +1,381 @@
-from django.test import TestCase
+import shutil
+import tempfile
+import threading
+from datetime import date, timedelta
+from io import BytesIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import SimpleTestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APITestCase
+from rest_framework import status
+from chat.models import ChatRoom
+from users import heartbeat
+from users.models import Profile, Notification
+from users.renditions import build_renditions
+from PIL import Image
+from .models import MatchmakeProfile, MatchmakePhoto, Interest, Swipe, Match
+from .services import record_swipe
+from .scoring import CandidatePool, Viewer, score_pool, top_k
+from .serializers import MatchmakePhotoSerializer
+from .tasks import generate_photo_renditions
+from .utils import calculate_age, haversine_km
+
+
+class DiscoveryPaginationTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='viewer', password='password')
+        self.client.force_authenticate(user=self.user)
+        now = timezone.now()
+        self.others = []
+        for i in range(5):
+            other = User.objects.create_user(username=f'other{i}', password='password')
+            Profile.objects.filter(user=other).update(last_active=now - timedelta(hours=i))
+            self.others.append(other)
+
+    def test_pages_follow_cursor_without_count(self):
+        response = self.client.get('/api/matchmake/discovery/?page_size=2')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn('count', response.data)
+        first_ids = [p['user_details']['id'] for p in response.data['results']]
+        self.assertEqual(first_ids, [self.others[0].id, self.others[1].id])
+
+        # Swiping the first page away must not shift the next page
+        for other_id in first_ids:
+            Swipe.objects.create(swiper=self.user, swiped_id=other_id, is_like=False)
+
+        response = self.client.get(response.data['next'])
+        second_ids = [p['user_details']['id'] for p in response.data['results']]
+        self.assertEqual(second_ids, [self.others[2].id, self.others[3].id])
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/matchmake/discovery/?cursor=not-a-cursor')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_compatibility_pages_keep_the_first_ranking(self):
+        cache.clear()
+        response = self.client.get('/api/matchmake/discovery/?sort_by=compatibility&page_size=2')
+        seen = [p['user_details']['id'] for p in response.data['results']]
+
+        # Activity between pages changes the recency scores
+        Profile.objects.filter(user_id__in=[o.id for o in self.others]).update(last_active=timezone.now())
+        url = response.data['next']
+        while url:
+            response = self.client.get(url)
+            seen += [p['user_details']['id'] for p in response.data['results']]
+            url = response.data['next']
+        self.assertCountEqual(seen, [o.id for o in self.others])
+
+
+class LikedPaginationTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='liker', password='password')
+        self.client.force_authenticate(user=self.user)
+        self.liked = [User.objects.create_user(username=f'liked{i}', password='password') for i in range(3)]
+        for other in self.liked:
+            Swipe.objects.create(swiper=self.user, swiped=other, is_like=True)
+
+    def test_liked_is_paginated_most_recent_first(self):
+        response = self.client.get('/api/matchmake/swipes/liked/?page_size=2')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        ids = [p['user_details']['id'] for p in response.data['results']]
+        self.assertEqual(ids, [self.liked[2].id, self.liked[1].id])
+
+        response = self.client.get(response.data['next'])
+        ids = [p['user_details']['id'] for p in response.data['results']]
+        self.assertEqual(ids, [self.liked[0].id])
+        self.assertIsNone(response.data['next'])
+
+
+class AttributeFilterTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='viewer', password='password')
+        self.client.force_authenticate(user=self.user)
+        self.polyglot = User.objects.create_user(username='polyglot', password='password')
+        profile = self.polyglot.matchmake_profile
+        profile.languages_spoken = 'English, French / Spanish'
+        profile.pets = 'Dog'
+        profile.religion = 'Buddhist'
+        profile.save()
+        User.objects.create_user(username='mono', password='password')
+
+    def test_languages_and_free_text_filters(self):
+        response = self.client.get('/api/matchmake/discovery/?languages=french')
+        ids = [p['user_details']['id'] for p in response.data['results']]
+        self.assertEqual(ids, [self.polyglot.id])
+
+        response = self.client.get('/api/matchmake/discovery/?religion=buddh&pets=dog')
+        ids = [p['user_details']['id'] for p in response.data['results']]
+        self.assertEqual(ids, [self.polyglot.id])
+
+    def test_languages_and_pets_match_substrings(self):
+        response = self.client.get('/api/matchmake/discovery/?languages=eng&pets=do')
+        ids = [p['user_details']['id'] for p in response.data['results']]
+        self.assertEqual(ids, [self.polyglot.id])
+
+
+class SwipeMatchTest(APITestCase):
+    def setUp(self):
+        self.user1 = User.objects.create_user(username='alice', password='password')
+        self.user2 = User.objects.create_user(username='bob', password='password')
+        self.client.force_authenticate(user=self.user1)
+
+    def test_mutual_like_creates_match_room_and_notifications(self):
+        Swipe.objects.create(swiper=self.user2, swiped=self.user1, is_like=True)
+        response = self.client.post('/api/matchmake/swipes/', {'swiped': self.user2.id, 'is_like': True}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        match = Match.objects.get(user1=self.user1, user2=self.user2)
+        self.assertEqual(response.data['match_id'], match.id)
+        self.assertEqual(response.data['chat_room'], match.chat_room_id)
+        self.assertEqual(set(match.chat_room.participants.values_list('id', flat=True)), {self.user1.id, self.user2.id})
+        self.assertEqual(Notification.objects.filter(type='match').count(), 2)
+
+    def test_swipe_is_upserted(self):
+        self.client.post('/api/matchmake/swipes/', {'swiped': self.user2.id, 'is_like': True}, format='json')
+        response = self.client.post('/api/matchmake/swipes/', {'swiped': self.user2.id, 'is_like': False}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertFalse(response.data['is_like'])
+        self.assertEqual(Swipe.objects.filter(swiper=self.user1).count(), 1)
+        self.assertFalse(Match.objects.exists())
+
+    def test_unknown_user(self):
+        response = self.client.post('/api/matchmake/swipes/', {'swiped': 999999, 'is_like': True}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class SwipeConcurrencyTest(TransactionTestCase):
+    """Stress concurrent mutual likes: every pair must end with exactly one match and room."""
+    pairs = 10
+    rounds = 3
+
+    def test_concurrent_mutual_likes(self):
+        users = [User.objects.create_user(username=f'racer{i}', password='password') for i in range(self.pairs * 2)]
+        pairs = [(users[i], users[i + 1]) for i in range(0, len(users), 2)]
+        errors = []
+
+        def like(swiper, swiped, barrier):
+            try:
+                barrier.wait()
+                record_swipe(swiper, swiped.id, True)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        for _ in range(self.rounds):
+            barrier = threading.Barrier(len(pairs) * 2)
+            threads = []
+            for a, b in pairs:
+                threads.append(threading.Thread(target=like, args=(a, b, barrier)))
+                threads.append(threading.Thread(target=like, args=(b, a, barrier)))
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(Match.objects.count(), len(pairs))
+        self.assertEqual(Match.objects.filter(chat_room__isnull=True).count(), 0)
+        self.assertEqual(ChatRoom.objects.filter(module='matchmake').count(), len(pairs))
+        self.assertEqual(Notification.objects.filter(type='match').count(), len(pairs) * 2)
+
+
+class CompatibilityScoringTest(SimpleTestCase):
+    def test_closer_better_matching_candidate_ranks_first(self):
+        today = date(2026, 1, 1)
+        now = timezone.now()
+        viewer = Viewer(
+            min_age=25, max_age=35, height=170, latitude=51.5, longitude=-0.12,
+            lifestyle={'smoking': 'Never', 'drinking': 'Socially'},
+            interest_ids=[1, 2, 3], today=today,
+        )
+        rows = [
+            # id, dob, lat, lng, height, last_active, smoking, drinking, exercise, goal, interests
+            (1, date(1996, 1, 1), 51.5, -0.12, 172, now, 'Never', 'Socially', None, None, [1, 2, 3]),
+            (2, date(1970, 1, 1), 53.4, -2.98, 195, now - timedelta(days=30), 'Regularly', 'Regularly', None, None, [4]),
+            (3, None, None, None, None, None, None, None, None, None, []),
+        ]
+        pool = CandidatePool.from_rows(rows, viewer)
+        scores = score_pool(pool, viewer, now=now.timestamp())
+        ranked = top_k(pool, scores, 2)
+        self.assertEqual([pk for pk, _ in ranked], [1, 3])
+        self.assertTrue(all(0 <= score <= 1 for score in scores))
+
+    def test_weights_change_ranking(self):
+        viewer = Viewer(interest_ids=[1], weights={'age': 0, 'distance': 0, 'height': 0, 'lifestyle': 0, 'interests': 1, 'recency': 0})
+        rows = [
+            (1, None, None, None, None, None, None, None, None, None, []),
+            (2, None, None, None, None, None, None, None, None, None, [1]),
+        ]
+        pool = CandidatePool.from_rows(rows, viewer)
+        self.assertEqual(top_k(pool, score_pool(pool, viewer), 1)[0][0], 2)
+
+
+class InterestArrayTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='viewer', password='password')
+        self.client.force_authenticate(user=self.user)
+        self.hiking, self.music, self.chess = [Interest.objects.create(name=n) for n in ('Hiking', 'Music', 'Chess')]
+        self.both = User.objects.create_user(username='both', password='password')
+        self.both.matchmake_profile.interests.add(self.hiking, self.music)
+        self.one = User.objects.create_user(username='one', password='password')
+        self.one.matchmake_profile.interests.add(self.music)
+
+    def test_interest_ids_follow_m2m_changes(self):
+        profile = MatchmakeProfile.objects.get(user=self.both)
+        self.assertEqual(profile.interest_ids, sorted([self.hiking.id, self.music.id]))
+        profile.interests.remove(self.hiking)
+        profile.refresh_from_db()
+        self.assertEqual(profile.interest_ids, [self.music.id])
+        self.music.delete()
+        profile.refresh_from_db()
+        self.assertEqual(profile.interest_ids, [])
+
+    def test_any_all_and_overlap_sort(self):
+        url = '/api/matchmake/discovery/'
+        response = self.client.get(url, {'interests': [self.hiking.id, self.music.id], 'sort_by': 'interests'})
+        ids = [p['user_details']['id'] for p in response.data['results']]
+        self.assertEqual(ids, [self.both.id, self.one.id])
+
+        response = self.client.get(url, {'interests_all': [self.hiking.id, self.music.id]})
+        ids = [p['user_details']['id'] for p in response.data['results']]
+        self.assertEqual(ids, [self.both.id])
+
+        response = self.client.get(url, {'interests': self.chess.id})
+        self.assertEqual(response.data['results'], [])
+
+
+class PhotoRenditionTest(APITestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.override = override_settings(MEDIA_ROOT=self.media_root)
+        self.override.enable()
+        self.user = User.objects.create_user(username='photographer', password='password')
+
+    def tearDown(self):
+        self.override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def test_renditions_are_generated_and_exposed(self):
+        buffer = BytesIO()
+        Image.new('RGB', (2000, 1000), 'blue').save(buffer, format='PNG')
+        photo = MatchmakePhoto.objects.create(
+            profile=self.user.matchmake_profile,
+            image=SimpleUploadedFile('big.png', buffer.getvalue(), content_type='image/png')
+        )
+        self.assertEqual(photo.renditions, {})
+
+        generate_photo_renditions(photo.id)
+        photo.refresh_from_db()
+        self.assertEqual(photo.renditions['source'], photo.image.name)
+        self.assertEqual(photo.renditions['sizes']['thumb']['width'], 160)
+        self.assertEqual(photo.renditions['sizes']['full']['width'], 1280)
+
+        data = MatchmakePhotoSerializer(photo).data
+        self.assertTrue(data['renditions']['card']['webp'].endswith('.webp'))
+        self.assertIn(' 640w', data['renditions']['srcset']['jpeg'])
+
+    def test_renditions_of_a_replaced_image_are_discarded(self):
+        buffer = BytesIO()
+        Image.new('RGB', (800, 600), 'red').save(buffer, format='PNG')
+        photo = MatchmakePhoto.objects.create(
+            profile=self.user.matchmake_profile,
+            image=SimpleUploadedFile('first.png', buffer.getvalue(), content_type='image/png')
+        )
+        built = []
+
+        def build_then_replace(field_file):
+            built.append(build_renditions(field_file))
+            MatchmakePhoto.objects.filter(id=photo.id).update(image='matchmake_photos/second.png')
+            return built[-1]
+
+        with mock.patch('matchmake.tasks.build_renditions', build_then_replace):
+            generate_photo_renditions(photo.id)
+        photo.refresh_from_db()
+        self.assertEqual(photo.renditions, {})
+        names = [entry['webp'] for entry in built[0]['sizes'].values()]
+        self.assertFalse([name for name in names if photo.image.storage.exists(name)])
+
+
+@override_settings(HEARTBEAT_FLUSH_INTERVAL=3600)
+class MatchListQueryTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='popular', password='password')
+        Profile.objects.filter(user=self.user).update(latitude=51.5074, longitude=-0.1278)
+        self.client.force_authenticate(user=self.user)
+
+    def add_matches(self, count):
+        for _ in range(count):
+            other = User.objects.create_user(username=f'match{Match.objects.count()}', password='password')
+            Profile.objects.filter(user=other).update(latitude=53.4808, longitude=-2.2426, dob=date(1990, 6, 1))
+            MatchmakePhoto.objects.create(profile=other.matchmake_profile, image='matchmake_photos/x.jpg')
+            Match.objects.create(user1=self.user, user2=other)
+
+    def count_queries(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/api/matchmake/matches/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return len(ctx.captured_queries), response
+
+    def test_query_count_does_not_grow_with_matches(self):
+        self.add_matches(2)
+        few, _ = self.count_queries()
+        self.add_matches(6)
+        many, response = self.count_queries()
+        self.assertEqual(few, many)
+
+        other = response.data['results'][0]['other_user']
+        self.assertEqual(len(other['photos']), 1)
+        self.assertAlmostEqual(other['distance'], 262.5, delta=1.0)
+        self.assertEqual(other['age'], calculate_age(date(1990, 6, 1)))
+
+    def test_haversine_broadcasts(self):
+        km = haversine_km(51.5074, -0.1278, [51.5074, 53.4808], [-0.1278, -2.2426])
+        self.assertAlmostEqual(float(km[0]), 0.0)
+        self.assertAlmostEqual(float(km[1]), 262.5, delta=1.0)
+
+
+class HeartbeatTest(APITestCase):
+    def setUp(self):
+        heartbeat.flush()
+        self.user = User.objects.create_user(username='viewer', password='password')
+        self.other = User.objects.create_user(username='other', password='password')
+        Profile.objects.filter(user=self.other).update(last_active=timezone.now() - timedelta(days=3))
+        self.client.force_authenticate(user=self.user)
+
+    @override_settings(HEARTBEAT_FLUSH_INTERVAL=3600)
+    def test_requests_do_not_write_last_active(self):
+        self.client.get('/api/matchmake/discovery/')
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get('/api/matchmake/discovery/')
+        self.assertFalse([q for q in ctx.captured_queries if q['sql'].startswith('UPDATE')])
+        self.assertIsNone(Profile.objects.get(user=self.user).last_active)
+        self.assertIn(self.user.id, heartbeat.pending())
+
+    def test_flush_coalesces_and_never_goes_backwards(self):
+        now = timezone.now()
+        heartbeat.touch(self.other.id, now - timedelta(minutes=5))
+        heartbeat.touch(self.other.id, now)
+        heartbeat.touch(self.other.id, now - timedelta(minutes=1))
+        heartbeat.touch(self.user.id, now)
+        self.assertEqual(heartbeat.flush(), 2)
+        self.assertEqual(Profile.objects.get(user=self.other).last_active, now)
+
+        heartbeat.touch(self.other.id, now - timedelta(hours=1))
+        heartbeat.flush()
+        self.assertEqual(Profile.objects.get(user=self.other).last_active, now)
+
+    @override_settings(HEARTBEAT_FLUSH_INTERVAL=3600)
+    def test_active_status_sees_buffered_heartbeats(self):
+        response = self.client.get('/api/matchmake/discovery/?active_status=day')
+        self.assertEqual(response.data['results'], [])
+
+        heartbeat.touch(self.other.id)
+        response = self.client.get('/api/matchmake/discovery/?active_status=day')
+        self.assertEqual([p['user_details']['id'] for p in response.data['results']], [self.other.id])
+        self.assertIsNotNone(response.data['results'][0]['user_details']['last_active'])
@@ -0,0 +1,37 @@
+from datetime import date
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0
+
+
+def calculate_age(dob, today=None):
+    """Age in whole years on `today` (defaults to the current date)."""
+    if not dob:
+        return None
+    today = today or date.today()
+    return today.year - dob.year - ((today.month, today.day) < (dob.month, dob.day))
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """
+    Great-circle distance in kilometres. Accepts scalars or NumPy arrays
+    (broadcast against each other); missing coordinates should be NaN.
+    """
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(v, dtype=np.float64)) for v in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+def distances_from(origin, profiles):
+    """
+    Distances in km (rounded to 0.1) from `origin` to each of `profiles`, any
+    of which may be None or lack coordinates; those come back as None.
+    """
+    if not profiles:
+        return []
+    if origin is None or origin.latitude is None or origin.longitude is None:
+        return [None] * len(profiles)
+    lats = np.array([float(p.latitude) if p is not None and p.latitude is not None else np.nan for p in profiles])
+    lngs = np.array([float(p.longitude) if p is not None and p.longitude is not None else np.nan for p in profiles])
+    km = haversine_km(float(origin.latitude), float(origin.longitude), lats, lngs)
+    return [None if np.isnan(d) else round(float(d), 1) for d in km]
@@ -1,15 +1,28 @@
+import hashlib
+import json
+from django.conf import settings
 from django.contrib.auth.models import User
+from django.core.cache import cache
 from rest_framework import viewsets, status, permissions
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from django.db.models import Q
+from django.db.models import Q, F, Case, When, Value, FloatField, BigIntegerField
+from django.contrib.postgres.fields import ArrayField
 from django.shortcuts import get_object_or_404
-from .models import MatchmakeProfile, Interest, MatchmakePhoto, Swipe, Match
+from .models import (
+    MatchmakeProfile, Interest, MatchmakePhoto, Swipe, Match, ArrayOverlapCount
+)
 from .serializers import (
     MatchmakeProfileSerializer, InterestSerializer, MatchmakePhotoSerializer,
     SwipeSerializer, MatchSerializer
 )
-from chat.models import ChatRoom
+from users import heartbeat
+from .pagination import KeysetPagination
+from .services import record_swipe
+from .scoring import rank_candidates
+
+SCORING_TOP_K = 200
+RANKING_CACHE_KEY = 'discovery_ranking:{}:{}'
 
 class InterestViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = Interest.objects.all()
@@ -42,18 +55,19 @@ class MatchmakeProfileViewSet(viewsets.ModelViewSet):
 class DiscoveryViewSet(viewsets.ReadOnlyModelViewSet):
     serializer_class = MatchmakeProfileSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = KeysetPagination
 
     def get_queryset(self):
         user = self.request.user
         profile = getattr(user, 'matchmake_profile', None)
         
         # Update last active
-        if hasattr(user, 'profile'):
-            user.profile.update_last_active()
+        heartbeat.touch(user.id)
 
         # Exclude self and already swiped users
         swiped_ids = Swipe.objects.filter(swiper=user).values_list('swiped_id', flat=True)
-        queryset = MatchmakeProfile.objects.exclude(user=user).exclude(user_id__in=swiped_ids)
+        queryset = MatchmakeProfile.objects.exclude(user=user).exclude(user_id__in=swiped_ids) \
+            .select_related('user__profile', 'user__verification_profile')
         
         # Query parameters
         params = self.request.query_params
@@ -106,6 +120,8 @@ class DiscoveryViewSet(viewsets.ReadOnlyModelViewSet):
             except (ValueError, TypeError): pass
 
         # Advanced Filters
+        # Free-text icontains filters are served by the pg_trgm indexes on the
+        # profile table.
         if intentions: queryset = queryset.filter(relationship_goal__in=intentions)
         if height_min: queryset = queryset.filter(height__gte=height_min)
         if height_max: queryset = queryset.filter(height__lte=height_max)
@@ -122,8 +138,16 @@ class DiscoveryViewSet(viewsets.ReadOnlyModelViewSet):
         if pets: queryset = queryset.filter(pets__icontains=pets)
         if profession: queryset = queryset.filter(profession__icontains=profession)
         
+        # Interests use the denormalized interest_ids array (GIN indexed)
+        interest_ids = self._int_list(interest_ids)
+        interests_all = self._int_list(params.getlist('interests_all'))
         if interest_ids:
-            queryset = queryset.filter(interests__id__in=interest_ids).distinct()
+            queryset = queryset.filter(interest_ids__overlap=interest_ids)
+        if interests_all:
+            queryset = queryset.filter(interest_ids__contains=interests_all)
+        shared_with = interest_ids + interests_all
+        if not shared_with and profile:
+            shared_with = list(profile.interest_ids)
 
         # Verification Level
         if verification_level:
@@ -140,12 +164,15 @@ class DiscoveryViewSet(viewsets.ReadOnlyModelViewSet):
         # Active Status
         if active_status:
             now = timezone.now()
-            if active_status == 'day':
-                queryset = queryset.filter(user__profile__last_active__gte=now - timedelta(days=1))
-            elif active_status == 'week':
-                queryset = queryset.filter(user__profile__last_active__gte=now - timedelta(weeks=1))
-            elif active_status == 'month':
-                queryset = queryset.filter(user__profile__last_active__gte=now - timedelta(days=30))
+            windows = {'day': timedelta(days=1), 'week': timedelta(weeks=1), 'month': timedelta(days=30)}
+            if active_status in windows:
+                cutoff = now - windows[active_status]
+                # Include heartbeats still buffered in users.heartbeat
+                active = Q(user__profile__last_active__gte=cutoff)
+                buffered = heartbeat.active_since(cutoff)
+                if buffered:
+                    active |= Q(user_id__in=buffered)
+                queryset = queryset.filter(active)
 
         # Distance Filtering
         max_dist = params.get('max_distance') or (profile.pref_max_distance if profile else None)
@@ -171,14 +198,32 @@ class DiscoveryViewSet(viewsets.ReadOnlyModelViewSet):
             
         ordering = []
         for s in sort_params:
-            if s == 'recent':
+            if s == 'compatibility' and profile:
+                # Score the most recently active candidates and keep the top-K
+                pool = queryset.order_by(F('user__profile__last_active').desc(nulls_last=True))
+                ranked = self._ranking(pool, profile)
+                queryset = queryset.filter(id__in=[pk for pk, _ in ranked]).annotate(
+                    compatibility=Case(
+                        *[When(id=pk, then=Value(score)) for pk, score in ranked],
+                        default=Value(0.0),
+                        output_field=FloatField()
+                    )
+                )
+                ordering.append('-compatibility')
+            elif s == 'interests' and shared_with:
+                queryset = queryset.annotate(
+                    interest_overlap=ArrayOverlapCount(
+                        F('interest_ids'), Value(shared_with, output_field=ArrayField(BigIntegerField()))
+                    )
+                )
+                ordering.append('-interest_overlap')
+            elif s == 'recent':
                 ordering.append('-user__profile__last_active')
             elif s == 'age_asc':
                 ordering.append('-user__profile__dob')
             elif s == 'age_desc':
                 ordering.append('user__profile__dob')
             elif s == 'distance' and hasattr(user, 'profile') and user.profile.latitude and user.profile.longitude:
-                from django.db.models import F
                 from django.db.models.functions import Abs
                 queryset = queryset.annotate(
                     dist_approx=Abs(F('user__profile__latitude') - user.profile.latitude) + 
@@ -196,6 +241,38 @@ class DiscoveryViewSet(viewsets.ReadOnlyModelViewSet):
             
         return queryset
 
+    def _ranking(self, pool, profile):
+        """
+        The compatibility top-K for this viewer and set of filters. Scores
+        depend on the current time and on who was active most recently, so
+        the first page ranks afresh and pages reached through a cursor reuse
+        that ranking; otherwise keyset comparisons on the scores would skip
+        or repeat profiles.
+        """
+        params = sorted(
+            (key, values) for key, values in self.request.query_params.lists()
+            if key not in ('cursor', 'page_size')
+        )
+        digest = hashlib.md5(json.dumps(params).encode()).hexdigest()
+        key = RANKING_CACHE_KEY.format(profile.id, digest)
+        if self.request.query_params.get('cursor'):
+            ranked = cache.get(key)
+            if ranked is not None:
+                return ranked
+        ranked = rank_candidates(pool, profile, k=SCORING_TOP_K)
+        cache.set(key, ranked, getattr(settings, 'DISCOVERY_RANKING_TIMEOUT', 900))
+        return ranked
+
+    def _int_list(self, values):
+        ids = []
+        for value in values:
+            for part in str(value).split(','):
+                try:
+                    ids.append(int(part))
+                except ValueError:
+                    pass
+        return ids
+
     @action(detail=False, methods=['post'])
     def reset(self, request):
         # Only delete swipes where is_like=False to avoid removing matches or showing matched users again
@@ -216,76 +293,27 @@ class SwipeViewSet(viewsets.ModelViewSet):
         if not swiped_id:
             return Response({'error': 'swiped user id required'}, status=status.HTTP_400_BAD_REQUEST)
         
-        # Use update_or_create directly in the view for absolute reliability
-        swipe, created = Swipe.objects.update_or_create(
-            swiper=request.user,
-            swiped_id=swiped_id,
-            defaults={'is_like': is_like}
-        )
+        try:
+            swipe, match = record_swipe(request.user, swiped_id, is_like)
+        except (ValueError, User.DoesNotExist):
+            return Response({'error': 'swiped user not found'}, status=status.HTTP_400_BAD_REQUEST)
         
         serializer = self.get_serializer(swipe)
         response_data = serializer.data
         
-        # Check for matching swipe
-        if is_like:
-            matching_swipe = Swipe.objects.filter(
-                swiper_id=swiped_id,
-                swiped=request.user,
-                is_like=True
-            ).first()
-            
-            if matching_swipe:
-                # CREATED A MATCH!
-                match, m_created = Match.objects.get_or_create(
-                    user1_id=min(request.user.id, int(swiped_id)),
-                    user2_id=max(request.user.id, int(swiped_id))
-                )
-                
-                if not match.chat_room:
-                    # Create a ChatRoom
-                    swiped_user = User.objects.get(id=swiped_id)
-                    room = ChatRoom.objects.create(
-                        name=f'Match: {request.user.username} & {swiped_user.username}',
-                        module='matchmake'
-                    )
-                    room.participants.add(request.user, swiped_user)
-                    match.chat_room = room
-                    match.save()
-                    
-                    # Create Notifications
-                    from users.models import Notification
-                    Notification.objects.create(
-                        user=request.user,
-                        type='match',
-                        title='New Match!',
-                        body=f'You matched with {swiped_user.username}!',
-                        data={'chat_room_id': room.id}
-                    )
-                    Notification.objects.create(
-                        user=swiped_user,
-                        type='match',
-                        title='New Match!',
-                        body=f'You matched with {request.user.username}!',
-                        data={'chat_room_id': room.id}
-                    )
-                
-                if match.chat_room:
-                    response_data['chat_room'] = match.chat_room.id
-                    response_data['match_id'] = match.id
+        if match and match.chat_room_id:
+            response_data['chat_room'] = match.chat_room_id
+            response_data['match_id'] = match.id
         
         return Response(response_data, status=status.HTTP_201_CREATED)
 
-    @action(detail=False, methods=['get'])
+    @action(detail=False, methods=['get'], pagination_class=KeysetPagination)
     def liked(self, request):
-        """Returns users the current user has liked."""
-        swipes = Swipe.objects.filter(swiper=request.user, is_like=True)
-        # Get profiles of swiped users
-        swiped_user_ids = swipes.values_list('swiped_id', flat=True)
-        profiles = MatchmakeProfile.objects.filter(user_id__in=swiped_user_ids)
-        serializer = MatchmakeProfileSerializer(profiles, many=True, context={'request': request})
-        return Response(serializer.data)
+        """Returns users the current user has liked, most recent first."""
+        swipes = Swipe.objects.filter(swiper=request.user, is_like=True).order_by('-created_at')
+        return self._paginated_profiles(swipes, 'swiped_id')
 
-    @action(detail=False, methods=['get'])
+    @action(detail=False, methods=['get'], pagination_class=KeysetPagination)
     def liked_me(self, request):
         """Returns users who have liked the current user but aren't matched yet."""
         # Swipes where current user is the 'swiped' and is_like=True
@@ -303,10 +331,22 @@ class SwipeViewSet(viewsets.ModelViewSet):
             matched_ids.add(u2)
         matched_ids.discard(request.user.id)
         
-        swiper_ids = liked_me_swipes.exclude(swiper_id__in=matched_ids).values_list('swiper_id', flat=True)
-        profiles = MatchmakeProfile.objects.filter(user_id__in=swiper_ids)
-        serializer = MatchmakeProfileSerializer(profiles, many=True, context={'request': request})
-        return Response(serializer.data)
+        swipes = liked_me_swipes.exclude(swiper_id__in=matched_ids).order_by('-created_at')
+        return self._paginated_profiles(swipes, 'swiper_id')
+
+    def _paginated_profiles(self, swipes, user_field):
+        """
+        Paginate the swipe rows themselves (keyed on created_at, id) and
+        return the matching profiles in the same order.
+        """
+        page = self.paginate_queryset(swipes)
+        user_ids = [getattr(swipe, user_field) for swipe in page]
+        profiles = MatchmakeProfile.objects.filter(user_id__in=user_ids) \
+            .select_related('user__profile', 'user__verification_profile')
+        by_user = {p.user_id: p for p in profiles}
+        ordered = [by_user[uid] for uid in user_ids if uid in by_user]
+        serializer = MatchmakeProfileSerializer(ordered, many=True, context={'request': self.request})
+        return self.get_paginated_response(serializer.data)
 
     @action(detail=False, methods=['post'])
     def unlike(self, request):
@@ -342,7 +382,10 @@ class MatchViewSet(viewsets.ReadOnlyModelViewSet):
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
-        return Match.objects.filter(Q(user1=self.request.user) | Q(user2=self.request.user))
+        # Both sides with their profiles in the same query; photos are batched by MatchListSerializer
+        return Match.objects.filter(Q(user1=self.request.user) | Q(user2=self.request.user)).select_related(
+            'user1__profile', 'user1__matchmake_profile', 'user2__profile', 'user2__matchmake_profile'
+        ).order_by('-created_at')
 
 class MatchmakePhotoViewSet(viewsets.ModelViewSet):
     serializer_class = MatchmakePhotoSerializer
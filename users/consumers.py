@@ -0,0 +1,36 @@
+import json
+from channels.db import database_sync_to_async
+from channels.generic.websocket import AsyncWebsocketConsumer
+from . import notifications
+
+
+class NotificationConsumer(AsyncWebsocketConsumer):
+    """
+    Pushes the signed-in user's unread count (and new notifications) as
+    they change, so clients don't poll for badges. Sends
+    {"type": "unread", "unread_count": n} on connect, then
+    {"type": "notifications", "unread_count": n, "notifications": [...]}
+    from users.notifications.push.
+    """
+
+    async def connect(self):
+        self.user = self.scope.get('user')
+        if self.user is None or not self.user.is_authenticated:
+            await self.close(code=4001)
+            return
+        self.group_name = notifications.group_name(self.user.id)
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        await self.accept()
+        count = await database_sync_to_async(notifications.unread_count)(self.user.id)
+        await self.send(text_data=json.dumps({'type': 'unread', 'unread_count': count}))
+
+    async def disconnect(self, close_code):
+        if hasattr(self, 'group_name'):
+            await self.channel_layer.group_discard(self.group_name, self.channel_name)
+
+    async def notifications_changed(self, event):
+        await self.send(text_data=json.dumps({
+            'type': 'notifications',
+            'unread_count': event['unread_count'],
+            'notifications': event['notifications'],
+        }))
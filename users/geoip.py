@@ -0,0 +1,108 @@
+"""
+Per-process GeoIP lookups and cached verification flags for the middleware.
+
+The MaxMind reader is opened once per process, country results are kept in
+a bounded LRU keyed by IP, and each user's verification flags are cached
+(and memoized on the user object) until their VerificationProfile is saved.
+
+Invalidating the flags only reaches other processes through a shared cache,
+so they are cached across requests only with CACHE_REDIS_URL set (see
+VERIFICATION_FLAGS_CACHE_TIMEOUT); otherwise each request reads them once.
+"""
+import logging
+import threading
+from collections import OrderedDict
+from django.conf import settings
+from django.core.cache import cache
+from .models import VerificationProfile
+
+logger = logging.getLogger(__name__)
+
+FLAG_FIELDS = ('v1_email', 'v2_phone', 'v3_location', 'v4_gender', 'v5_age')
+FLAGS_CACHE_KEY = 'verification_flags:{}'
+
+_reader = None
+_reader_lock = threading.Lock()
+_reader_failed = False
+
+_countries = OrderedDict()  # ip -> country code (or None)
+_countries_lock = threading.Lock()
+
+_stats = {
+    'ip_hits': 0, 'ip_misses': 0,
+    'flag_hits': 0, 'flag_misses': 0,
+}
+
+
+def get_reader():
+    """The process-wide GeoIP2 reader, or None if the database can't be opened."""
+    global _reader, _reader_failed
+    if _reader is None and not _reader_failed:
+        with _reader_lock:
+            if _reader is None and not _reader_failed:
+                try:
+                    from django.contrib.gis.geoip2 import GeoIP2
+                    _reader = GeoIP2()
+                except Exception as e:
+                    _reader_failed = True
+                    logger.warning(f"GeoIP2 database unavailable: {e}")
+    return _reader
+
+
+def country_for_ip(ip):
+    """Country code for `ip`, served from the LRU when possible."""
+    with _countries_lock:
+        if ip in _countries:
+            _countries.move_to_end(ip)
+            _stats['ip_hits'] += 1
+            return _countries[ip]
+        _stats['ip_misses'] += 1
+
+    reader = get_reader()
+    code = None
+    if reader is not None:
+        try:
+            code = reader.country(ip).get('country_code')
+        except Exception:
+            code = None  # private/unknown addresses
+
+    with _countries_lock:
+        _countries[ip] = code
+        _countries.move_to_end(ip)
+        while len(_countries) > getattr(settings, 'GEOIP_CACHE_SIZE', 10000):
+            _countries.popitem(last=False)
+    return code
+
+
+def verification_flags(user):
+    """
+    The user's v1-v5 verification flags, memoized on `user` for the request
+    and cached across requests until the VerificationProfile changes.
+    """
+    flags = getattr(user, '_verification_flags', None)
+    if flags is not None:
+        return flags
+
+    key = FLAGS_CACHE_KEY.format(user.pk)
+    timeout = getattr(settings, 'VERIFICATION_FLAGS_CACHE_TIMEOUT', 0)
+    flags = cache.get(key) if timeout > 0 else None
+    if flags is None:
+        _stats['flag_misses'] += 1
+        flags = VerificationProfile.objects.filter(user_id=user.pk).values(*FLAG_FIELDS).first() \
+            or dict.fromkeys(FLAG_FIELDS, False)
+        if timeout > 0:
+            cache.set(key, flags, timeout)
+    else:
+        _stats['flag_hits'] += 1
+    user._verification_flags = flags
+    return flags
+
+
+def invalidate_flags(user_id):
+    cache.delete(FLAGS_CACHE_KEY.format(user_id))
+
+
+def stats():
+    """Hit/miss counters for this process."""
+    with _countries_lock:
+        return {**_stats, 'ip_cache_size': len(_countries), 'reader_loaded': _reader is not None}
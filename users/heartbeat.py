@@ -0,0 +1,125 @@
+"""
+Write-behind buffer for Profile.last_active.
+
+Every authenticated request used to issue its own UPDATE users_profile.
+Heartbeats are now coalesced per user in process memory and written in
+one UPDATE ... FROM (VALUES ...) once HEARTBEAT_FLUSH_INTERVAL seconds
+have passed (or HEARTBEAT_MAX_PENDING users are waiting), piggybacked on
+whichever request crosses the threshold. Anything still buffered is
+flushed at interpreter exit.
+
+Readers that need an exact value (active_status filtering, the
+last_active shown on profiles) merge `pending()` / `last_active()` with
+the stored column. Values buffered by other worker processes are at most
+one flush interval behind.
+"""
+import atexit
+import logging
+import threading
+import time
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from .models import Profile
+
+logger = logging.getLogger(__name__)
+
+FLUSH_CHUNK = 1000
+
+_lock = threading.Lock()
+_flush_lock = threading.Lock()
+_pending = {}  # user_id -> datetime
+_last_flush = time.monotonic()
+
+
+def _interval():
+    return getattr(settings, 'HEARTBEAT_FLUSH_INTERVAL', 30)
+
+
+def _max_pending():
+    return getattr(settings, 'HEARTBEAT_MAX_PENDING', 5000)
+
+
+def touch(user_id, when=None):
+    """Record activity for `user_id`; flushes the buffer when it is due."""
+    when = when or timezone.now()
+    with _lock:
+        current = _pending.get(user_id)
+        if current is None or when > current:
+            _pending[user_id] = when
+        due = len(_pending) >= _max_pending() or time.monotonic() - _last_flush >= _interval()
+    if due:
+        flush()
+
+
+def pending():
+    """Snapshot of buffered heartbeats that have not reached the database yet."""
+    with _lock:
+        return dict(_pending)
+
+
+def last_active(user_id, stored):
+    """The newer of the stored last_active and any buffered heartbeat."""
+    buffered = _pending.get(user_id)
+    if buffered is None or (stored is not None and stored >= buffered):
+        return stored
+    return buffered
+
+
+def active_since(cutoff):
+    """IDs of users with a buffered heartbeat at or after `cutoff`."""
+    return [user_id for user_id, when in pending().items() if when >= cutoff]
+
+
+def flush():
+    """Write all buffered heartbeats. Returns the number of users flushed."""
+    global _last_flush
+    if not _flush_lock.acquire(blocking=False):
+        return 0  # another thread is already flushing
+    try:
+        with _lock:
+            batch = list(_pending.items())
+            _pending.clear()
+            _last_flush = time.monotonic()
+        if not batch:
+            return 0
+        try:
+            write(batch)
+        except Exception as e:
+            logger.warning(f"Heartbeat flush failed, re-queueing {len(batch)} users: {e}")
+            with _lock:
+                for user_id, when in batch:
+                    if user_id not in _pending or _pending[user_id] < when:
+                        _pending[user_id] = when
+            return 0
+        return len(batch)
+    finally:
+        _flush_lock.release()
+
+
+def write(batch):
+    """Apply (user_id, timestamp) pairs with one UPDATE per chunk, never moving last_active backwards."""
+    table = connection.ops.quote_name(Profile._meta.db_table)
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            for start in range(0, len(batch), FLUSH_CHUNK):
+                chunk = batch[start:start + FLUSH_CHUNK]
+                values = ', '.join(['(%s, %s::timestamptz)'] * len(chunk))
+                cursor.execute(
+                    f"""
+                    UPDATE {table} AS p SET last_active = v.ts
+                    FROM (VALUES {values}) AS v(user_id, ts)
+                    WHERE p.user_id = v.user_id AND (p.last_active IS NULL OR p.last_active < v.ts)
+                    """,
+                    [param for pair in chunk for param in pair]
+                )
+
+
+def _flush_at_exit():
+    try:
+        flush()
+    except Exception:
+        pass
+
+
+atexit.register(_flush_at_exit)
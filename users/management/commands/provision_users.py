@@ -0,0 +1,22 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from users.provisioning import bulk_provision
+
+class Command(BaseCommand):
+    help = 'Create any missing per-user profile rows (e.g. after importing users in bulk)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        last_id, total = 0, 0
+        while True:
+            users = list(User.objects.filter(id__gt=last_id).order_by('id').only('id', 'username')[:batch_size])
+            if not users:
+                break
+            bulk_provision(users)
+            last_id = users[-1].id
+            total += len(users)
+            self.stdout.write(f"Checked {total} users")
+        self.stdout.write(self.style.SUCCESS(f"Provisioned {total} users"))
@@ -0,0 +1,72 @@
+import logging
+import multiprocessing
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connections
+from users.verification import FaceAnalyzer, claim_pending, process
+
+logger = logging.getLogger(__name__)
+
+MAX_BACKOFF = 60  # seconds between retries after repeated errors
+
+class Command(BaseCommand):
+    help = 'Run long-lived verification video analysis workers with the DeepFace models kept loaded'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=1, help='Worker processes, each with its own models')
+        parser.add_argument('--batch-size', type=int, default=8, help='Videos claimed per inference batch')
+        parser.add_argument('--poll-interval', type=float, default=2.0, help='Seconds to wait when the queue is empty')
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Drain the queue once and exit; with VERIFICATION_ANALYSIS_WORKER off, retries stale claims'
+        )
+
+    def handle(self, *args, **options):
+        if not settings.VERIFICATION_ANALYSIS_WORKER and not options['once']:
+            # Uploads are queued to django-q instead; only sweeps of abandoned claims make sense
+            raise CommandError('VERIFICATION_ANALYSIS_WORKER is off; set it to True to use this worker, or pass --once')
+        if options['processes'] <= 1:
+            self.run(options)
+            return
+        # Children must not share the parent's database connection
+        connections.close_all()
+        workers = [
+            multiprocessing.Process(target=self.run, args=(options,), daemon=True)
+            for _ in range(options['processes'])
+        ]
+        for worker in workers:
+            worker.start()
+        try:
+            for worker in workers:
+                worker.join()
+        except KeyboardInterrupt:
+            for worker in workers:
+                worker.terminate()
+
+    def run(self, options):
+        analyzer = FaceAnalyzer().load()
+        self.stdout.write(self.style.SUCCESS('Verification worker ready'))
+        errors = 0
+        while True:
+            try:
+                profiles = claim_pending(options['batch_size'])
+                if profiles:
+                    start = time.perf_counter()
+                    process(profiles, analyzer)
+                    self.stdout.write(
+                        f"Analyzed {len(profiles)} videos in {(time.perf_counter() - start) * 1000:.0f} ms"
+                    )
+            except Exception:
+                # Claimed rows are retried after VERIFICATION_CLAIM_TIMEOUT
+                errors += 1
+                logger.exception('Verification worker batch failed')
+                close_old_connections()
+                time.sleep(min(options['poll_interval'] * 2 ** errors, MAX_BACKOFF))
+                continue
+            errors = 0
+            if profiles:
+                continue
+            if options['once']:
+                return
+            time.sleep(options['poll_interval'])
@@ -1,5 +1,4 @@
-from django.contrib.gis.geoip2 import GeoIP2
-from .models import VerificationProfile
+from . import geoip, heartbeat
 
 class GeoIPVerificationMiddleware:
     def __init__(self, get_response):
@@ -7,20 +6,16 @@ class GeoIPVerificationMiddleware:
 
     def __call__(self, request):
         if request.user.is_authenticated:
-            # Update last_active (Heartbeat)
-            if hasattr(request.user, 'profile'):
-                request.user.profile.update_last_active()
+            # Update last_active (Heartbeat), written behind in batches
+            heartbeat.touch(request.user.id)
 
-            # GeoIP lookup
+            # GeoIP lookup (cached flags, shared reader and IP -> country LRU)
             try:
-                profile = VerificationProfile.objects.get(user=request.user)
-                if not profile.v3_location:
+                if not geoip.verification_flags(request.user)['v3_location']:
                     ip = self.get_client_ip(request)
                     if ip and ip != '127.0.0.1':
-                        g = GeoIP2()
-                        country = g.country(ip)
                         # We store the detected country in request metadata for the view to use
-                        request.META['GEOIP_COUNTRY'] = country.get('country_code')
+                        request.META['GEOIP_COUNTRY'] = geoip.country_for_ip(ip)
             except Exception:
                 pass
 
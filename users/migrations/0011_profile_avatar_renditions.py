@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-18 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0010_notification'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='avatar_renditions',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+    ]
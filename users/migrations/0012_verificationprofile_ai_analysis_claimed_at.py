@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-19 09:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0011_profile_avatar_renditions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='verificationprofile',
+            name='ai_analysis_claimed_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+    ]
@@ -1,9 +1,62 @@
+import copy
 from django.db import models
+from django.db.models.fields.files import FieldFile
 from django.contrib.auth.models import User
 
-class Profile(models.Model):
+class ChangeTrackingMixin:
+    """
+    Remembers field values as loaded from (or last saved to) the database,
+    so signal handlers can tell what actually changed without re-reading
+    the row. Deferred fields and unsaved instances always count as changed.
+    """
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.snapshot_fields()
+        return instance
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self.snapshot_fields(kwargs.get('update_fields'))
+
+    def refresh_from_db(self, *args, **kwargs):
+        super().refresh_from_db(*args, **kwargs)
+        self.snapshot_fields()
+
+    def _tracked_value(self, field):
+        value = self.__dict__[field.attname]
+        if isinstance(value, FieldFile):
+            return value.name
+        return copy.deepcopy(value) if isinstance(value, (dict, list)) else value
+
+    def snapshot_fields(self, names=None):
+        values = {
+            field.name: self._tracked_value(field)
+            for field in self._meta.concrete_fields
+            if not field.primary_key and field.attname in self.__dict__
+            and (names is None or field.name in names or field.attname in names)
+        }
+        if names is None:
+            self._loaded_values = values
+        else:
+            self._loaded_values = {**getattr(self, '_loaded_values', {}), **values}
+
+    def has_changed(self, *names):
+        loaded = getattr(self, '_loaded_values', {})
+        for name in names:
+            field = self._meta.get_field(name)
+            if name not in loaded or field.attname not in self.__dict__ or loaded[name] != self._tracked_value(field):
+                return True
+        return False
+
+    def changed_fields(self):
+        return [f.name for f in self._meta.concrete_fields if not f.primary_key and self.has_changed(f.name)]
+
+class Profile(ChangeTrackingMixin, models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='profile')
     avatar = models.ImageField(upload_to='avatars/', null=True, blank=True)
+    avatar_renditions = models.JSONField(default=dict, blank=True, editable=False) # see users.renditions
     
     GENDER_CHOICES = [
         ('M', 'Male'),
@@ -36,7 +89,7 @@ class Profile(models.Model):
         self.last_active = timezone.now()
         self.save(update_fields=['last_active'])
 
-class VerificationProfile(models.Model):
+class VerificationProfile(ChangeTrackingMixin, models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='verification_profile')
     v1_email = models.BooleanField(default=False)
     v2_phone = models.BooleanField(default=False)
@@ -52,6 +105,7 @@ class VerificationProfile(models.Model):
     detected_age_range = models.CharField(max_length=20, null=True, blank=True)
     ai_analysis_status = models.CharField(max_length=20, default='pending') # pending, processing, completed, failed
     ai_analysis_message = models.CharField(max_length=255, null=True, blank=True)
+    ai_analysis_claimed_at = models.DateTimeField(null=True, blank=True, editable=False) # set while a worker analyzes it
 
     def __str__(self):
         return f"{self.user.username}'s Verification Status"
@@ -75,9 +129,21 @@ class Notification(models.Model):
     data = models.JSONField(blank=True, default=dict)
     is_read = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
+
+    # Summary notifications (e.g. 'chat_room:12') are updated in place, one per user and key,
+    # counting the events since the user last read it; created_at is the latest event
+    group_key = models.CharField(max_length=100, null=True, blank=True)
+    count = models.PositiveIntegerField(default=1)
     
     class Meta:
         ordering = ['-created_at']
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'group_key'], name='notification_user_group_key'),
+        ]
+        indexes = [
+            # Recounting a user's unread badge (users.notifications)
+            models.Index(fields=['user'], condition=models.Q(is_read=False), name='notification_user_unread'),
+        ]
 
     def __str__(self):
         return f"{self.type}: {self.title} ({self.user.username})"
@@ -0,0 +1,191 @@
+"""
+Creating notifications, and each user's unread count.
+
+Everything that notifies users goes through here: `send` bulk-inserts any
+number of notifications, `upsert_grouped` maintains summary notifications
+(one row per user and group_key, e.g. a chat room), and `mark_read`
+flips rows to read with a single UPDATE.
+
+The badge number (unread rows per user) is kept in the cache and adjusted
+with atomic increments as rows change, so `unread_count` normally costs no
+query. A missing counter is recounted from the partial (user) WHERE NOT
+is_read index. Counters expire after NOTIFICATION_UNREAD_CACHE_TIMEOUT
+seconds, which bounds any drift from a recount racing an increment.
+
+After each change, connected clients of the affected users get the new
+count (and any new notification) on their `notifications_<user id>`
+channel group; see users.consumers.NotificationConsumer.
+"""
+import json
+import logging
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Count
+from django.utils import timezone
+from .models import Notification
+
+logger = logging.getLogger(__name__)
+
+UNREAD_CACHE_KEY = 'notifications_unread:{}'
+UPSERT_CHUNK = 1000
+
+UPSERT_SQL = """
+    INSERT INTO {table} AS n (user_id, type, title, body, data, is_read, created_at, group_key, count)
+    VALUES {values}
+    ON CONFLICT (user_id, group_key) DO UPDATE SET
+        count = CASE WHEN n.is_read THEN EXCLUDED.count ELSE n.count + EXCLUDED.count END,
+        is_read = FALSE,
+        title = EXCLUDED.title,
+        body = EXCLUDED.body,
+        data = EXCLUDED.data,
+        created_at = EXCLUDED.created_at
+    RETURNING n.user_id, n.group_key, n.count
+"""
+
+
+def group_name(user_id):
+    return f'notifications_{user_id}'
+
+
+def send(notifications):
+    """
+    Insert unsaved Notification instances in one statement, count them as
+    unread and push them to their users once the transaction commits.
+    """
+    notifications = Notification.objects.bulk_create(notifications)
+    deltas = {}
+    for notification in notifications:
+        if not notification.is_read:
+            deltas[notification.user_id] = deltas.get(notification.user_id, 0) + 1
+    transaction.on_commit(lambda: _changed(deltas, notifications))
+    return notifications
+
+
+def notify(user_ids, type, title, body='', data=None):
+    """The same notification for each of `user_ids`."""
+    return send([
+        Notification(user_id=user_id, type=type, title=title, body=body, data=data or {})
+        for user_id in user_ids
+    ])
+
+
+def upsert_grouped(rows):
+    """
+    Create or update summary notifications. Each row is a dict with
+    user_id, type, title, body, data, group_key and count (new events).
+    An unread summary has `count` added and its text replaced; a read one
+    (or a new one) becomes unread with `count` events. (user_id, group_key)
+    pairs must be unique within `rows`.
+    """
+    if not rows:
+        return
+    table = connection.ops.quote_name(Notification._meta.db_table)
+    sent = {(row['user_id'], row['group_key']): row['count'] for row in rows}
+    now = timezone.now()
+    deltas = {}
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), UPSERT_CHUNK):
+            chunk = rows[start:start + UPSERT_CHUNK]
+            values = ', '.join(['(%s, %s, %s, %s, %s::jsonb, FALSE, %s, %s, %s)'] * len(chunk))
+            params = [
+                v for row in chunk for v in (
+                    row['user_id'], row['type'], row['title'], row['body'], json.dumps(row['data']),
+                    now, row['group_key'], row['count'],
+                )
+            ]
+            cursor.execute(UPSERT_SQL.format(table=table, values=values), params)
+            for user_id, group_key, count in cursor.fetchall():
+                # A summary that was already unread now holds more than this
+                # batch's events; otherwise it was just created or re-opened
+                if count == sent[(user_id, group_key)]:
+                    deltas[user_id] = deltas.get(user_id, 0) + 1
+    transaction.on_commit(lambda: _changed(deltas))
+
+
+def mark_read(user_id, **filters):
+    """Mark `user_id`'s unread notifications matching `filters` as read. Returns how many changed."""
+    updated = Notification.objects.filter(user_id=user_id, is_read=False, **filters).update(is_read=True)
+    if updated:
+        transaction.on_commit(lambda: _changed({user_id: -updated}))
+    return updated
+
+
+def unread_count(user_id):
+    return unread_counts([user_id])[user_id]
+
+
+def unread_counts(user_ids):
+    """{user_id: unread notifications}, recounting the uncached ones in one query."""
+    keys = {user_id: UNREAD_CACHE_KEY.format(user_id) for user_id in user_ids}
+    cached = cache.get_many(keys.values())
+    counts = {user_id: cached[key] for user_id, key in keys.items() if key in cached}
+    missing = [user_id for user_id in keys if user_id not in counts]
+    if missing:
+        recounted = dict(
+            Notification.objects.filter(user_id__in=missing, is_read=False)
+            .order_by().values('user_id').annotate(n=Count('id')).values_list('user_id', 'n')
+        )
+        for user_id in missing:
+            counts[user_id] = recounted.get(user_id, 0)
+            cache.add(keys[user_id], counts[user_id], _timeout())
+    return counts
+
+
+def invalidate_unread(user_ids):
+    cache.delete_many([UNREAD_CACHE_KEY.format(user_id) for user_id in user_ids])
+
+
+def _timeout():
+    return getattr(settings, 'NOTIFICATION_UNREAD_CACHE_TIMEOUT', 300)
+
+
+def _adjust(deltas):
+    for user_id, delta in deltas.items():
+        if not delta:
+            continue
+        key = UNREAD_CACHE_KEY.format(user_id)
+        try:
+            if cache.incr(key, delta) < 0:
+                cache.delete(key)
+        except ValueError:
+            pass  # not cached: the next read recounts
+
+
+def _changed(deltas, notifications=()):
+    _adjust(deltas)
+    push(deltas.keys(), notifications)
+
+
+def push(user_ids, notifications=()):
+    """Send the current unread count, and any new `notifications`, to the users' open sockets."""
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+    by_user = {}
+    for notification in notifications:
+        by_user.setdefault(notification.user_id, []).append(notification)
+    counts = unread_counts(list(user_ids))
+    for user_id, count in counts.items():
+        event = {
+            'type': 'notifications_changed',
+            'unread_count': count,
+            'notifications': [_payload(n) for n in by_user.get(user_id, ())],
+        }
+        try:
+            async_to_sync(channel_layer.group_send)(group_name(user_id), event)
+        except Exception as e:
+            logger.warning(f"Could not push notifications to user {user_id}: {e}")
+
+
+def _payload(notification):
+    return {
+        'id': notification.id,
+        'type': notification.type,
+        'title': notification.title,
+        'body': notification.body,
+        'data': notification.data,
+        'created_at': notification.created_at.isoformat() if notification.created_at else None,
+    }
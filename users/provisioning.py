@@ -0,0 +1,86 @@
+"""
+Creation of the per-user rows every account needs across apps:
+Profile, VerificationProfile, MatchmakeProfile, BuyerProfile and a private
+BusinessProfile with its SellerProfile.
+
+Rows are bulk-inserted in one transaction, one INSERT per table, so
+registering a user costs a handful of queries instead of a cascade of
+post_save receivers, and an import can provision thousands at once.
+"""
+from django.db import connection, transaction
+from business.models import BusinessProfile
+from matchmake.models import MatchmakeProfile
+from vehicles.models import BuyerProfile, SellerProfile, SellerType
+from .models import ChangeTrackingMixin, Profile, VerificationProfile
+
+PRIVATE_SELLER_TYPE = 'Private'
+
+# Ensures the 'Private' seller type exists and attaches it to the new
+# business profiles in the same statement, so no lookup is needed first.
+SELLER_PROFILES_SQL = """
+    WITH created AS (
+        INSERT INTO {seller_type} (seller_type) VALUES (%(seller_type)s)
+        ON CONFLICT (seller_type) DO NOTHING
+        RETURNING id
+    ), private AS (
+        SELECT id FROM created
+        UNION ALL
+        SELECT id FROM {seller_type} WHERE seller_type = %(seller_type)s
+    )
+    INSERT INTO {seller_profile} (business_id, seller_type_id)
+    SELECT business_id, (SELECT id FROM private LIMIT 1) FROM unnest(%(business_ids)s::bigint[]) AS business_id
+    ON CONFLICT (business_id) DO NOTHING
+"""
+
+PER_USER_MODELS = (Profile, VerificationProfile, MatchmakeProfile, BuyerProfile)
+
+
+def provision_user(user):
+    """
+    Create every per-user row for a newly created `user`. The new profiles
+    are attached to the instance, so `user.profile` etc. need no query.
+    """
+    with transaction.atomic():
+        for model in PER_USER_MODELS:
+            for obj in model.objects.bulk_create([model(user=user)]):
+                if isinstance(obj, ChangeTrackingMixin):
+                    obj.snapshot_fields()
+        business = BusinessProfile.objects.bulk_create([_private_business(user)])
+        _create_seller_profiles([b.pk for b in business])
+
+
+def bulk_provision(users):
+    """
+    Create whatever per-user rows are missing for `users` (e.g. after a
+    bulk import that bypassed post_save). Safe to run repeatedly.
+    """
+    users = [u for u in users if u.pk]
+    if not users:
+        return
+    user_ids = [u.pk for u in users]
+    with transaction.atomic():
+        for model in PER_USER_MODELS:
+            model.objects.bulk_create([model(user_id=pk) for pk in user_ids], ignore_conflicts=True)
+
+        has_private = set(
+            BusinessProfile.objects.filter(owner_id__in=user_ids, is_private=True).values_list('owner_id', flat=True)
+        )
+        business = BusinessProfile.objects.bulk_create(
+            [_private_business(u) for u in users if u.pk not in has_private]
+        )
+        _create_seller_profiles([b.pk for b in business])
+
+
+def _private_business(user):
+    return BusinessProfile(owner_id=user.pk, name=f"Private Profile ({user.username})", is_private=True)
+
+
+def _create_seller_profiles(business_ids):
+    if not business_ids:
+        return
+    sql = SELLER_PROFILES_SQL.format(
+        seller_type=connection.ops.quote_name(SellerType._meta.db_table),
+        seller_profile=connection.ops.quote_name(SellerProfile._meta.db_table),
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, {'seller_type': PRIVATE_SELLER_TYPE, 'business_ids': business_ids})
@@ -0,0 +1,111 @@
+"""
+Resized WebP/JPEG renditions of uploaded images (avatars, matchmake photos).
+
+Renditions are generated off the request path by a django-q task and
+recorded on the owning row as JSON:
+
+    {"source": "avatars/me.png",
+     "sizes": {"thumb": {"width": 160, "webp": "renditions/avatars/me_thumb.webp", "jpeg": "..."}, ...}}
+
+"source" is the image name the renditions were built from, so a row whose
+image no longer matches it is known to be stale without an extra query.
+"""
+import logging
+import os
+from io import BytesIO
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+# name -> longest edge in pixels
+RENDITION_SIZES = {
+    'thumb': 160,
+    'card': 640,
+    'full': 1280,
+}
+RENDITION_FORMATS = {
+    'webp': ('WEBP', {'quality': 75, 'method': 4}),
+    'jpeg': ('JPEG', {'quality': 78, 'optimize': True, 'progressive': True}),
+}
+
+
+def needs_renditions(field_file, renditions):
+    return bool(field_file) and (renditions or {}).get('source') != field_file.name
+
+
+def build_renditions(field_file):
+    """
+    Generate every size/format of `field_file` into its storage and return
+    the renditions dict. Nothing is deleted; see store_renditions.
+    """
+    storage = field_file.storage
+    base = os.path.splitext(field_file.name)[0]
+    field_file.open('rb')
+    try:
+        img = Image.open(field_file)
+        img = ImageOps.exif_transpose(img)
+        if img.mode != 'RGB':
+            img = img.convert('RGB')
+        img.load()
+    finally:
+        field_file.close()
+
+    sizes = {}
+    for size_name, edge in RENDITION_SIZES.items():
+        resized = img.copy()
+        resized.thumbnail((edge, edge), Image.Resampling.LANCZOS)
+        entry = {'width': resized.width, 'height': resized.height}
+        for ext, (fmt, save_kwargs) in RENDITION_FORMATS.items():
+            buffer = BytesIO()
+            resized.save(buffer, format=fmt, **save_kwargs)
+            entry[ext] = storage.save(f'renditions/{base}_{size_name}.{ext}', ContentFile(buffer.getvalue()))
+        sizes[size_name] = entry
+
+    return {'source': field_file.name, 'sizes': sizes}
+
+
+def store_renditions(queryset, field, storage, renditions, previous):
+    """
+    Record `renditions` with a conditional UPDATE on `queryset` (which should
+    only match if the image is still the one they were built from), then
+    delete the files of the `previous` renditions, or of the new ones if the
+    image was replaced in the meantime. Returns whether they were recorded.
+    """
+    if queryset.update(**{field: renditions}):
+        delete_renditions(storage, previous)
+        return True
+    delete_renditions(storage, renditions)
+    return False
+
+
+def delete_renditions(storage, renditions):
+    for entry in ((renditions or {}).get('sizes') or {}).values():
+        for ext in RENDITION_FORMATS:
+            name = entry.get(ext)
+            if name:
+                try:
+                    storage.delete(name)
+                except OSError as e:
+                    logger.warning(f"Could not delete rendition {name}: {e}")
+
+
+def rendition_urls(renditions, storage, request=None):
+    """Map stored rendition names to URLs plus a srcset string per format."""
+    sizes = (renditions or {}).get('sizes') or {}
+    if not sizes:
+        return None
+
+    def url(name):
+        u = storage.url(name)
+        return request.build_absolute_uri(u) if request else u
+
+    urls = {
+        size_name: {'width': entry['width'], **{ext: url(entry[ext]) for ext in RENDITION_FORMATS if entry.get(ext)}}
+        for size_name, entry in sizes.items()
+    }
+    srcset = {
+        ext: ', '.join(f"{u[ext]} {u['width']}w" for u in urls.values() if ext in u)
+        for ext in RENDITION_FORMATS
+    }
+    return {**urls, 'srcset': srcset}
@@ -1,15 +1,23 @@
 from django.contrib.auth.models import User
+from django.core.files.storage import default_storage
 from rest_framework import serializers
 from .models import Profile, VerificationProfile, Notification
+from .renditions import rendition_urls
+
+class RenditionsField(serializers.ReadOnlyField):
+    """Exposes a renditions JSON column as per-size URLs plus srcset strings."""
+    def to_representation(self, value):
+        return rendition_urls(value, default_storage, self.context.get('request'))
 
 class ProfileSerializer(serializers.ModelSerializer):
     # Use higher precision for input to avoid validation errors, then round in validate()
     latitude = serializers.DecimalField(max_digits=15, decimal_places=10, required=False, allow_null=True)
     longitude = serializers.DecimalField(max_digits=15, decimal_places=10, required=False, allow_null=True)
+    avatar_renditions = RenditionsField()
 
     class Meta:
         model = Profile
-        fields = ['gender', 'dob', 'phone', 'recovery_email', 'avatar', 'ip_address', 'ip_country', 'latitude', 'longitude', 
+        fields = ['gender', 'dob', 'phone', 'recovery_email', 'avatar', 'avatar_renditions', 'ip_address', 'ip_country', 'latitude', 'longitude', 
                   'address_line_1', 'address_line_2', 'city', 'state', 'postcode', 'country']
 
     def validate_latitude(self, value):
@@ -1,26 +1,40 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
 from django.db.models.signals import post_save, pre_save
 from django.contrib.auth.models import User
 from django.dispatch import receiver
+from django_q.tasks import async_task
 from .models import Profile, VerificationProfile
+from .renditions import needs_renditions
+from . import geoip
+from .provisioning import provision_user
+
+LOGIN_ENRICHMENT_KEY = 'login_enrichment:{}'
 
 @receiver(post_save, sender=User)
 def create_user_profile(sender, instance, created, **kwargs):
     if created:
-        Profile.objects.create(user=instance)
-        VerificationProfile.objects.create(user=instance)
+        # Profiles for every app (users, matchmake, vehicles, business) in one go
+        provision_user(instance)
 
 @receiver(post_save, sender=User)
-def save_user_profile(sender, instance, **kwargs):
-    # Check if profile exists before saving (in case it was deleted or legacy user)
-    if hasattr(instance, 'profile'):
-        instance.profile.save()
-    else:
-        Profile.objects.create(user=instance)
+def save_user_profile(sender, instance, created, update_fields=None, **kwargs):
+    # New users are handled above, and partial saves (e.g. the last_login
+    # update on every login) never carry profile changes
+    if created or update_fields is not None:
+        return
 
-    if hasattr(instance, 'verification_profile'):
-        instance.verification_profile.save()
-    else:
-        VerificationProfile.objects.create(user=instance)
+    for name, model in (('profile', Profile), ('verification_profile', VerificationProfile)):
+        if name in instance._state.fields_cache:
+            related = instance._state.fields_cache[name]
+            if related is None:
+                model.objects.create(user=instance)
+            elif related._state.adding or related.changed_fields():
+                related.save()
+        else:
+            # Not loaded on this instance: just make sure legacy users have the row
+            model.objects.get_or_create(user=instance)
 
 from django.contrib.auth.signals import user_logged_in
 from geo.models import IpAsn, CountryInfo
@@ -39,21 +53,17 @@ def profile_pre_save(sender, instance, **kwargs):
     """
     Automatically populate ip_country from ip_address using IpAsn and CountryInfo.
     """
+    update_fields = kwargs.get('update_fields')
+    if update_fields is not None and 'ip_address' not in update_fields:
+        return
     if instance.ip_address:
-        # Check if ip_address has changed or ip_country is empty
-        update_country = False
-        if not instance.pk:
-            update_country = True
-        else:
-            try:
-                old_instance = Profile.objects.get(pk=instance.pk)
-                # Update if IP changed, OR if country is empty, OR if country is not a 2-char code
-                if (old_instance.ip_address != instance.ip_address or 
-                    not instance.ip_country or 
-                    len(instance.ip_country) != 2):
-                    update_country = True
-            except Profile.DoesNotExist:
-                update_country = True
+        # Update if new, if IP changed, OR if country is empty, OR if country is not a 2-char code
+        update_country = (
+            instance._state.adding or
+            instance.has_changed('ip_address') or
+            not instance.ip_country or
+            len(instance.ip_country) != 2
+        )
 
         if update_country:
             try:
@@ -66,10 +76,12 @@ def profile_pre_save(sender, instance, **kwargs):
                 logger.error(f"Error looking up IP info for profile {instance.id}: {e}")
 
 @receiver(post_save, sender=Profile)
-def save_location_history(sender, instance, **kwargs):
+def save_location_history(sender, instance, created, **kwargs):
     """
     Log geolocation changes to Location history.
     """
+    if not created and not instance.has_changed('latitude', 'longitude'):
+        return
     if instance.latitude and instance.longitude:
         # Avoid creating duplicate history if nothing changed significantly
         last_history = Location.objects.filter(user=instance.user).order_by('-timestamp').first()
@@ -90,15 +102,41 @@ def save_location_history(sender, instance, **kwargs):
                 longitude=instance.longitude
             )
 
+@receiver(post_save, sender=Profile)
+def queue_avatar_renditions(sender, instance, **kwargs):
+    """
+    Generate avatar renditions in the background when the avatar changes.
+    """
+    stale = needs_renditions(instance.avatar, instance.avatar_renditions)
+    removed = not instance.avatar and instance.avatar_renditions
+    if stale or removed:
+        transaction.on_commit(lambda: async_task('users.tasks.generate_avatar_renditions', instance.id))
+
+@receiver(post_save, sender=VerificationProfile)
+def invalidate_verification_flags(sender, instance, created, **kwargs):
+    if created or instance.has_changed(*geoip.FLAG_FIELDS):
+        geoip.invalidate_flags(instance.user_id)
+
 @receiver(user_logged_in)
 def update_user_ip_info(sender, user, request, **kwargs):
+    """
+    Queue login enrichment (profile IP, country lookup, location history)
+    so the login response doesn't wait for it. Repeat logins from the same
+    IP while a task is pending are deduplicated per user.
+    """
     ip = get_client_ip(request)
-    if ip:
-        if hasattr(user, 'profile'):
-            profile = user.profile
-            profile.ip_address = ip
-            # Country lookup is now handled by profile_pre_save
-            profile.save()
+    if not ip:
+        return
+    key = LOGIN_ENRICHMENT_KEY.format(user.pk)
+    if cache.get(key) == ip:
+        return
+
+    def queue():
+        # Only once the login committed, so a rolled-back one suppresses nothing
+        cache.set(key, ip, getattr(settings, 'LOGIN_ENRICHMENT_DEDUP_SECONDS', 300))
+        async_task('users.tasks.record_login', user.pk, ip)
+
+    transaction.on_commit(queue)
 
 from allauth.account.signals import email_confirmed
 
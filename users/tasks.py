@@ -1,94 +1,63 @@
-import cv2
-import os
-from deepface import DeepFace
-from .models import VerificationProfile
+import logging
+from django.db.models import Q
+from django.utils import timezone
+from .models import Profile, VerificationProfile
+from . import verification
+from .renditions import build_renditions, delete_renditions, needs_renditions, store_renditions
 from django.conf import settings
 
+logger = logging.getLogger(__name__)
+
 def analyze_verification_video(profile_id):
+    """
+    Task to analyze one verification video. The models stay loaded in the
+    worker process between tasks; with VERIFICATION_ANALYSIS_WORKER set,
+    run_verification_worker picks videos up in batches instead.
+    """
+    now = timezone.now()
+    claimed = verification.claimable(now).filter(id=profile_id).update(ai_analysis_claimed_at=now)
+    if not claimed:
+        return  # already taken by the verification worker
+    profile = VerificationProfile.objects.select_related('user__profile').get(id=profile_id)
     try:
-        profile = VerificationProfile.objects.get(id=profile_id)
-        if not profile.verification_video:
-            profile.ai_analysis_status = 'failed'
-            profile.ai_analysis_message = 'No video file found.'
-            profile.save()
-            return
-
-        video_path = profile.verification_video.path
-        
-        profile.ai_analysis_message = 'Extracting frames from video...'
-        profile.save()
-
-        # Extract a frame from the video
-        cap = cv2.VideoCapture(video_path)
-        success, frame = cap.read()
-        if not success:
-            profile.ai_analysis_status = 'failed'
-            profile.ai_analysis_message = 'Failed to read video or extract frame.'
-            profile.save()
-            return
-        
-        # Save frame temporarily for DeepFace
-        temp_frame_path = f"/tmp/frame_{profile_id}.jpg"
-        cv2.imwrite(temp_frame_path, frame)
-        cap.release()
-
-        profile.ai_analysis_message = 'Analyzing face (age and gender)...'
-        profile.save()
-
-        # Analyze with DeepFace
-        # actions=['age', 'gender']
-        # enforce_detection=False to avoid error if face is not perfectly detected
-        # detector_backend='opencv' is usually faster than others
-        results = DeepFace.analyze(img_path=temp_frame_path, actions=['age', 'gender'], enforce_detection=False, detector_backend='opencv')
-        
-        # DeepFace returns a list if multiple faces are detected, or a dict.
-        if isinstance(results, list) and len(results) > 0:
-            result = results[0]
-        elif isinstance(results, dict):
-            result = results
-        else:
-            profile.ai_analysis_status = 'failed'
-            profile.ai_analysis_message = 'No face detected in the video.'
-            profile.save()
-            return
-
-        detected_gender = result.get('dominant_gender')
-        detected_age = result.get('age')
-
-        profile.detected_gender = detected_gender
-        profile.detected_age_range = f"{detected_age}-{(detected_age//10)*10+9}" # Simple range
-        
-        profile.ai_analysis_message = 'Verifying results...'
-        profile.save()
-
-        # Compare with user profile if available
-        user_profile = profile.user.profile
-        gender_match = False
-        if detected_gender and user_profile.gender:
-            # Map DeepFace gender to Profile gender
-            # DeepFace: 'Man', 'Woman'
-            # Profile: 'M', 'F'
-            if (detected_gender == 'Man' and user_profile.gender == 'M') or \
-               (detected_gender == 'Woman' and user_profile.gender == 'F'):
-                gender_match = True
-
-        profile.v4_gender = gender_match
-        profile.v5_age = True # For now, we just mark age as verified if we detected it.
-        
-        profile.ai_analysis_status = 'completed'
-        profile.ai_analysis_message = 'AI analysis finished successfully.'
-        profile.save()
-        
-        # Cleanup
-        if os.path.exists(temp_frame_path):
-            os.remove(temp_frame_path)
-
+        verification.process([profile], verification.get_analyzer())
     except Exception as e:
-        print(f"Error in analyze_verification_video: {e}")
-        try:
-            profile = VerificationProfile.objects.get(id=profile_id)
-            profile.ai_analysis_status = 'failed'
-            profile.ai_analysis_message = f"AI analysis error: {str(e)}"
-            profile.save()
-        except:
-            pass
+        logger.exception(f"Error in analyze_verification_video: {e}")
+        verification.fail(profile, f"AI analysis error: {str(e)}")
+
+def generate_avatar_renditions(profile_id):
+    """
+    Task to build the thumbnail/card/full WebP and JPEG renditions of an avatar.
+    """
+    profile = Profile.objects.filter(id=profile_id).only('id', 'avatar', 'avatar_renditions').first()
+    if not profile:
+        return
+    if not profile.avatar:
+        if profile.avatar_renditions:
+            delete_renditions(Profile._meta.get_field('avatar').storage, profile.avatar_renditions)
+            Profile.objects.filter(Q(avatar='') | Q(avatar__isnull=True), id=profile_id).update(avatar_renditions={})
+        return
+    if not needs_renditions(profile.avatar, profile.avatar_renditions):
+        return
+
+    renditions = build_renditions(profile.avatar)
+    # Only record them if the avatar wasn't replaced while we were working
+    store_renditions(
+        Profile.objects.filter(id=profile_id, avatar=profile.avatar.name), 'avatar_renditions',
+        profile.avatar.storage, renditions, previous=profile.avatar_renditions,
+    )
+
+def record_login(user_id, ip):
+    """
+    Task to record a login's IP on the profile. Country lookup and location
+    history are handled by the Profile signals, and only run if it changed.
+    """
+    profile = Profile.objects.filter(user_id=user_id).first()
+    if not profile:
+        return
+    profile.ip_address = ip
+    if profile.has_changed('ip_address') or not profile.ip_country:
+        # Only these fields: the row was loaded before any concurrent edits
+        # or heartbeat flushes of last_active, which a full save would undo
+        profile.save(update_fields=['ip_address', 'ip_country'])
+    logger.info(f"Login: user {user_id} from {ip} ({profile.ip_country or 'unknown country'})")
@@ -0,0 +1,221 @@
+from unittest import mock
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.urls import reverse
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APITestCase
+from business.models import BusinessProfile
+from locations.models import Location
+from matchmake.models import MatchmakeProfile
+from vehicles.models import BuyerProfile, SellerProfile
+from . import geoip, notifications, verification
+from .models import Notification, Profile, VerificationProfile
+from .provisioning import bulk_provision
+
+
+@override_settings(VERIFICATION_FLAGS_CACHE_TIMEOUT=300)
+class GeoIPMiddlewareTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='geo', password='password')
+        self.client.force_login(self.user)
+
+    def verification_queries(self):
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get('/api/users/notifications/', REMOTE_ADDR='203.0.113.7')
+        return [q for q in ctx.captured_queries if 'users_verificationprofile' in q['sql']]
+
+    def test_flags_and_countries_are_cached(self):
+        self.verification_queries()
+        before = geoip.stats()
+        self.assertEqual(self.verification_queries(), [])
+        after = geoip.stats()
+        self.assertEqual(after['flag_hits'], before['flag_hits'] + 1)
+        self.assertEqual(after['ip_hits'], before['ip_hits'] + 1)
+
+    def test_saving_verification_profile_invalidates_flags(self):
+        self.verification_queries()
+        profile = self.user.verification_profile
+        profile.v3_location = True
+        profile.save()
+        self.assertEqual(len(self.verification_queries()), 1)
+        self.assertTrue(geoip.verification_flags(User.objects.get(pk=self.user.pk))['v3_location'])
+
+    @override_settings(VERIFICATION_FLAGS_CACHE_TIMEOUT=0)
+    def test_flags_are_not_cached_without_a_shared_cache(self):
+        self.verification_queries()
+        self.assertEqual(len(self.verification_queries()), 1)
+
+
+class ProfileChangeTrackingTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='tracked', password='password')
+        Profile.objects.filter(user=self.user).update(ip_address='127.0.0.1', ip_country='GB')
+
+    def test_login_does_not_rewrite_profiles(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post(reverse('token_obtain_pair'), {'username': 'tracked', 'password': 'password'})
+        self.assertEqual(response.status_code, 200)
+        writes = [q['sql'] for q in ctx.captured_queries if not q['sql'].startswith('SELECT')]
+        self.assertFalse([sql for sql in writes if 'users_profile' in sql or 'users_verificationprofile' in sql])
+        self.assertFalse([q for q in ctx.captured_queries if 'locations_location' in q['sql']])
+
+    def test_location_history_only_on_coordinate_change(self):
+        profile = Profile.objects.get(user=self.user)
+        profile.latitude, profile.longitude = 51.5, -0.12
+        profile.save()
+        self.assertEqual(Location.objects.filter(user=self.user).count(), 1)
+
+        profile = Profile.objects.get(user=self.user)
+        profile.city = 'London'
+        with CaptureQueriesContext(connection) as ctx:
+            profile.save()
+        self.assertFalse([q for q in ctx.captured_queries if 'locations_location' in q['sql']])
+        self.assertEqual(profile.changed_fields(), [])
+
+    def test_user_save_only_saves_changed_profiles(self):
+        user = User.objects.select_related('profile', 'verification_profile').get(pk=self.user.pk)
+        user.first_name = 'Tracked'
+        with CaptureQueriesContext(connection) as ctx:
+            user.save()
+        self.assertEqual(len(ctx.captured_queries), 1)
+
+        user.profile.city = 'Leeds'
+        user.save()
+        self.assertEqual(Profile.objects.get(user=self.user).city, 'Leeds')
+
+
+class ProvisioningTest(APITestCase):
+    def assertProvisioned(self, user):
+        self.assertTrue(Profile.objects.filter(user=user).exists())
+        self.assertTrue(VerificationProfile.objects.filter(user=user).exists())
+        self.assertTrue(MatchmakeProfile.objects.filter(user=user).exists())
+        self.assertTrue(BuyerProfile.objects.filter(user=user).exists())
+        business = BusinessProfile.objects.get(owner=user, is_private=True)
+        self.assertEqual(SellerProfile.objects.get(business=business).seller_type.seller_type, 'Private')
+
+    def test_registration_creates_every_profile_in_few_queries(self):
+        with CaptureQueriesContext(connection) as ctx:
+            user = User.objects.create_user(username='fresh', password='password')
+        self.assertLessEqual(len(ctx.captured_queries), 8)
+        self.assertProvisioned(user)
+        with CaptureQueriesContext(connection) as ctx:
+            user.profile, user.verification_profile, user.matchmake_profile
+        self.assertEqual(len(ctx.captured_queries), 0)
+
+    def test_bulk_provision_fills_gaps_and_is_idempotent(self):
+        users = User.objects.bulk_create([User(username=f'imported{i}') for i in range(3)])
+        Profile.objects.create(user=users[0])
+        bulk_provision(users)
+        bulk_provision(users)
+        for user in users:
+            self.assertProvisioned(user)
+        self.assertEqual(BusinessProfile.objects.filter(owner__in=users).count(), 3)
+
+
+class FakeAnalyzer:
+    def __init__(self):
+        self.batches = []
+
+    def analyze(self, frames):
+        self.batches.append(len(frames))
+        return [{'age': 31, 'gender': 'Woman', 'gender_confidence': 0.9} for _ in frames]
+
+
+@mock.patch('users.verification.read_frames', lambda path: ['frame'])
+class VerificationWorkerTest(APITestCase):
+    def queue(self, username, gender):
+        user = User.objects.create_user(username=username, password='password')
+        Profile.objects.filter(user=user).update(gender=gender)
+        VerificationProfile.objects.filter(user=user).update(
+            ai_analysis_status='processing',
+            verification_video=f'verification_videos/{username}.mp4',
+        )
+        return user
+
+    def test_claims_and_analyzes_pending_videos_in_one_batch(self):
+        first, second = self.queue('first', 'F'), self.queue('second', 'M')
+        profiles = verification.claim_pending(10)
+        self.assertEqual(len(profiles), 2)
+        self.assertEqual(verification.claim_pending(10), [])
+
+        analyzer = FakeAnalyzer()
+        verification.process(profiles, analyzer)
+        self.assertEqual(analyzer.batches, [2])
+
+        first_result = VerificationProfile.objects.get(user=first)
+        self.assertEqual(first_result.ai_analysis_status, 'completed')
+        self.assertEqual(first_result.detected_age_range, '31-39')
+        self.assertTrue(first_result.v4_gender)
+        self.assertIsNone(first_result.ai_analysis_claimed_at)
+        self.assertFalse(VerificationProfile.objects.get(user=second).v4_gender)
+
+    def test_one_bad_profile_does_not_fail_the_batch(self):
+        broken, fine = self.queue('broken', 'F'), self.queue('fine', 'F')
+        Profile.objects.filter(user=broken).delete()  # record() can't compare genders
+        verification.process(verification.claim_pending(10), FakeAnalyzer())
+
+        self.assertEqual(VerificationProfile.objects.get(user=broken).ai_analysis_status, 'failed')
+        self.assertEqual(VerificationProfile.objects.get(user=fine).ai_analysis_status, 'completed')
+        self.assertFalse(VerificationProfile.objects.filter(ai_analysis_claimed_at__isnull=False).exists())
+
+    def test_aggregate_uses_majority_gender_and_median_age(self):
+        result = verification.aggregate([
+            {'age': 29, 'gender': 'Woman', 'gender_confidence': 0.6},
+            None,
+            {'age': 45, 'gender': 'Man', 'gender_confidence': 0.99},
+            {'age': 31, 'gender': 'Woman', 'gender_confidence': 0.7},
+        ])
+        self.assertEqual(result, {'age': 31, 'gender': 'Woman'})
+        self.assertIsNone(verification.aggregate([None, None]))
+
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class NotificationServiceTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='notified', password='password')
+        self.other = User.objects.create_user(username='other', password='password')
+        self.client.force_authenticate(user=self.user)
+
+    def test_counter_follows_fan_out_and_reads(self):
+        self.assertEqual(notifications.unread_count(self.user.id), 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            created = notifications.notify([self.user.id, self.other.id], 'system', 'Hello')
+            notifications.notify([self.user.id], 'system', 'Again')
+        self.assertEqual(len(created), 2)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(notifications.unread_counts([self.user.id, self.other.id]), {self.user.id: 2, self.other.id: 1})
+
+        mine = Notification.objects.filter(user=self.user).first()
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(f'/api/users/notifications/{mine.id}/mark_read/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.get('/api/users/notifications/unread_count/').data, {'unread_count': 1})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/api/users/notifications/mark_all_read/')
+        self.assertEqual(notifications.unread_count(self.user.id), 0)
+
+    def test_grouped_summary_counts_once_until_read(self):
+        row = {'user_id': self.user.id, 'type': 'message', 'title': 't', 'body': 'b', 'data': {}, 'group_key': 'chat_room:1', 'count': 1}
+        self.assertEqual(notifications.unread_count(self.user.id), 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            notifications.upsert_grouped([row])
+            notifications.upsert_grouped([{**row, 'count': 2}])
+        self.assertEqual(notifications.unread_count(self.user.id), 1)
+        self.assertEqual(Notification.objects.get(user=self.user).count, 3)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            notifications.mark_read(self.user.id, group_key='chat_room:1')
+            notifications.upsert_grouped([row])
+        self.assertEqual(notifications.unread_count(self.user.id), 1)
+        self.assertEqual(Notification.objects.get(user=self.user).count, 1)
+
+    def test_mark_read_of_someone_elses_notification(self):
+        theirs = Notification.objects.create(user=self.other, title='Private')
+        response = self.client.post(f'/api/users/notifications/{theirs.id}/mark_read/')
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(Notification.objects.get(id=theirs.id).is_read)
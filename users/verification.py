@@ -0,0 +1,270 @@
+"""
+Age/gender analysis of verification videos (V4/V5).
+
+A handful of keyframes is sampled from each video (`read_frames`), the
+sharpest frames with the largest faces are kept in memory, and the
+per-frame results are combined by majority vote / median (`aggregate`).
+`FaceAnalyzer` loads the DeepFace age and gender models once and runs them
+on those frames, many at a time, so a long-lived worker
+(`manage.py run_verification_worker`) can analyze several queued videos
+per inference. The django-q task `users.tasks.analyze_verification_video`
+uses the same code path for a single video.
+
+A claim that is never finished (a worker or task killed mid-analysis)
+is retried after VERIFICATION_CLAIM_TIMEOUT seconds by the worker, or by
+the next `run_verification_worker --once` when videos go through django-q.
+"""
+import logging
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from .models import VerificationProfile
+
+logger = logging.getLogger(__name__)
+
+FACE_SIZE = (224, 224)
+STATUS_FIELDS = [
+    'ai_analysis_status', 'ai_analysis_message', 'ai_analysis_claimed_at',
+    'detected_gender', 'detected_age_range', 'v4_gender', 'v5_age',
+]
+
+
+class FaceAnalyzer:
+    """Preloaded DeepFace age/gender models that predict on batches of frames."""
+
+    def __init__(self, detector_backend='opencv'):
+        self.detector_backend = detector_backend
+        self.age_model = None
+        self.gender_model = None
+
+    def load(self):
+        if self.age_model is None:
+            from deepface import DeepFace
+            self.age_model = DeepFace.build_model(model_name='Age', task='facial_attribute').model
+            self.gender_model = DeepFace.build_model(model_name='Gender', task='facial_attribute').model
+        return self
+
+    def extract_face(self, frame):
+        """The largest face in a BGR frame, resized for the attribute models, or None."""
+        from deepface import DeepFace
+        from deepface.modules.preprocessing import resize_image
+        faces = DeepFace.extract_faces(
+            img_path=frame, detector_backend=self.detector_backend, enforce_detection=False, align=True
+        )
+        faces = [f for f in faces if f.get('confidence', 0) > 0]
+        if not faces:
+            return None
+        face = max(faces, key=lambda f: f['facial_area']['w'] * f['facial_area']['h'])
+        # extract_faces returns RGB in [0, 1]; the attribute models expect BGR
+        return resize_image(img=face['face'][:, :, ::-1], target_size=FACE_SIZE)[0]
+
+    def analyze(self, frames):
+        """
+        Predict age and gender for each BGR frame in one model call per
+        attribute. Returns one dict (or None when no face was found) per frame.
+        """
+        import numpy as np
+        self.load()
+        faces = [self.extract_face(frame) for frame in frames]
+        found = [i for i, face in enumerate(faces) if face is not None]
+        results = [None] * len(frames)
+        if not found:
+            return results
+
+        batch = np.stack([faces[i] for i in found])
+        ages = self.age_model.predict(batch, verbose=0) @ np.arange(101)
+        genders = self.gender_model.predict(batch, verbose=0)  # [woman, man]
+        for i, age, gender in zip(found, ages, genders):
+            results[i] = {
+                'age': int(round(float(age))),
+                'gender': 'Man' if gender[1] >= gender[0] else 'Woman',
+                'gender_confidence': float(max(gender)),
+            }
+        return results
+
+
+_analyzer = None
+
+
+def get_analyzer():
+    """The process-wide analyzer, loaded on first use."""
+    global _analyzer
+    if _analyzer is None:
+        _analyzer = FaceAnalyzer().load()
+    return _analyzer
+
+
+def read_frames(path, keyframes=None, best=None):
+    """
+    Sample `keyframes` evenly spaced frames from the video at `path` by
+    seeking (the rest of the video is never decoded) and return the `best`
+    of them, as BGR arrays, ranked by face size and sharpness.
+    """
+    import heapq
+    import cv2
+    import numpy as np
+    keyframes = keyframes or getattr(settings, 'VERIFICATION_SAMPLE_KEYFRAMES', 12)
+    best = best or getattr(settings, 'VERIFICATION_SAMPLE_BEST', 4)
+
+    cap = cv2.VideoCapture(path)
+    try:
+        total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
+        if total > 0:
+            # Skip the very first and last frames, which are often black or blurred
+            positions = np.unique(np.linspace(0, total - 1, keyframes + 2)[1:-1].astype(int))
+        else:
+            positions = [None] * keyframes  # unknown length: take consecutive frames
+
+        kept = []  # min-heap of (score, n, frame), at most `best` entries
+        for n, position in enumerate(positions):
+            if position is not None:
+                cap.set(cv2.CAP_PROP_POS_FRAMES, int(position))
+            success, frame = cap.read()
+            if not success:
+                continue
+            entry = (score_frame(frame), n, frame)
+            if len(kept) < best:
+                heapq.heappush(kept, entry)
+            elif entry[0] > kept[0][0]:
+                heapq.heapreplace(kept, entry)
+        return [frame for _, _, frame in sorted(kept, reverse=True)]
+    finally:
+        cap.release()
+
+
+_face_cascade = None
+
+
+def score_frame(frame):
+    """
+    Higher for frames with a large face in sharp focus. Uses OpenCV's Haar
+    cascade on a downscaled copy, which is far cheaper than the DeepFace
+    detector that runs on the frames we keep.
+    """
+    global _face_cascade
+    import cv2
+    if _face_cascade is None:
+        _face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+
+    height, width = frame.shape[:2]
+    scale = 320 / max(width, 1)
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    if scale < 1:
+        gray = cv2.resize(gray, (320, max(int(height * scale), 1)), interpolation=cv2.INTER_AREA)
+
+    sharpness = min(cv2.Laplacian(gray, cv2.CV_64F).var() / 500.0, 1.0)
+    faces = _face_cascade.detectMultiScale(gray, scaleFactor=1.2, minNeighbors=4, minSize=(24, 24))
+    if len(faces) == 0:
+        return 0.01 * sharpness  # keep only if nothing better turns up
+    face_fraction = max(w * h for _, _, w, h in faces) / float(gray.shape[0] * gray.shape[1])
+    return (face_fraction ** 0.5) * (0.5 + 0.5 * sharpness)
+
+
+def aggregate(results):
+    """
+    Combine per-frame results: the gender most frames agree on (ties go
+    to the higher total confidence) and the median age.
+    """
+    import statistics
+    results = [r for r in results if r]
+    if not results:
+        return None
+    votes = {}
+    for r in results:
+        count, confidence = votes.get(r['gender'], (0, 0.0))
+        votes[r['gender']] = (count + 1, confidence + r.get('gender_confidence', 0.0))
+    gender = max(votes, key=votes.get)
+    age = int(round(statistics.median(r['age'] for r in results)))
+    return {'age': age, 'gender': gender}
+
+
+def claimable(now):
+    """Queued analyses that are unclaimed, or whose claim is older than VERIFICATION_CLAIM_TIMEOUT."""
+    stale = now - timedelta(seconds=getattr(settings, 'VERIFICATION_CLAIM_TIMEOUT', 600))
+    return VerificationProfile.objects.filter(ai_analysis_status='processing').filter(
+        Q(ai_analysis_claimed_at__isnull=True) | Q(ai_analysis_claimed_at__lt=stale)
+    )
+
+
+def claim_pending(limit):
+    """Mark up to `limit` claimable analyses as taken by this worker and return them."""
+    now = timezone.now()
+    with transaction.atomic():
+        ids = list(
+            claimable(now)
+            .select_for_update(skip_locked=True)
+            .order_by('id')
+            .values_list('id', flat=True)[:limit]
+        )
+        VerificationProfile.objects.filter(id__in=ids).update(
+            ai_analysis_claimed_at=now, ai_analysis_message='Analyzing face (age and gender)...'
+        )
+    return list(VerificationProfile.objects.filter(id__in=ids).select_related('user__profile'))
+
+
+def process(profiles, analyzer):
+    """Analyze the videos of `profiles` with one batched inference and record the results."""
+    frames, owners = [], []
+    for profile in profiles:
+        if not profile.verification_video:
+            fail(profile, 'No video file found.')
+            continue
+        try:
+            video_frames = read_frames(profile.verification_video.path)
+        except Exception as e:
+            fail(profile, f"AI analysis error: {e}")
+            continue
+        if not video_frames:
+            fail(profile, 'Failed to read video or extract frame.')
+            continue
+        frames.extend(video_frames)
+        owners.extend([profile] * len(video_frames))
+
+    if not frames:
+        return
+    try:
+        results = analyzer.analyze(frames)
+    except Exception as e:
+        logger.exception('Batch verification analysis failed')
+        for profile in dict.fromkeys(owners):
+            fail(profile, f"AI analysis error: {e}")
+        return
+
+    per_profile = {}
+    for profile, result in zip(owners, results):
+        per_profile.setdefault(profile, []).append(result)
+    for profile, profile_results in per_profile.items():
+        try:
+            record(profile, aggregate(profile_results))
+        except Exception as e:
+            logger.exception(f"Could not record verification analysis for profile {profile.id}")
+            fail(profile, f"AI analysis error: {e}")
+
+
+def record(profile, result):
+    if result is None:
+        fail(profile, 'No face detected in the video.')
+        return
+    detected_gender, detected_age = result['gender'], result['age']
+    profile.detected_gender = detected_gender
+    profile.detected_age_range = f"{detected_age}-{(detected_age//10)*10+9}" # Simple range
+
+    # Map DeepFace gender ('Man', 'Woman') to Profile gender ('M', 'F')
+    user_gender = profile.user.profile.gender
+    profile.v4_gender = (detected_gender == 'Man' and user_gender == 'M') or \
+        (detected_gender == 'Woman' and user_gender == 'F')
+    profile.v5_age = True # For now, we just mark age as verified if we detected it.
+
+    profile.ai_analysis_status = 'completed'
+    profile.ai_analysis_message = 'AI analysis finished successfully.'
+    profile.ai_analysis_claimed_at = None
+    profile.save(update_fields=STATUS_FIELDS)
+
+
+def fail(profile, message):
+    profile.ai_analysis_status = 'failed'
+    profile.ai_analysis_message = message[:255]
+    profile.ai_analysis_claimed_at = None
+    profile.save(update_fields=['ai_analysis_status', 'ai_analysis_message', 'ai_analysis_claimed_at'])
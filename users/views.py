@@ -1,12 +1,16 @@
 from django.contrib.auth.models import User
+from django.http import Http404
 from rest_framework import viewsets, permissions, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from .serializers import UserSerializer, VerificationProfileSerializer, NotificationSerializer
 from .models import VerificationProfile, Notification
+from . import geoip, notifications
 import random
 import string
 from django_q.tasks import async_task
+from django.conf import settings
+from django.db import transaction
 
 class UserViewSet(viewsets.ModelViewSet):
     """
@@ -91,6 +95,11 @@ class VerificationViewSet(viewsets.GenericViewSet):
         
         return Response({'error': 'Country code required'}, status=status.HTTP_400_BAD_REQUEST)
 
+    @action(detail=False, methods=['get'], permission_classes=[permissions.IsAdminUser])
+    def geoip_stats(self, request):
+        """Hit/miss counters of this worker's GeoIP and verification-flag caches"""
+        return Response(geoip.stats())
+
     @action(detail=False, methods=['post'])
     def upload_video(self, request):
         """V4/V5: Upload video and trigger AI analysis"""
@@ -101,10 +110,12 @@ class VerificationViewSet(viewsets.GenericViewSet):
         
         profile.verification_video = video
         profile.ai_analysis_status = 'processing'
+        profile.ai_analysis_claimed_at = None
         profile.save()
         
-        # Trigger background task
-        async_task('users.tasks.analyze_verification_video', profile.id)
+        # Trigger background task, unless the dedicated worker is polling for it
+        if not settings.VERIFICATION_ANALYSIS_WORKER:
+            transaction.on_commit(lambda: async_task('users.tasks.analyze_verification_video', profile.id))
         
         return Response({'message': 'Video uploaded. AI analysis started.', 'status': 'processing'})
     
@@ -159,14 +170,35 @@ class NotificationViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         return Notification.objects.filter(user=self.request.user)
 
+    # Writes through the API bypass users.notifications, so recount the badge
+    def perform_create(self, serializer):
+        serializer.save()
+        notifications.invalidate_unread([self.request.user.id])
+
+    def perform_update(self, serializer):
+        serializer.save()
+        notifications.invalidate_unread([self.request.user.id])
+
+    def perform_destroy(self, instance):
+        instance.delete()
+        notifications.invalidate_unread([self.request.user.id])
+
+    @action(detail=False, methods=['get'])
+    def unread_count(self, request):
+        """The badge number, from the cached counter."""
+        return Response({'unread_count': notifications.unread_count(request.user.id)})
+
     @action(detail=False, methods=['post'])
     def mark_all_read(self, request):
-        self.get_queryset().update(is_read=True)
+        notifications.mark_read(request.user.id)
         return Response({'status': 'ok'})
     
     @action(detail=True, methods=['post'])
     def mark_read(self, request, pk=None):
-        notif = self.get_object()
-        notif.is_read = True
-        notif.save()
+        try:
+            updated = notifications.mark_read(request.user.id, pk=int(pk))
+        except ValueError:
+            raise Http404
+        if not updated:
+            self.get_object()  # 404 unless it exists (and was already read)
         return Response({'status': 'ok'})
@@ -1,8 +1,7 @@
 
 from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
-from django.contrib.auth.models import User
-from .models import Vehicle, SellerProfile, BuyerProfile, SellerType, VehicleImage
+from .models import Vehicle, SellerProfile, SellerType, VehicleImage
 from business.models import BusinessProfile
 import os
 
@@ -32,11 +31,7 @@ def ensure_seller_profile_and_seller_type(sender, instance, created, **kwargs):
             instance.save(update_fields=['seller_type'])
 
 
-@receiver(post_save, sender=User)
-def create_buyer_profile(sender, instance, created, **kwargs):
-    if created:
-        # Ensure BuyerProfile is created for all new users
-        BuyerProfile.objects.get_or_create(user=instance)
+# BuyerProfile rows for new users are created by users.provisioning
 
 @receiver(post_save, sender=BusinessProfile)
 def create_seller_profile(sender, instance, created, **kwargs):